@@ -54,6 +54,8 @@ class handler(BaseHTTPRequestHandler):
                         "answer": log.answer,
                         "model_used": log.model_used,
                         "response_time_ms": log.response_time_ms,
+                        "user_mode": log.user_mode,
+                        "total_tokens": log.total_tokens,
                         "created_at": str(log.created_at),
                         "ip_address": log.ip_address,
                         "user_agent": log.user_agent
@@ -61,6 +63,12 @@ class handler(BaseHTTPRequestHandler):
                     for log in logs
                 ]
             
+            elif '/api/admin/stats/usage' in self.path:
+                # Token usage and estimated cost per day, user mode and model
+                from backend.services.log_service import log_service
+                days = int(query_params.get('days', [30])[0])
+                response = log_service.get_usage_stats(db, days=days)
+            
             elif '/api/admin/stats/overview' in self.path:
                 # Get overview statistics
                 total_queries = db.query(func.count(ChatLog.id)).scalar() or 0
@@ -23,6 +23,7 @@ class handler(BaseHTTPRequestHandler):
             
             # Import services
             from backend.services.model_router import model_service
+            from backend.services.admission_controller import AdmissionRejected, priority_for
             
             # Extract request data
             user_message = data.get('message', '')
@@ -37,11 +38,47 @@ class handler(BaseHTTPRequestHandler):
             conversation_history = data.get('conversation_history', [])
             print(f"[MEMORY] Received {len(conversation_history)} messages from frontend")
             
-            # Validate and clean conversation history
+            full_history = list(conversation_history)
+            
+            # Replace older turns with the session's rolling summary (recent turns stay verbatim)
+            conversation_summary = None
             if conversation_history:
-                # Keep only last 20 messages to avoid token limits
-                conversation_history = conversation_history[-20:]
-                print(f"[MEMORY] Using {len(conversation_history)} messages for AI context")
+                memory_db = None
+                try:
+                    from backend.db.database import SessionLocal
+                    from backend.services.memory_service import memory_service
+                    memory_db = SessionLocal()
+                    conversation_summary, conversation_history = memory_service.build_prompt_history(
+                        memory_db, session_id, conversation_history
+                    )
+                except Exception as memory_error:
+                    print(f"[MEMORY] Summary unavailable: {memory_error}")
+                    # Keep only last 20 messages to avoid token limits
+                    conversation_history = conversation_history[-20:]
+                finally:
+                    if memory_db:
+                        memory_db.close()
+                print(f"[MEMORY] Using {len(conversation_history)} messages for AI context"
+                      f"{' + summary' if conversation_summary else ''}")
+            
+            # Clear-cut questions about a curated high-quality interaction skip the LLM
+            fast_path = None
+            fast_path_db = None
+            try:
+                from backend.db.database import SessionLocal
+                from backend.services.interaction_service import interaction_service, FAST_PATH_MODES
+                if user_mode in FAST_PATH_MODES:
+                    fast_path_db = SessionLocal()
+                    match = interaction_service.find_high_confidence_match(fast_path_db, user_message)
+                    if match:
+                        fast_path = interaction_service.build_fast_path_answer(fast_path_db, match)
+                        print(f"[FAST PATH] Answering from interaction {match.id} ({match.title})")
+            except Exception as fast_path_error:
+                print(f"[FAST PATH] Skipped: {fast_path_error}")
+            finally:
+                if fast_path_db:
+                    fast_path_db.close()
+            model_used = "evidence-fast-path" if fast_path else "groq/compound+free-apis"
             
             # Generate response using Groq with persona-based prompts
             # Run async function in sync context
@@ -50,37 +87,85 @@ class handler(BaseHTTPRequestHandler):
             
             start_time = datetime.now()
             
+            # Fold turns that left the recent window on earlier turns into the session
+            # summary while this answer is generated (nothing may outlive the request)
+            summary_task = None
+            try:
+                from backend.services.memory_service import memory_service
+                summary_task = memory_service.start_update(loop, session_id, full_history)
+            except Exception as memory_error:
+                print(f"[MEMORY] Summary update skipped: {memory_error}")
+            
             # Generate persona-specific response with conversation history
-            # Mode-specific token allocation (reduced to prevent timeouts)
-            token_limits = {
-                'patient': 1400,
-                'doctor': 1500,
-                'researcher': 1600
-            }
-            max_tokens = token_limits.get(user_mode, 1400)
+            # Mode-specific token allocation learned from observed answer lengths
+            from backend.services.token_budget import token_budget
+            if not token_budget.seeded:
+                budget_db = None
+                try:
+                    from backend.db.database import SessionLocal
+                    budget_db = SessionLocal()
+                    token_budget.seed_from_db(budget_db)
+                except Exception as budget_error:
+                    print(f"[TOKENS] Seeding skipped: {budget_error}")
+                finally:
+                    if budget_db:
+                        budget_db.close()
+            max_tokens = token_budget.max_tokens_for(user_mode)
             
             # Track if this is the first message in a session
-            is_first_message = len(conversation_history) == 0
+            is_first_message = len(full_history) == 0
             
             # Variables for tracking request status
             ai_response = None
             request_status = 'success'
             error_details = None
             
+            # Token usage of every LLM call made for this answer
+            from backend.services.usage_tracker import track_usage
+            usage = None
+            
             try:
-                ai_response = loop.run_until_complete(
-                    model_service.generate_response(
-                        query=user_message,
-                        user_mode=user_mode,
-                        max_tokens=max_tokens,
-                        temperature=0.7,
-                        conversation_history=conversation_history  # Pass history for context
-                    )
-                )
+                if fast_path:
+                    ai_response = fast_path[0]
+                else:
+                    with track_usage() as usage:
+                        ai_response = loop.run_until_complete(
+                            model_service.generate_response(
+                                query=user_message,
+                                user_mode=user_mode,
+                                max_tokens=max_tokens,
+                                temperature=0.7,
+                                conversation_history=conversation_history,  # Pass history for context
+                                conversation_summary=conversation_summary,
+                                priority=priority_for(user_mode, user_id)
+                            )
+                        )
+            except AdmissionRejected as shed:
+                # LLM queue saturated - fail fast instead of waiting for a 429
+                from backend.services.http_pool import close_async_clients
+                if summary_task is not None:
+                    loop.run_until_complete(memory_service.finish_update(summary_task, cancel=True))
+                loop.run_until_complete(close_async_clients())
+                loop.close()
+                print(f"[ADMISSION] Shed request for session {session_id}: {shed.reason}")
+                self.send_response(503)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Retry-After', str(shed.retry_after))
+                self.send_header('Access-Control-Allow-Origin', '*')
+                self.end_headers()
+                self.wfile.write(json.dumps({
+                    "error": "overloaded",
+                    "answer": "The service is busy right now. Please try again in a few seconds.",
+                    "session_id": session_id,
+                    "model_used": "none",
+                    "response_time_ms": int((datetime.now() - start_time).total_seconds() * 1000),
+                    "retry_after": shed.retry_after
+                }).encode())
+                return
             except Exception as ai_error:
                 # Track the error but we'll still save to database
                 error_str = str(ai_error)
-                if '429' in error_str or 'rate limit' in error_str.lower():
+                if getattr(ai_error, 'status_code', None) == 429 or '429' in error_str or 'rate limit' in error_str.lower():
                     request_status = 'rate_limited'
                     ai_response = "Sorry, I've reached my rate limit. Please try again in a moment."
                 else:
@@ -91,17 +176,33 @@ class handler(BaseHTTPRequestHandler):
             
             # No consumer_summary needed - using three-tier persona system
             
+            if usage is not None:
+                token_budget.observe_usage(user_mode, usage)
+            
             end_time = datetime.now()
             response_time_ms = int((end_time - start_time).total_seconds() * 1000)
             
+            if summary_task is not None:
+                loop.run_until_complete(memory_service.finish_update(summary_task))
+            
+            # Pooled HTTP clients are bound to this loop
+            from backend.services.http_pool import close_async_clients
+            loop.run_until_complete(close_async_clients())
             loop.close()
             
+            # Check cited PMIDs/DOIs while the session is being saved
+            from backend.services.reference_verifier import reference_verifier
+            ref_check = reference_verifier.submit(ai_response) \
+                if request_status == 'success' and not fast_path else None
+            reference_check = None
+            
             # Save to database
             db = None
             try:
                 from backend.db.database import SessionLocal
                 from backend.db.models import ChatLog, Session as SessionModel
                 from backend.services.geo_service import geo_service
+                from backend.services.log_service import log_service
                 from sqlalchemy import text
                 
                 print(f"[SAVE] Attempting to save chat to database for session: {session_id}")
@@ -166,6 +267,9 @@ class handler(BaseHTTPRequestHandler):
                         {"sid": session_id}
                     )
                 
+                ai_response, reference_check = reference_verifier.result(ref_check, ai_response)
+                ref_check = None
+                
                 # Save chat log
                 # Extract references from response
                 import re
@@ -188,13 +292,20 @@ class handler(BaseHTTPRequestHandler):
                     answer=ai_response,
                     status=request_status,  # success, rate_limited, error
                     error_message=error_details,  # Error details if failed
-                    model_used="groq/compound+free-apis",
+                    model_used=usage.model if usage and usage.model else model_used,
                     response_time_ms=response_time_ms,
                     ip_address=client_ip,
                     user_agent=user_agent,
+                    user_mode=user_mode,
+                    prompt_tokens=usage.prompt_tokens if usage and usage.has_usage else None,
+                    completion_tokens=usage.completion_tokens if usage and usage.has_usage else None,
+                    total_tokens=usage.total_tokens if usage and usage.has_usage else None,
                     extra_metadata={
                         "user_mode": user_mode,
                         "references": references,
+                        "provenance": fast_path[1] if fast_path else None,
+                        "reference_check": reference_check,
+                        "structured_repair": usage.output_repairs if usage and usage.output_repairs else None,
                         "geolocation": {
                             "city": geo_data.get("city") if geo_data else None,
                             "region": geo_data.get("region") if geo_data else None,
@@ -207,10 +318,14 @@ class handler(BaseHTTPRequestHandler):
                 print(f"[SAVE] ChatLog object created, adding to session")
                 db.add(chat_log)
                 db.flush()  # Flush to assign ID
+                log_service.add_llm_calls(db, chat_log.id, usage)
                 print(f"[SAVE] Flushed, now committing to database")
                 db.commit()
                 print(f"[SAVE] ✅ Successfully saved chat log ID {chat_log.id} for session {session_id}")
                 db.close()
+                
+                if fast_path:
+                    interaction_service.schedule_enrichment(chat_log.id, user_message, user_mode, ai_response)
             except Exception as db_error:
                 print(f"[SAVE ERROR] Database save failed: {db_error}")
                 print(f"[SAVE ERROR] Error type: {type(db_error).__name__}")
@@ -221,16 +336,20 @@ class handler(BaseHTTPRequestHandler):
                     db.close()
                 # Continue even if database fails
             
+            if ref_check is not None:
+                # The save failed before the check was collected
+                ai_response, reference_check = reference_verifier.result(ref_check, ai_response)
+            
             # Build response
             response = {
                 "answer": ai_response,
                 "consumer_summary": None,  # No longer using dual-view system
                 "session_id": session_id,
-                "model_used": "groq/compound+free-apis",
+                "model_used": model_used,
                 "response_time_ms": response_time_ms,
                 "sources": [],
-                "evidence": None,
-                "provenance": None
+                "evidence": [fast_path[2]] if fast_path else None,
+                "provenance": fast_path[1] if fast_path else None
             }
             
             self.send_response(200)
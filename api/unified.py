@@ -16,19 +16,28 @@ from backend.db.database import get_db, engine, Base
 from backend.db.models import ChatLog, Session as SessionModel, Interaction
 from backend.schemas import ChatMessage, ChatResponse, ChatLogResponse
 from backend.services.model_router import model_service
+from backend.services.admission_controller import admission_controller, AdmissionRejected, priority_for
 from backend.services.log_service import log_service
+from backend.services.usage_tracker import track_usage
+from backend.services.token_budget import token_budget
+from backend.services.reference_verifier import reference_verifier
+from backend.services.rag_service import rag_service
 from backend.services.geo_service import geo_service
-from backend.services.interaction_service import interaction_service, build_consumer_summary_from_evidence
+from backend.services.interaction_service import interaction_service, build_consumer_summary_from_evidence, FAST_PATH_MODES
 from backend.services.data_aggregator_service import DrugDataAggregator, extract_drug_names
 from backend.scripts.fetch_references import fetch_references_for_interactions
 from sqlalchemy import func, desc
 import uuid
 import time
 import json
+import asyncio
 
 # Initialize database tables
 Base.metadata.create_all(bind=engine)
 
+# Warm RAG off the cold-start path; requests are served without it until ready
+rag_service.start_background_load()
+
 app = FastAPI(title="Kandih ToxWiki API", version="2.0")
 
 # CORS configuration
@@ -61,6 +70,7 @@ async def health_check():
         "status": "healthy",
         "database": db_status,
         "model_server": "deepseek" if model_service.enabled else "disabled",
+        "rag": rag_service.status(),
         "timestamp": time.time()
     }
 
@@ -81,6 +91,31 @@ async def chat(message: ChatMessage, request: Request, db: Session = Depends(get
     
     try:
         user_mode = getattr(message, 'user_mode', 'patient') or 'patient'
+        
+        # Clear-cut questions about a curated high-quality interaction skip the LLM
+        match = interaction_service.find_high_confidence_match(db, message.message) \
+            if user_mode in FAST_PATH_MODES else None
+        if match:
+            answer, provenance, evidence = interaction_service.build_fast_path_answer(db, match)
+            response_time_ms = int((time.time() - start_time) * 1000)
+            chat_log = log_service.create_chat_log(
+                db=db, session_id=session_id, question=message.message,
+                answer=answer, model_used="evidence-fast-path",
+                response_time_ms=response_time_ms, ip_address=client_ip, user_agent=user_agent,
+                extra_metadata={"geo_data": geo_data, "evidence": [evidence], "provenance": provenance},
+                user_mode=user_mode
+            )
+            interaction_service.schedule_enrichment(chat_log.id, message.message, user_mode, answer)
+            return ChatResponse(
+                answer=answer, session_id=session_id,
+                model_used="evidence-fast-path", response_time_ms=response_time_ms,
+                consumer_summary=None, sources=None, evidence=[evidence],
+                provenance=provenance
+            )
+        
+        # Indexed-literature retrieval overlaps the drug API fan-out
+        rag_task = asyncio.create_task(rag_service.retrieve_context_async(message.message))
+        
         aggregator = DrugDataAggregator(db)
         drug_names = extract_drug_names(message.message)
         
@@ -102,48 +137,61 @@ Literature: {json.dumps(drug_data.get('literature', []), indent=2)}
             if context_parts:
                 external_context = "\n\n=== COMPREHENSIVE DRUG DATABASE ===\n" + "\n---\n".join(context_parts)
         
-        answer = await model_service.generate_response(
-            question=message.message,
-            context=external_context,
-            user_mode=user_mode
-        )
+        rag_context = await rag_task
+        if rag_context:
+            external_context = (external_context or "") + "\n\n=== INDEXED TOXICOLOGY LITERATURE ===\n" + rag_context
+        
+        token_budget.seed_from_db(db)
+        max_tokens = token_budget.max_tokens_for(user_mode)
+        with track_usage() as usage:
+            answer = await model_service.generate_response(
+                question=message.message,
+                context=external_context,
+                user_mode=user_mode,
+                max_tokens=max_tokens,
+                priority=priority_for(user_mode, message.user_id)
+            )
+        token_budget.observe_usage(user_mode, usage)
+        model_used = usage.model or model_service.model_name
 
         if not answer or not answer.strip():
             raise RuntimeError("model-unavailable")
         
-        response_time_ms = int((time.time() - start_time) * 1000)
+        # Check cited PMIDs/DOIs while evidence is gathered for the log
+        ref_check = reference_verifier.submit(answer)
         metadata = {"geo_data": geo_data}
         
         evidence = interaction_service.search_interactions_in_text(db, message.message)
-        evidence_serializable = []
-        for e in evidence:
-            refs = [{"id": r.id, "title": r.title, "url": r.url, "excerpt": r.excerpt} 
-                   for r in getattr(e, 'references', []) or []]
-            evidence_serializable.append({
-                "id": e.id, "drug_name": e.drug_name, "title": e.title,
-                "summary": e.summary, "mechanism": e.mechanism,
-                "food_groups": e.food_groups, "recommended_actions": e.recommended_actions,
-                "evidence_quality": e.evidence_quality, "references": refs
-            })
+        evidence_serializable = [interaction_service.to_evidence_dict(e) for e in evidence]
         
         metadata["evidence"] = evidence_serializable
+        answer, metadata["reference_check"] = await reference_verifier.result_async(ref_check, answer)
+        response_time_ms = int((time.time() - start_time) * 1000)
         
         log_service.create_chat_log(
             db=db, session_id=session_id, question=message.message,
-            answer=answer, model_used=model_service.model_name,
+            answer=answer, model_used=model_used,
             response_time_ms=response_time_ms, ip_address=client_ip,
-            user_agent=user_agent, extra_metadata=metadata
+            user_agent=user_agent, extra_metadata=metadata,
+            user_mode=user_mode, usage=usage
         )
         
         return ChatResponse(
             answer=answer, session_id=session_id,
-            model_used=model_service.model_name,
+            model_used=model_used,
             response_time_ms=response_time_ms,
             consumer_summary=None,  # No longer using dual-view system
             sources=None, evidence=evidence_serializable,
             provenance=None
         )
         
+    except AdmissionRejected as shed:
+        # LLM queue saturated - fail fast so the client can back off
+        raise HTTPException(
+            status_code=503,
+            detail="The service is busy right now. Please try again in a few seconds.",
+            headers={"Retry-After": str(shed.retry_after)}
+        )
     except Exception as e:
         response_time_ms = int((time.time() - start_time) * 1000)
         error_msg = str(e)
@@ -163,7 +211,9 @@ Literature: {json.dumps(drug_data.get('literature', []), indent=2)}
         log_service.create_chat_log(
             db=db, session_id=session_id, question=message.message,
             answer=answer, model_used="fallback", response_time_ms=response_time_ms,
-            ip_address=client_ip, user_agent=user_agent, extra_metadata=metadata
+            ip_address=client_ip, user_agent=user_agent, extra_metadata=metadata,
+            user_mode=user_mode if 'user_mode' in locals() else None,
+            usage=usage if 'usage' in locals() else None
         )
         
         return ChatResponse(
@@ -222,6 +272,11 @@ async def get_stats_overview(db: Session = Depends(get_db)):
         "daily_queries": [{"date": str(date), "count": count} for date, count in daily_queries]
     }
 
+@app.get("/api/admin/stats/usage")
+async def get_usage_stats(days: int = Query(30, ge=1, le=365), db: Session = Depends(get_db)):
+    """Token usage and estimated cost per day, user mode and model"""
+    return log_service.get_usage_stats(db, days=days)
+
 @app.get("/api/admin/sessions")
 async def get_all_sessions(limit: int = Query(50, ge=1, le=500), db: Session = Depends(get_db)):
     """Get all sessions with message counts and metadata"""
@@ -296,5 +351,10 @@ async def list_interactions(limit: int = Query(100, ge=1, le=1000), db: Session
         })
     return result
 
+@app.get("/api/admin/llm/metrics")
+async def get_llm_metrics():
+    """LLM admission queue depth / wait-time histograms and token budgets for this instance"""
+    return {**admission_controller.metrics(), "token_budget": token_budget.snapshot()}
+
 # Export for Vercel
 handler = app
@@ -0,0 +1,5 @@
+-- Add rolling conversation summary memory to sessions
+-- conversation_summary holds a compact summary of the turns that fell out of the recent window,
+-- summarized_message_count records how many history messages that summary already covers
+ALTER TABLE sessions ADD COLUMN IF NOT EXISTS conversation_summary TEXT;
+ALTER TABLE sessions ADD COLUMN IF NOT EXISTS summarized_message_count INTEGER DEFAULT 0;
@@ -0,0 +1,8 @@
+-- Add per-request token usage to chat logs
+-- Token counts are summed over every LLM call made for the answer (NULL when no LLM was called),
+-- user_mode is promoted out of extra_metadata so usage can be grouped by persona
+ALTER TABLE chat_logs ADD COLUMN IF NOT EXISTS user_mode VARCHAR(20);
+ALTER TABLE chat_logs ADD COLUMN IF NOT EXISTS prompt_tokens INTEGER;
+ALTER TABLE chat_logs ADD COLUMN IF NOT EXISTS completion_tokens INTEGER;
+ALTER TABLE chat_logs ADD COLUMN IF NOT EXISTS total_tokens INTEGER;
+CREATE INDEX IF NOT EXISTS idx_chat_logs_user_mode ON chat_logs(user_mode);
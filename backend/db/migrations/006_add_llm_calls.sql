@@ -0,0 +1,17 @@
+-- Record token usage per provider call
+-- chat_logs token columns are summed over every call, but a request that failed over or was
+-- hedged across Groq and DeepSeek mixes models; llm_calls keeps each call's model so cost
+-- can be priced at the rate of the model that actually served it
+CREATE TABLE IF NOT EXISTS llm_calls (
+    id SERIAL PRIMARY KEY,
+    chat_log_id INTEGER NOT NULL REFERENCES chat_logs(id) ON DELETE CASCADE,
+    provider VARCHAR(20),
+    model VARCHAR(50),
+    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+    completion_tokens INTEGER NOT NULL DEFAULT 0,
+    total_tokens INTEGER NOT NULL DEFAULT 0,
+    finish_reason VARCHAR(20),
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+CREATE INDEX IF NOT EXISTS idx_llm_calls_chat_log_id ON llm_calls(chat_log_id);
+CREATE INDEX IF NOT EXISTS idx_llm_calls_model ON llm_calls(model);
@@ -20,6 +20,24 @@ class ChatLog(Base):
     user_agent = Column(Text)  # Browser/client info
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     extra_metadata = Column(JSON)  # Stores geolocation, device info, etc.
+    user_mode = Column(String(20), nullable=True, index=True)  # patient, doctor, researcher
+    prompt_tokens = Column(Integer, nullable=True)  # Summed over every LLM call for this answer
+    completion_tokens = Column(Integer, nullable=True)
+    total_tokens = Column(Integer, nullable=True)
+
+class LLMCall(Base):
+    """One provider completion made while serving a chat log (failovers and hedges included)"""
+    __tablename__ = "llm_calls"
+
+    id = Column(Integer, primary_key=True, index=True)
+    chat_log_id = Column(Integer, ForeignKey('chat_logs.id', ondelete='CASCADE'), nullable=False, index=True)
+    provider = Column(String(20))  # groq, deepseek
+    model = Column(String(50), index=True)
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    completion_tokens = Column(Integer, nullable=False, default=0)
+    total_tokens = Column(Integer, nullable=False, default=0)
+    finish_reason = Column(String(20), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
 
 class Session(Base):
     __tablename__ = "sessions"
@@ -39,6 +57,8 @@ class Session(Base):
     started_at = Column(DateTime(timezone=True), server_default=func.now())
     last_active = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     extra_metadata = Column(JSON)  # Additional device/browser fingerprinting data
+    conversation_summary = Column(Text, nullable=True)  # Rolling summary of turns outside the recent window
+    summarized_message_count = Column(Integer, nullable=True)  # Number of history messages folded into the summary
 
 
 class Interaction(Base):
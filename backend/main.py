@@ -40,6 +40,9 @@ except Exception as e:
 from .routers import chat, admin
 from .schemas import HealthResponse
 from .services.model_router import model_service
+from .services.admission_controller import admission_controller
+from .services.token_budget import token_budget
+from .services.rag_service import rag_service
 from .services.interaction_service import seed_default_interactions
 
 app = FastAPI(
@@ -98,13 +101,16 @@ async def health_check():
         if not model_service:
             model_status_str = "unhealthy: model service not initialized"
         elif not hasattr(model_service, 'api_key') or not model_service.api_key:
-            model_status_str = "unhealthy: GROQ_API_KEY not configured"
+            model_status_str = "unhealthy: no model API key configured (GROQ_API_KEY / DEEPSEEK_API_KEY)"
         else:
+            # Cached probe + passive stats - no model call on the request path
             model_status = await model_service.check_health()
             if model_status.get("status") == "healthy":
                 model_status_str = "healthy"
+            elif model_status.get("status") == "unknown":
+                model_status_str = "unknown: health probe pending"
             else:
-                model_status_str = "unhealthy: Groq API unreachable"
+                model_status_str = f"unhealthy: {str(model_status.get('error', 'model API unreachable'))[:100]}"
     except Exception as e:
         model_status_str = f"unhealthy: {str(e)[:100]}"
     
@@ -114,11 +120,23 @@ async def health_check():
         status=overall_status,
         database=db_status,
         model_server=model_status_str,
-        timestamp=datetime.utcnow()
+        timestamp=datetime.utcnow(),
+        rag=rag_service.status()
     )
 
+@app.get("/metrics/llm")
+async def llm_metrics():
+    """
+    LLM admission control metrics: queue depth and wait-time histograms,
+    plus the adaptive max_tokens per user mode
+    """
+    return {**admission_controller.metrics(), "token_budget": token_budget.snapshot()}
+
 @app.on_event("startup")
 async def startup_event():
+    # Embedding model + vector store load in the background; chat works without RAG meanwhile
+    rag_service.start_background_load()
+    
     # Skip verbose logging in serverless environment
     if is_vercel:
         return
@@ -129,18 +147,18 @@ async def startup_event():
     # Print the effective DB URL detected by the app (may differ from .env)
     print(f"📊 Database: {DB_URL[:200]}...")
     
-    # Using Groq
-    print(f"🤖 Model Provider: Groq API")
+    # Using the model router (Groq primary, DeepSeek failover)
+    print(f"🤖 Model Providers: {', '.join(model_service.default_order)}")
     print(f"🔬 Model: {os.getenv('GROQ_MODEL', 'llama-3.3-70b-versatile')}")
     
-    # Check model service health
-    health_result = await model_service.check_health()
-    if health_result.get("status") == "healthy":
-        print("✓ Groq service is reachable")
-    else:
-        print("⚠ WARNING: Groq service is not reachable")
-        print("  Check your GROQ_API_KEY in environment variables")
-        print(f"  Error: {health_result.get('error', 'Unknown')}")
+    # Check model service health (one models-list probe, seeds the health cache)
+    health_result = await model_service.check_health(force_refresh=True)
+    for name, provider_health in health_result.get("providers", {}).items():
+        if provider_health.get("status") == "healthy":
+            print(f"✓ {name} service is reachable")
+        else:
+            print(f"⚠ WARNING: {name} service is not reachable")
+            print(f"  Error: {provider_health.get('error', 'Unknown')}")
     
     print("=" * 60)
     print("🚀 API is ready at http://localhost:8000")
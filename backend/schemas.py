@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Any, Dict, Optional, List
 from datetime import datetime
 from pydantic import AnyHttpUrl
 from pydantic import BaseModel
@@ -38,6 +38,10 @@ class ChatLogResponse(BaseModel):
     user_agent: Optional[str] = None
     created_at: datetime
     extra_metadata: Optional[dict] = None
+    user_mode: Optional[str] = None
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    total_tokens: Optional[int] = None
 
     model_config = {"from_attributes": True, "protected_namespaces": ()}
 
@@ -79,5 +83,6 @@ class HealthResponse(BaseModel):
     database: str
     model_server: str
     timestamp: datetime
+    rag: Optional[Dict[str, Any]] = None
     
     model_config = {"protected_namespaces": ()}
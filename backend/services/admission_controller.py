@@ -0,0 +1,234 @@
+"""
+LLM Admission Controller
+Bounded priority queue in front of the model providers: caps in-flight LLM calls,
+lets doctor/researcher traffic ahead of anonymous patients, and sheds load fast
+(503 + Retry-After) instead of piling more calls onto a saturated provider
+"""
+import os
+import math
+import time
+import heapq
+import asyncio
+import itertools
+import threading
+from contextlib import asynccontextmanager
+from typing import Dict, Any, List, Optional
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "32"))
+LLM_MAX_QUEUE_WAIT_SECONDS = float(os.getenv("LLM_MAX_QUEUE_WAIT_SECONDS", "10"))
+
+# Lower value = served first
+PRIORITY_PROFESSIONAL = 0   # doctor / researcher
+PRIORITY_SIGNED_IN = 1      # patient mode with a Clerk user id
+PRIORITY_ANONYMOUS = 2      # anonymous patient
+
+WAIT_TIME_BUCKETS = [0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+QUEUE_DEPTH_BUCKETS = [0, 1, 2, 4, 8, 16, 32, 64]
+
+
+def priority_for(user_mode: Optional[str], user_id: Optional[str] = None) -> int:
+    """Map a request's persona to an admission priority"""
+    if user_mode in ("doctor", "researcher"):
+        return PRIORITY_PROFESSIONAL
+    if user_id:
+        return PRIORITY_SIGNED_IN
+    return PRIORITY_ANONYMOUS
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is shed; callers should answer 503 with Retry-After"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"LLM capacity exhausted ({reason}), retry after {retry_after}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Histogram:
+    """Fixed-bucket histogram (Prometheus-style cumulative buckets)"""
+
+    def __init__(self, buckets: List[float]):
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        index = len(self.buckets)
+        for i, upper in enumerate(self.buckets):
+            if value <= upper:
+                index = i
+                break
+        self.counts[index] += 1
+        self.total += value
+        self.count += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        cumulative, running = {}, 0
+        for upper, count in zip(self.buckets + ["+Inf"], self.counts):
+            running += count
+            cumulative[str(upper)] = running
+        return {"buckets": cumulative, "sum": round(self.total, 4), "count": self.count}
+
+
+class _Waiter:
+    __slots__ = ("priority", "loop", "future", "enqueued_at", "granted", "abandoned")
+
+    def __init__(self, priority: int, loop: asyncio.AbstractEventLoop):
+        self.priority = priority
+        self.loop = loop
+        self.future = loop.create_future()
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+        self.abandoned = False
+
+
+def _resolve(future: asyncio.Future, error: Optional[BaseException] = None):
+    if future.done():
+        return
+    if error is None:
+        future.set_result(True)
+    else:
+        future.set_exception(error)
+
+
+class AdmissionController:
+    """
+    Priority admission gate for LLM calls
+
+    State is guarded by a threading lock and waiters are woken with
+    call_soon_threadsafe, so it works across the per-request event loops
+    the serverless handlers create.
+    """
+
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENCY, max_queue: int = LLM_MAX_QUEUE, max_wait: float = LLM_MAX_QUEUE_WAIT_SECONDS):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self._queue: List[tuple] = []
+        self._queued = 0
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        # EWMA of how long an admitted call holds its slot (drives Retry-After)
+        self._service_time = 5.0
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {"queue_full": 0, "timeout": 0, "evicted": 0}
+        self.wait_time = Histogram(WAIT_TIME_BUCKETS)
+        self.queue_depth = Histogram(QUEUE_DEPTH_BUCKETS)
+
+    def _retry_after(self) -> int:
+        backlog = self._queued + 1
+        return max(1, math.ceil(self._service_time * backlog / max(self.max_concurrency, 1)))
+
+    def _worst_entry(self) -> Optional[tuple]:
+        """Lowest-priority, most recently queued live entry"""
+        live = [entry for entry in self._queue if not entry[2].abandoned]
+        return max(live, key=lambda entry: (entry[0], entry[1])) if live else None
+
+    def _pop_worst(self) -> Optional[_Waiter]:
+        """Remove the lowest-priority, most recently queued waiter"""
+        worst = self._worst_entry()
+        if worst is None:
+            return None
+        self._queue.remove(worst)
+        heapq.heapify(self._queue)
+        self._queued -= 1
+        return worst[2]
+
+    async def acquire(self, priority: int = PRIORITY_ANONYMOUS) -> float:
+        """Wait for an LLM slot; returns seconds spent queued or raises AdmissionRejected"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self.queue_depth.observe(self._queued)
+            if self.in_flight < self.max_concurrency and self._queued == 0:
+                self.in_flight += 1
+                self.admitted += 1
+                self.wait_time.observe(0.0)
+                return 0.0
+
+            if self._queued >= self.max_queue:
+                worst = self._worst_entry()
+                if worst is None or worst[0] <= priority:
+                    self.rejected["queue_full"] += 1
+                    raise AdmissionRejected("queue_full", self._retry_after())
+                # Shed a lower-priority request to make room for this one
+                evicted = self._pop_worst()
+                evicted.abandoned = True
+                self.rejected["evicted"] += 1
+                evicted.loop.call_soon_threadsafe(
+                    _resolve, evicted.future, AdmissionRejected("evicted", self._retry_after())
+                )
+
+            waiter = _Waiter(priority, loop)
+            heapq.heappush(self._queue, (priority, next(self._seq), waiter))
+            self._queued += 1
+
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout=self.max_wait)
+        except asyncio.TimeoutError:
+            with self._lock:
+                if not waiter.granted:
+                    waiter.abandoned = True
+                    self._queued -= 1
+                    self.rejected["timeout"] += 1
+                    raise AdmissionRejected("queue_timeout", self._retry_after())
+        except asyncio.CancelledError:
+            with self._lock:
+                if not waiter.granted:
+                    waiter.abandoned = True
+                    self._queued -= 1
+                    raise
+            self.release(0.0)
+            raise
+
+        waited = time.monotonic() - waiter.enqueued_at
+        with self._lock:
+            self.admitted += 1
+            self.wait_time.observe(waited)
+        return waited
+
+    def release(self, held_seconds: Optional[float] = None):
+        """Free a slot, handing it straight to the best queued waiter if any"""
+        with self._lock:
+            if held_seconds is not None and held_seconds > 0:
+                self._service_time = 0.8 * self._service_time + 0.2 * held_seconds
+            while self._queue:
+                _, _, waiter = heapq.heappop(self._queue)
+                if waiter.abandoned:
+                    continue
+                self._queued -= 1
+                waiter.granted = True
+                waiter.loop.call_soon_threadsafe(_resolve, waiter.future)
+                return
+            self.in_flight = max(0, self.in_flight - 1)
+
+    @asynccontextmanager
+    async def slot(self, priority: int = PRIORITY_ANONYMOUS):
+        """async with admission_controller.slot(priority): <LLM call>"""
+        await self.acquire(priority)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Queue depth / wait-time histograms and counters"""
+        with self._lock:
+            return {
+                "in_flight": self.in_flight,
+                "queued": self._queued,
+                "max_concurrency": self.max_concurrency,
+                "max_queue": self.max_queue,
+                "max_wait_seconds": self.max_wait,
+                "admitted": self.admitted,
+                "rejected": dict(self.rejected),
+                "avg_service_seconds": round(self._service_time, 3),
+                "queue_depth": self.queue_depth.snapshot(),
+                "wait_time_seconds": self.wait_time.snapshot(),
+            }
+
+
+admission_controller = AdmissionController()
@@ -0,0 +1,156 @@
+"""
+BM25 Index - local lexical index stored next to the vector store
+Catches exact drug names and dosage strings ("warfarin", "500mg", "co-trimoxazole")
+that MiniLM embeddings blur; RAGService fuses its ranking with vector search
+"""
+import os
+import re
+import json
+import math
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+BM25_K1 = float(os.getenv("BM25_K1", "1.5"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+
+# Words and numbers, keeping compounds like "10mg/kg", "0.5" and "n-acetylcysteine" whole
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[.\-/][a-z0-9]+)*")
+_SPLIT_RE = re.compile(r"[.\-/]")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from in is it of on or that the this to was were with which".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased terms; compounds also contribute their parts ("10mg/kg" -> 10mg/kg, 10mg, kg)"""
+    tokens = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        if token in _STOPWORDS:
+            continue
+        tokens.append(token)
+        if _SPLIT_RE.search(token) and not token.replace(".", "").isdigit():
+            tokens.extend(part for part in _SPLIT_RE.split(token) if part and part not in _STOPWORDS)
+    return tokens
+
+
+class BM25Index:
+    """
+    Okapi BM25 over chunks keyed by chunk ID, persisted as JSON
+
+    With store_text=False only term counts are kept and saved - for vector
+    stores that can return a chunk's text by ID themselves (the flat backend).
+    """
+
+    def __init__(self, path: Optional[str] = None, store_text: bool = True):
+        self.path = path
+        self.store_text = store_text
+        self.docs: Dict[str, Dict] = {}              # id -> {"text", "metadata", "length", "terms"}
+        self.postings: Dict[str, Dict[str, int]] = {}  # term -> {id: term frequency}
+        self.total_length = 0
+        self._lock = threading.RLock()
+        if path and os.path.exists(path):
+            self.load()
+
+    @property
+    def size(self) -> int:
+        return len(self.docs)
+
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"[BM25] Could not load {self.path}: {e}")
+            return
+        with self._lock:
+            self.docs = {}
+            self.postings = {}
+            self.total_length = 0
+            for chunk_id, doc in data.get("docs", {}).items():
+                if "text" in doc:
+                    self._index(chunk_id, doc["text"], doc.get("metadata") or {})
+                else:
+                    self._index_counts(chunk_id, Counter(doc.get("terms") or {}), None, {})
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with self._lock:
+            data = {"docs": {
+                cid: {"text": d["text"], "metadata": d["metadata"]} if d["text"] is not None else {"terms": d["terms"]}
+                for cid, d in self.docs.items()
+            }}
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, self.path)
+
+    def _index(self, chunk_id: str, text: str, metadata: Dict):
+        counts = Counter(tokenize(text))
+        if self.store_text:
+            self._index_counts(chunk_id, counts, text, metadata)
+        else:
+            self._index_counts(chunk_id, counts, None, {})
+
+    def _index_counts(self, chunk_id: str, counts: Counter, text: Optional[str], metadata: Dict):
+        if chunk_id in self.docs:
+            self._remove(chunk_id)
+        length = sum(counts.values())
+        self.docs[chunk_id] = {"text": text, "metadata": metadata, "length": length, "terms": dict(counts)}
+        self.total_length += length
+        for term, tf in counts.items():
+            self.postings.setdefault(term, {})[chunk_id] = tf
+
+    def _remove(self, chunk_id: str):
+        doc = self.docs.pop(chunk_id, None)
+        if doc is None:
+            return
+        self.total_length -= doc["length"]
+        for term in doc["terms"]:
+            posting = self.postings.get(term)
+            if posting is not None:
+                posting.pop(chunk_id, None)
+                if not posting:
+                    del self.postings[term]
+
+    def add(self, ids: List[str], texts: List[str], metadatas: Optional[List[Dict]] = None):
+        with self._lock:
+            for i, (chunk_id, text) in enumerate(zip(ids, texts)):
+                self._index(chunk_id, text, (metadatas[i] if metadatas else None) or {})
+
+    def delete(self, ids: Iterable[str]):
+        with self._lock:
+            for chunk_id in ids:
+                self._remove(chunk_id)
+
+    def update_metadata(self, chunk_id: str, metadata: Dict):
+        with self._lock:
+            doc = self.docs.get(chunk_id)
+            if doc is not None and doc["text"] is not None:
+                doc["metadata"] = metadata
+
+    def get(self, chunk_id: str) -> Optional[Dict]:
+        """{"text", "metadata", ...} of a chunk, or None if unknown or its text is not kept"""
+        doc = self.docs.get(chunk_id)
+        return doc if doc is not None and doc["text"] is not None else None
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        """Top-k (chunk ID, BM25 score)"""
+        terms = set(tokenize(query))
+        with self._lock:
+            n = len(self.docs)
+            if not n or not terms:
+                return []
+            avg_length = self.total_length / n
+            scores: Dict[str, float] = {}
+            for term in terms:
+                posting = self.postings.get(term)
+                if not posting:
+                    continue
+                idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+                for chunk_id, tf in posting.items():
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self.docs[chunk_id]["length"] / avg_length)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
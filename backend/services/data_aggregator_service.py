@@ -16,16 +16,47 @@ from typing import List, Dict, Optional
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
 from ..db.models import APICache
+from .pubmed_service import pubmed_service
 import xml.etree.ElementTree as ET
 
 # API Keys from environment
 OPENFDA_API_KEY = os.getenv("OPENFDA_API_KEY", "")
-NCBI_API_KEY = os.getenv("NCBI_API_KEY", "")
 
 # Cache duration
 CACHE_DURATION_DAYS = int(os.getenv("API_CACHE_DURATION_DAYS", "30"))
 
 
+def _author_names(authors: Optional[str]) -> List[str]:
+    """PubMedService author string ("Smith, JA, Doe, B, et al.") -> ["Smith JA", "Doe B"]"""
+    parts = [p.strip() for p in (authors or "").split(",")]
+    names, i = [], 0
+    while i < len(parts):
+        name = parts[i]
+        initials = parts[i + 1] if i + 1 < len(parts) else ""
+        if initials.isalpha() and initials.isupper():
+            names.append(f"{name} {initials}")
+            i += 2
+            continue
+        if name and name not in ("et al.", "Unknown authors"):
+            names.append(name)
+        i += 1
+    return names
+
+
+def _literature_entry(article: Dict) -> Dict:
+    """Aggregator literature item: authors as a list of names, publication_date as text"""
+    return {
+        "pmid": article["pmid"],
+        "title": article.get("title", ""),
+        "authors": _author_names(article.get("authors")),
+        "journal": article.get("journal", ""),
+        "publication_date": str(article["year"]) if article.get("year") else "",
+        "doi": article.get("doi"),
+        "url": article.get("url") or f"https://pubmed.ncbi.nlm.nih.gov/{article['pmid']}/",
+        "source": "PubMed"
+    }
+
+
 class DrugDataAggregator:
     """Aggregates drug data from multiple FREE public APIs"""
     
@@ -302,70 +333,24 @@ class DrugDataAggregator:
     async def get_pubmed_studies(self, drug_name: str, limit: int = 5) -> List[Dict]:
         """
         Query PubMed E-utilities for recent research
-        API Docs: https://www.ncbi.nlm.nih.gov/books/NBK25501/
+        
+        Goes through the shared PubMedService layer (rate limit, PMID-level article
+        cache, local PMID store), so articles fetched here also serve reference
+        formatting and citation checks. Only the search result (PMIDs) is kept in
+        the API cache; metadata is resolved per PMID.
         """
-        cache_key = f"pubmed_{drug_name.lower()}_{limit}"
-        cached = self._check_cache(cache_key)
-        if cached:
-            return cached
+        cache_key = f"pubmed_ids_{drug_name.lower()}_{limit}"
+        pmids = self._check_cache(cache_key)
         
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                # Search PubMed
-                search_params = {
-                    "db": "pubmed",
-                    "term": f"{drug_name} AND drug interactions",
-                    "retmode": "json",
-                    "retmax": limit,
-                    "sort": "relevance"
-                }
-                if NCBI_API_KEY:
-                    search_params["api_key"] = NCBI_API_KEY
-                
-                search_response = await client.get(
-                    "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi",
-                    params=search_params
-                )
-                search_data = search_response.json()
-                
-                pmids = search_data.get("esearchresult", {}).get("idlist", [])
-                
+            if not pmids:
+                pmids = await pubmed_service.search_articles_async(f"{drug_name} AND drug interactions", max_results=limit)
                 if not pmids:
                     return []
-                
-                # Fetch article summaries
-                summary_params = {
-                    "db": "pubmed",
-                    "id": ",".join(pmids),
-                    "retmode": "json"
-                }
-                if NCBI_API_KEY:
-                    summary_params["api_key"] = NCBI_API_KEY
-                
-                summary_response = await client.get(
-                    "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esummary.fcgi",
-                    params=summary_params
-                )
-                summary_data = summary_response.json()
-                
-                articles = []
-                if summary_data.get("result"):
-                    for pmid in pmids:
-                        if pmid in summary_data["result"]:
-                            article_data = summary_data["result"][pmid]
-                            articles.append({
-                                "pmid": pmid,
-                                "title": article_data.get("title", ""),
-                                "authors": [author.get("name", "") for author in article_data.get("authors", [])[:3]],
-                                "journal": article_data.get("source", ""),
-                                "publication_date": article_data.get("pubdate", ""),
-                                "url": f"https://pubmed.ncbi.nlm.nih.gov/{pmid}/",
-                                "source": "PubMed"
-                            })
-                
-                self._save_to_cache(cache_key, articles)
-                return articles
-                
+                self._save_to_cache(cache_key, pmids)
+            
+            articles = await pubmed_service.fetch_article_details_async(pmids)
+            return [_literature_entry(article) for article in articles]
         except Exception as e:
             print(f"[PubMed Error] {drug_name}: {str(e)}")
             return []
@@ -0,0 +1,158 @@
+"""
+Near-duplicate detection for RAG chunks (MinHash + LSH)
+Papers and labels repeat boilerplate and the splitter's overlap repeats text
+again; chunks whose shingle sets are near-identical to an indexed chunk are
+dropped before embedding
+"""
+import os
+import re
+import zlib
+import threading
+from typing import Dict, Iterable, List, Optional, Set
+
+import numpy as np
+
+# Estimated Jaccard similarity at or above which a chunk counts as a duplicate
+DEDUP_THRESHOLD = float(os.getenv("RAG_DEDUP_THRESHOLD", "0.85"))
+DEDUP_NUM_PERM = int(os.getenv("RAG_DEDUP_NUM_PERM", "128"))
+# 16 bands x 8 rows: pairs above ~0.7 similarity almost always share a bucket
+DEDUP_BANDS = int(os.getenv("RAG_DEDUP_BANDS", "16"))
+DEDUP_SHINGLE_WORDS = int(os.getenv("RAG_DEDUP_SHINGLE_WORDS", "5"))
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def shingles(text: str, size: int = DEDUP_SHINGLE_WORDS) -> Set[int]:
+    """32-bit hashes of the text's word n-grams (case and punctuation ignored)"""
+    words = _WORD_RE.findall(text.lower())
+    if len(words) <= size:
+        return {zlib.crc32(" ".join(words).encode())} if words else set()
+    return {zlib.crc32(" ".join(words[i:i + size]).encode()) for i in range(len(words) - size + 1)}
+
+
+class MinHasher:
+    """num_perm universal hash functions (a*x + b mod 2^61-1) applied to shingle hashes"""
+
+    def __init__(self, num_perm: int = DEDUP_NUM_PERM, seed: int = 1):
+        rng = np.random.RandomState(seed)
+        # 32-bit a, b and x keep a*x + b inside uint64
+        self.a = rng.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self.b = rng.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = np.fromiter(shingles(text), dtype=np.uint64)
+        if not len(hashes):
+            return np.full(len(self.a), _MERSENNE_PRIME, dtype=np.uint64)
+        return ((np.outer(hashes, self.a) + self.b) % _MERSENNE_PRIME).min(axis=0)
+
+
+class NearDuplicateIndex:
+    """
+    LSH buckets over MinHash signatures of indexed chunks
+
+    Candidates sharing any band bucket are confirmed by their estimated Jaccard
+    similarity (fraction of equal signature slots). Signatures persist as .npz
+    next to the vector store so later runs dedup against what is already indexed.
+    """
+
+    def __init__(self, path: Optional[str] = None, threshold: float = DEDUP_THRESHOLD,
+                 num_perm: int = DEDUP_NUM_PERM, bands: int = DEDUP_BANDS):
+        self.path = path
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.hasher = MinHasher(num_perm)
+        self._signatures: Dict[str, np.ndarray] = {}
+        self._buckets: List[Dict[bytes, Set[str]]] = [{} for _ in range(bands)]
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.dropped = 0
+        if path and os.path.exists(path):
+            self.load()
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def _insert(self, key: str, signature: np.ndarray):
+        self._signatures[key] = signature
+        for band, band_key in zip(self._buckets, self._band_keys(signature)):
+            band.setdefault(band_key, set()).add(key)
+
+    def _find(self, signature: np.ndarray) -> Optional[str]:
+        candidates = set()
+        for band, band_key in zip(self._buckets, self._band_keys(signature)):
+            candidates |= band.get(band_key, set())
+        best, best_similarity = None, self.threshold
+        for key in candidates:
+            similarity = float(np.mean(self._signatures[key] == signature))
+            if similarity >= best_similarity:
+                best, best_similarity = key, similarity
+        return best
+
+    def check_and_add(self, key: str, text: str) -> Optional[str]:
+        """Key of an indexed near-duplicate of text (nothing is added), or None after indexing it"""
+        signature = self.hasher.signature(text)
+        with self._lock:
+            self.checked += 1
+            if key in self._signatures:
+                # Re-adding the same chunk is not a duplicate of itself
+                self._remove(key)
+            duplicate = self._find(signature)
+            if duplicate is not None:
+                self.dropped += 1
+                return duplicate
+            self._insert(key, signature)
+            return None
+
+    def _remove(self, key: str):
+        signature = self._signatures.pop(key, None)
+        if signature is None:
+            return
+        for band, band_key in zip(self._buckets, self._band_keys(signature)):
+            keys = band.get(band_key)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del band[band_key]
+
+    def remove(self, keys: Iterable[str]):
+        with self._lock:
+            for key in keys:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._signatures = {}
+            self._buckets = [{} for _ in range(self.bands)]
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with self._lock:
+            keys = list(self._signatures)
+            signatures = np.stack([self._signatures[k] for k in keys]) if keys else np.zeros((0, self.rows * self.bands), dtype=np.uint64)
+        tmp = f"{self.path}.tmp.npz"
+        np.savez(tmp, keys=np.array(keys, dtype=str), signatures=signatures)
+        os.replace(tmp, self.path)
+
+    def load(self):
+        try:
+            data = np.load(self.path)
+            keys, signatures = data["keys"], data["signatures"]
+        except Exception as e:
+            print(f"[DEDUP] Could not load {self.path}: {e}")
+            return
+        if signatures.shape[1:] != (self.rows * self.bands,):
+            print(f"[DEDUP] Ignoring {self.path}: built with different MinHash settings")
+            return
+        with self._lock:
+            for key, signature in zip(keys, signatures):
+                self._insert(str(key), signature)
+
+    def stats(self) -> Dict[str, int]:
+        return {"indexed": len(self._signatures), "checked": self.checked, "dropped": self.dropped}
@@ -1,198 +1,242 @@
 import httpx
 import os
-from typing import Optional
+import json
+import time
+import asyncio
+from typing import AsyncIterator, Optional
 from dotenv import load_dotenv
+from .provider_stats import ProviderStats, ModelProviderError, find_status_code, note_first_token
+from .http_pool import get_async_client
+from .llm_recorder import llm_recorder
+from .usage_tracker import add_usage
+from .prompts import get_system_prompt, normalize_answer_layout
 
 load_dotenv()
 
 DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
 DEEPSEEK_MODEL = os.getenv("DEEPSEEK_MODEL", "deepseek-chat")
-
-# Mode-specific system prompts
-PATIENT_MODE_PROMPT = """You are Kandih ToxWiki, a friendly and caring medical assistant helping patients understand drug safety and interactions.
-
-CONVERSATION STYLE:
-- Use simple, everyday language (6th grade reading level)
-- Avoid medical jargon and complex terms
-- Use relatable measurements (teaspoons, tablespoons, not mg/ml)
-- Be warm, empathetic, and patient
-- Ask clarifying questions to understand the patient's situation better
-
-CONVERSATIONAL FLOW:
-1. First, ALWAYS ask what medications they are currently taking
-2. Listen to their concerns and ask follow-up questions
-3. Only provide analysis AFTER you know what drugs they're taking
-4. Keep responses clear and actionable
-
-CITATION REQUIREMENTS:
-- Include inline citations [1], [2], [3] after important facts
-- End with a ## REFERENCES section in simple APA style
-- Focus on trustworthy sources (FDA, Mayo Clinic, reputable medical sites)
-
-EXAMPLE INTERACTION:
-User: "I want to know about panadol"
-You: "I'd be happy to help you learn about Panadol! To give you the most helpful information, could you tell me: Are you currently taking any other medications? This will help me check for any interactions."
-
-MEASUREMENT EXAMPLES:
-- Instead of "500mg", say "1 regular-strength tablet"
-- Instead of "4000mg daily max", say "no more than 8 regular tablets in 24 hours"
-- Instead of "15ml", say "1 tablespoon"
-"""
-
-DOCTOR_MODE_PROMPT = """You are Kandih ToxWiki, a clinical decision support system for healthcare professionals.
-
-CONVERSATION STYLE:
-- Use appropriate medical terminology (12th grade+ reading level)
-- Include dosing in standard units (mg, mg/kg, ml)
-- Provide clinical context and evidence-based recommendations
-- Ask relevant clinical questions to provide better guidance
-
-CONVERSATIONAL FLOW:
-1. Ask about the patient's current medication regimen
-2. Inquire about relevant clinical context (age, weight, comorbidities, renal/hepatic function)
-3. Provide detailed pharmacological analysis
-4. Offer evidence-based recommendations
-
-CITATION REQUIREMENTS:
-- Include inline citations [1], [2], [3] for all clinical claims
-- End with ## REFERENCES section with full medical literature citations
-- Include journal names, years, DOIs, PMIDs when available
-
-EXAMPLE INTERACTION:
-User: "Tell me about acetaminophen"
-You: "I can provide comprehensive information about acetaminophen. To ensure clinically relevant guidance, could you share: What is the patient's current medication list? Are there any hepatic or renal concerns?"
-
-INCLUDE:
-- Pharmacokinetics (absorption, distribution, metabolism, elimination)
-- Drug-drug interactions with CYP enzyme details
-- Contraindications and warnings
-- Dosing adjustments for special populations
-"""
-
-RESEARCHER_MODE_PROMPT = """You are Kandih ToxWiki, an advanced toxicology research assistant for scientists and researchers.
-
-CONVERSATION STYLE:
-- Use technical, scientific language
-- Include detailed mechanisms at molecular level
-- Provide comprehensive pharmacological data
-- Reference primary literature extensively
-
-CONVERSATIONAL FLOW:
-1. Understand the research context or query
-2. Ask about specific aspects of interest (mechanism, kinetics, interactions)
-3. Provide in-depth analysis with full scientific detail
-4. Cite primary research literature
-
-CITATION REQUIREMENTS:
-- Extensive inline citations [1], [2], [3] throughout
-- End with ## REFERENCES section with complete bibliographic data
-- Include author names, journal, volume, pages, DOI, PMID
-- Prioritize peer-reviewed research articles
-
-EXAMPLE INTERACTION:
-User: "Information on acetaminophen"
-You: "I can provide detailed toxicological and pharmacological data on acetaminophen (N-acetyl-p-aminophenol, APAP). What specific aspects are you investigating? (e.g., NAPQI-mediated hepatotoxicity, CYP2E1 metabolism, glutathione depletion kinetics, drug-drug interaction mechanisms)"
-
-INCLUDE:
-- Molecular mechanisms and pathways
-- CYP enzyme specifics (Km, Vmax values when known)
-- Toxicokinetics and toxicodynamics
-- Structure-activity relationships
-- Genetic polymorphisms affecting metabolism
-- Animal model data and human clinical trial results
-"""
-
-# Select the appropriate prompt based on user mode
-def get_system_prompt(user_mode: str = 'patient') -> str:
-    """Return the appropriate system prompt based on user mode"""
-    if user_mode == 'doctor':
-        return DOCTOR_MODE_PROMPT
-    elif user_mode == 'researcher':
-        return RESEARCHER_MODE_PROMPT
-    else:
-        return PATIENT_MODE_PROMPT
+DEEPSEEK_BASE_URL = os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com/v1")
+# With streaming the read timeout is the max gap between tokens, not the whole answer
+DEEPSEEK_READ_TIMEOUT = float(os.getenv("DEEPSEEK_READ_TIMEOUT", "30"))
+DEEPSEEK_CONNECT_TIMEOUT = float(os.getenv("DEEPSEEK_CONNECT_TIMEOUT", "5"))
+DEEPSEEK_MAX_CONNECTIONS = int(os.getenv("DEEPSEEK_MAX_CONNECTIONS", "20"))
 
 
 class DeepSeekModelService:
     def __init__(self):
         self.api_key = DEEPSEEK_API_KEY
         self.model_name = DEEPSEEK_MODEL
-        self.base_url = "https://api.deepseek.com/v1"
-        self.timeout = 60.0
+        self.base_url = DEEPSEEK_BASE_URL
+        self.timeout = httpx.Timeout(DEEPSEEK_READ_TIMEOUT, connect=DEEPSEEK_CONNECT_TIMEOUT)
 
         # If no API key is present, mark the service disabled
         self.enabled = bool(self.api_key)
-        # Optional debug flag
-        self.debug = os.getenv("MODEL_DEBUG", "0") in ["1", "true", "True"]
-
-    async def generate_response(self, question: str, context: Optional[str] = None, user_mode: str = 'patient') -> str:
-        """Generate a response using DeepSeek's API with mode-specific prompting"""
-
-        if not self.enabled:
-            return ""
-
-        # Get the appropriate system prompt based on user mode
-        system_prompt = get_system_prompt(user_mode)
-
-        # Construct the user prompt
+        # Passive health / latency stats used by the model router
+        self.stats = ProviderStats("deepseek")
+        self._probe_status = None
+
+    def _client(self) -> httpx.AsyncClient:
+        """Keep-alive client shared by every DeepSeek call on the current event loop"""
+        return get_async_client("deepseek", lambda: httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=self.timeout,
+            headers={"Authorization": f"Bearer {self.api_key}"},
+            limits=httpx.Limits(max_connections=DEEPSEEK_MAX_CONNECTIONS, max_keepalive_connections=DEEPSEEK_MAX_CONNECTIONS)
+        ))
+
+    def build_messages(
+        self,
+        question: str,
+        context: Optional[str] = None,
+        user_mode: str = 'patient',
+        conversation_history: list = None,
+        conversation_summary: Optional[str] = None
+    ) -> list:
+        """Chat messages in the same layout the Groq service sends"""
         if context:
             user_prompt = f"Context information:\n{context}\n\nQuestion: {question}"
         else:
             user_prompt = question
 
-        try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(
-                    f"{self.base_url}/chat/completions",
-                    headers={
-                        "Authorization": f"Bearer {self.api_key}",
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "model": self.model_name,
-                        "messages": [
-                            {
-                                "role": "system",
-                                "content": system_prompt
-                            },
-                            {
-                                "role": "user",
-                                "content": user_prompt
-                            }
-                        ],
-                        "temperature": 0.3,
-                        "max_tokens": 4096,
-                        "top_p": 0.9
-                    }
-                )
-                response.raise_for_status()
-                result = response.json()
+        messages = [{"role": "system", "content": get_system_prompt(user_mode)}]
+        if conversation_summary:
+            messages.append({
+                "role": "system",
+                "content": f"Summary of the earlier conversation (for context only):\n{conversation_summary}"
+            })
+        if conversation_history:
+            # Already windowed by the caller (memory_service.build_prompt_history)
+            messages.extend(conversation_history)
+        messages.append({"role": "user", "content": user_prompt})
+        return messages
+
+    async def generate_response(
+        self,
+        question: str = None,
+        context: Optional[str] = None,
+        user_mode: str = 'patient',
+        query: str = None,
+        max_tokens: int = 2000,
+        temperature: float = 0.3,
+        conversation_history: list = None,
+        conversation_summary: Optional[str] = None
+    ) -> str:
+        """Generate a response using DeepSeek's API with mode-specific prompting"""
 
-                # Extract the assistant's message
-                if "choices" in result and len(result["choices"]) > 0:
-                    content = result["choices"][0]["message"]["content"]
-                    # Write raw response for debugging when enabled
-                    if getattr(self, "debug", False):
-                        try:
-                            import json as _json
-                            from datetime import datetime as _dt
-                            path = f"/tmp/model_debug_deepseek_{_dt.utcnow().strftime('%Y%m%dT%H%M%S%f')}.json"
-                            with open(path, "w") as _f:
-                                _f.write(_json.dumps({"endpoint": "generate_response", "result": result, "user_mode": user_mode}))
-                        except Exception:
-                            pass
-                    return content
-                else:
-                    return "I apologize, but I couldn't generate a response."
+        if not self.enabled:
+            return ""
 
-        except httpx.TimeoutException:
-            return "The request timed out. Please try again."
-        except httpx.HTTPStatusError as e:
-            error_detail = e.response.json() if e.response else str(e)
-            return f"API error: {error_detail}"
+        try:
+            return await self.generate(
+                query=query, question=question, context=context, user_mode=user_mode,
+                max_tokens=max_tokens, temperature=temperature,
+                conversation_history=conversation_history, conversation_summary=conversation_summary
+            )
+        except ModelProviderError as e:
+            if e.timeout:
+                return "The request timed out. Please try again."
+            return f"API error: {e}"
         except Exception as e:
             return f"An error occurred: {str(e)}"
 
+    async def generate(
+        self,
+        query: str = None,
+        question: str = None,
+        context: Optional[str] = None,
+        user_mode: str = 'patient',
+        max_tokens: int = 2000,
+        temperature: float = 0.3,
+        conversation_history: list = None,
+        conversation_summary: Optional[str] = None,
+        deadline: Optional[float] = None
+    ) -> str:
+        """
+        Generate a full response, raising ModelProviderError on API-level failures
+
+        Consumes stream_response, so a slow answer only times out when tokens stop
+        arriving or the deadline (absolute time.monotonic()) passes.
+        """
+        async def collect() -> str:
+            parts = []
+            async for chunk in self.stream_response(
+                query=query, question=question, context=context, user_mode=user_mode,
+                max_tokens=max_tokens, temperature=temperature,
+                conversation_history=conversation_history, conversation_summary=conversation_summary
+            ):
+                parts.append(chunk)
+            # Same "References:" / "[n]" layout as Groq, so citations are parsed and verified
+            return normalize_answer_layout("".join(parts))
+
+        if deadline is None:
+            return await collect()
+        try:
+            return await asyncio.wait_for(collect(), timeout=max(deadline - time.monotonic(), 0.1))
+        except asyncio.TimeoutError as e:
+            raise ModelProviderError("DeepSeek request exceeded its deadline", provider="deepseek", timeout=True) from e
+
+    async def stream_response(
+        self,
+        query: str = None,
+        question: str = None,
+        context: Optional[str] = None,
+        user_mode: str = 'patient',
+        max_tokens: int = 2000,
+        temperature: float = 0.3,
+        conversation_history: list = None,
+        conversation_summary: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """
+        Stream answer text from /chat/completions (SSE) as it is generated
+
+        Raises ModelProviderError on API-level failures, before or mid-stream.
+        """
+        user_query = query or question
+        if not user_query:
+            raise ValueError("No question provided")
+        if not self.enabled:
+            raise ModelProviderError("DEEPSEEK_API_KEY not configured", provider="deepseek")
+
+        payload = {
+            "model": self.model_name,
+            "messages": self.build_messages(
+                user_query, context, user_mode, conversation_history, conversation_summary
+            ),
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "top_p": 0.9,
+            "stream": True,
+            "stream_options": {"include_usage": True}
+        }
+
+        started = time.monotonic()
+        first_token_at = None
+        parts = []
+        finish_reason = None
+        usage = None
+        try:
+            async with self._client().stream("POST", "/chat/completions", json=payload) as response:
+                if response.status_code >= 400:
+                    await response.aread()
+                    response.raise_for_status()
+                async for line in response.aiter_lines():
+                    # SSE: "data: {...}" events, ": keep-alive" comments, blank separators
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+                    try:
+                        event = json.loads(data)
+                    except ValueError:
+                        continue
+                    # With include_usage the last event has usage and no choices
+                    usage = event.get("usage") or usage
+                    choices = event.get("choices") or []
+                    if not choices:
+                        continue
+                    finish_reason = choices[0].get("finish_reason") or finish_reason
+                    content = (choices[0].get("delta") or {}).get("content")
+                    if content:
+                        if first_token_at is None:
+                            first_token_at = time.monotonic()
+                            note_first_token()
+                        parts.append(content)
+                        yield content
+        except httpx.TimeoutException as e:
+            self.stats.record((time.monotonic() - started) * 1000, ok=False, error="timeout")
+            raise ModelProviderError("DeepSeek request timed out", provider="deepseek", timeout=True) from e
+        except httpx.HTTPStatusError as e:
+            status_code = e.response.status_code
+            # 4xx too: a bad key or a rejected request means this provider can't answer
+            self.stats.record((time.monotonic() - started) * 1000, ok=False,
+                              status_code=status_code, error=str(e))
+            try:
+                error_detail = e.response.json()
+            except Exception:
+                error_detail = str(e)
+            retry_after = e.response.headers.get("retry-after")
+            raise ModelProviderError(
+                str(error_detail),
+                provider="deepseek",
+                status_code=status_code,
+                retry_after=float(retry_after) if retry_after and retry_after.replace(".", "", 1).isdigit() else None
+            ) from e
+        except httpx.HTTPError as e:
+            self.stats.record((time.monotonic() - started) * 1000, ok=False, error=str(e))
+            raise ModelProviderError(str(e), provider="deepseek", status_code=find_status_code(e)) from e
+
+        if not parts:
+            self.stats.record((time.monotonic() - started) * 1000, ok=False, error="empty stream")
+            raise ModelProviderError("DeepSeek returned no content", provider="deepseek")
+        latency_ms = (time.monotonic() - started) * 1000
+        self.stats.record(latency_ms, ok=True, ttft_ms=(first_token_at - started) * 1000)
+        add_usage("deepseek", self.model_name, usage, finish_reason=finish_reason, max_tokens=max_tokens)
+        llm_recorder.record(
+            "deepseek", self.model_name, payload["messages"], payload, "".join(parts), latency_ms,
+            usage=usage, ttft_ms=(first_token_at - started) * 1000, finish_reason=finish_reason
+        )
+
     async def generate_consumer_summary(self, text: str, question: Optional[str] = None) -> str:
         """Generate a short plain-language consumer summary"""
         if not self.enabled:
@@ -212,53 +256,53 @@ class DeepSeekModelService:
         user_prompt = "\n\n".join(prompt_lines)
 
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(
-                    f"{self.base_url}/chat/completions",
-                    headers={
-                        "Authorization": f"Bearer {self.api_key}",
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "model": self.model_name,
-                        "messages": [
-                            {"role": "system", "content": "You are a helpful, concise medical summarization assistant. Always include inline citations [1], [2], [3] for every factual claim."},
-                            {"role": "user", "content": user_prompt}
-                        ],
-                        "temperature": 0.0,
-                        "max_tokens": 150,
-                        "top_p": 1.0
-                    }
-                )
-                response.raise_for_status()
-                result = response.json()
-                if "choices" in result and len(result["choices"]) > 0:
-                    content = result["choices"][0]["message"]["content"].strip()
-                    return content
-                return ""
+            response = await self._client().post(
+                "/chat/completions",
+                json={
+                    "model": self.model_name,
+                    "messages": [
+                        {"role": "system", "content": "You are a helpful, concise medical summarization assistant. Always include inline citations [1], [2], [3] for every factual claim."},
+                        {"role": "user", "content": user_prompt}
+                    ],
+                    "temperature": 0.0,
+                    "max_tokens": 150,
+                    "top_p": 1.0
+                }
+            )
+            response.raise_for_status()
+            result = response.json()
+            if "choices" in result and len(result["choices"]) > 0:
+                content = result["choices"][0]["message"]["content"].strip()
+                return content
+            return ""
         except Exception:
             return ""
 
-    async def check_health(self) -> bool:
-        """Check if DeepSeek API is available"""
+    async def check_health(self, force_refresh: bool = False) -> dict:
+        """
+        Check if DeepSeek API is available
+
+        Uses passive stats from real calls; only force_refresh hits the /models endpoint.
+        """
         if not self.enabled:
-            print("[DeepSeek Health Check] FAILED: No DEEPSEEK_API_KEY environment variable")
-            return False
-        try:
-            async with httpx.AsyncClient(timeout=5.0) as client:
-                response = await client.get(
-                    f"{self.base_url}/models",
-                    headers={"Authorization": f"Bearer {self.api_key}"}
-                )
+            return {"status": "unhealthy", "error": "DEEPSEEK_API_KEY not configured"}
+
+        if force_refresh:
+            try:
+                response = await self._client().get("/models", timeout=5.0)
                 if response.status_code == 200:
-                    print("[DeepSeek Health Check] ✓ API is accessible")
-                    return True
+                    self._probe_status = {"status": "healthy"}
                 else:
-                    print(f"[DeepSeek Health Check] FAILED: API returned {response.status_code}")
-                    return False
-        except Exception as e:
-            print(f"[DeepSeek Health Check] FAILED: {str(e)}")
-            return False
+                    self._probe_status = {"status": "unhealthy", "error": f"API returned {response.status_code}"}
+            except Exception as e:
+                self._probe_status = {"status": "unhealthy", "error": str(e)[:200]}
+
+        probe = self._probe_status
+        status = self.stats.passive_status() or (probe or {}).get("status") or "unknown"
+        result = {"status": status, "model": self.model_name, "probe": probe, "passive": self.stats.snapshot()}
+        if status != "healthy":
+            result["error"] = (probe or {}).get("error") or self.stats.last_error or "no recent calls"
+        return result
 
 
 deepseek_service = DeepSeekModelService()
@@ -0,0 +1,220 @@
+"""
+Flat Vector Store - memory-mapped NumPy alternative to Chroma (RAG_BACKEND=flat)
+Normalized float32 embeddings live in one .npy file opened with mmap; chunk text
+and metadata are JSON records in a .bin file indexed by an .npy of byte offsets,
+also mapped and decoded only for the rows a search returns. chunks.json holds just
+the IDs and file names. Opening is near-instant, worker processes share the page
+cache, and search is a single matrix-vector product plus top-k selection.
+"""
+import os
+import json
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+META_FILE = "chunks.json"
+
+
+class StoredChunk:
+    """Minimal Document (page_content + metadata) returned by searches"""
+    __slots__ = ("page_content", "metadata")
+
+    def __init__(self, page_content: str, metadata: Dict[str, Any]):
+        self.page_content = page_content
+        self.metadata = metadata
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class FlatVectorStore:
+    """
+    Exact cosine search over a memory-mapped embedding matrix
+
+    Implements the part of the LangChain Chroma interface RAGService uses
+    (add_documents, delete, similarity_search_by_vector, persist). Writes are
+    kept in memory until persist(), which compacts deleted rows and writes a new
+    generation of the matrix and records before switching the sidecar over to
+    them; with nothing added or deleted it writes nothing.
+    """
+
+    def __init__(self, directory: str, embedding_function=None):
+        self.directory = directory
+        self.embedding_function = embedding_function
+        self._lock = threading.RLock()
+        self._generation = 0
+        self._vectors: Optional[np.ndarray] = None   # mmap of the persisted matrix
+        self._pending: List[np.ndarray] = []         # rows added since the last persist
+        self._live = np.zeros(0, dtype=bool)
+        self._ids: List[str] = []
+        self._records = b""                          # mmap of the persisted chunk records
+        self._offsets = np.zeros(1, dtype=np.int64)  # record i is _records[_offsets[i]:_offsets[i + 1]]
+        self._added: Dict[int, Tuple[str, Dict[str, Any]]] = {}  # text/metadata written since the last persist
+        self._rows: Dict[str, int] = {}
+        self._dirty = False
+        if self.exists(directory):
+            self._open()
+
+    @staticmethod
+    def exists(directory: str) -> bool:
+        return os.path.exists(os.path.join(directory, META_FILE))
+
+    def _open(self):
+        with open(os.path.join(self.directory, META_FILE), encoding="utf-8") as f:
+            meta = json.load(f)
+        vectors = np.load(os.path.join(self.directory, meta["vectors_file"]), mmap_mode="r")
+        if vectors.shape[0] != len(meta["ids"]):
+            raise ValueError(f"{meta['vectors_file']} has {vectors.shape[0]} rows for {len(meta['ids'])} chunks")
+        if "records_file" in meta:
+            offsets = np.load(os.path.join(self.directory, meta["offsets_file"]), mmap_mode="r")
+            records_path = os.path.join(self.directory, meta["records_file"])
+            # numpy cannot map an empty file
+            records = np.memmap(records_path, dtype=np.uint8, mode="r") if os.path.getsize(records_path) else b""
+            added = {}
+        else:
+            # Stores written before the records sidecar keep text inline until the next persist
+            offsets, records = np.zeros(1, dtype=np.int64), b""
+            added = dict(enumerate(zip(meta["texts"], meta["metadatas"])))
+        self._generation = meta["generation"]
+        self._vectors = vectors
+        self._ids = meta["ids"]
+        self._records = records
+        self._offsets = offsets
+        self._added = added
+        self._rows = {cid: row for row, cid in enumerate(self._ids)}
+        self._live = np.ones(len(self._ids), dtype=bool)
+        self._dirty = "records_file" not in meta
+
+    def _record(self, row: int) -> bytes:
+        """JSON-encoded [text, metadata] of a row"""
+        if row in self._added:
+            return json.dumps(self._added[row], ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        return bytes(self._records[self._offsets[row]:self._offsets[row + 1]])
+
+    def _chunk(self, row: int) -> StoredChunk:
+        text, metadata = self._added[row] if row in self._added else json.loads(self._record(row))
+        return StoredChunk(text, metadata)
+
+    def get_chunk(self, chunk_id: str) -> Optional[StoredChunk]:
+        """Stored chunk by ID (read from the records file on demand)"""
+        with self._lock:
+            row = self._rows.get(chunk_id)
+            return self._chunk(row) if row is not None else None
+
+    @property
+    def size(self) -> int:
+        return int(self._live.sum())
+
+    def _matrix(self) -> np.ndarray:
+        """All rows (persisted + pending); pending rows are folded in once per write burst"""
+        if self._pending:
+            parts = ([self._vectors] if self._vectors is not None and len(self._vectors) else []) + self._pending
+            self._vectors = np.ascontiguousarray(np.concatenate(parts).astype(np.float32, copy=False))
+            self._pending = []
+        if self._vectors is None:
+            return np.zeros((0, 0), dtype=np.float32)
+        return self._vectors
+
+    def add_embeddings(self, ids: List[str], texts: List[str], metadatas: List[Dict[str, Any]], vectors: np.ndarray):
+        vectors = _normalize(np.asarray(vectors, dtype=np.float32))
+        with self._lock:
+            # Re-added IDs replace their old row
+            self.delete([cid for cid in ids if cid in self._rows])
+            start = len(self._ids)
+            self._pending.append(vectors)
+            self._ids.extend(ids)
+            for offset, (cid, text, metadata) in enumerate(zip(ids, texts, metadatas)):
+                self._rows[cid] = start + offset
+                self._added[start + offset] = (text, metadata)
+            self._live = np.concatenate([self._live, np.ones(len(ids), dtype=bool)])
+            self._dirty = self._dirty or bool(ids)
+        return ids
+
+    def add_documents(self, documents: List[Any], ids: List[str]) -> List[str]:
+        texts = [doc.page_content for doc in documents]
+        vectors = self.embedding_function.embed_documents(texts)
+        return self.add_embeddings(ids, texts, [dict(doc.metadata) for doc in documents], vectors)
+
+    def delete(self, ids: List[str]):
+        with self._lock:
+            for cid in ids:
+                row = self._rows.pop(cid, None)
+                if row is not None:
+                    self._live[row] = False
+                    self._added.pop(row, None)
+                    self._dirty = True
+
+    def update_metadata(self, ids: List[str], metadatas: List[Dict[str, Any]]):
+        """Replace the metadata of stored chunks (written out by the next persist)"""
+        with self._lock:
+            for cid, metadata in zip(ids, metadatas):
+                row = self._rows.get(cid)
+                if row is not None:
+                    self._added[row] = (self._chunk(row).page_content, metadata)
+                    self._dirty = True
+
+    def similarity_search_by_vector_with_scores(self, embedding: List[float], k: int = 4) -> List[tuple]:
+        """[(chunk, cosine similarity)] best first"""
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        with self._lock:
+            matrix = self._matrix()
+            live = self._live
+            if not len(matrix) or not live.any():
+                return []
+            scores = matrix @ query
+            scores = np.where(live, scores, -np.inf)
+            k = min(k, int(live.sum()))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [(self._chunk(row), float(scores[row])) for row in top]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4) -> List[StoredChunk]:
+        return [chunk for chunk, _ in self.similarity_search_by_vector_with_scores(embedding, k)]
+
+    def persist(self):
+        """Compact deleted rows and write a new generation (matrix and records first, sidecar last)"""
+        with self._lock:
+            if not self._dirty:
+                return
+            matrix = self._matrix()
+            keep = np.flatnonzero(self._live)
+            os.makedirs(self.directory, exist_ok=True)
+            generation = self._generation + 1
+            files = {
+                "vectors_file": f"vectors-{generation}.npy",
+                "records_file": f"records-{generation}.bin",
+                "offsets_file": f"offsets-{generation}.npy",
+            }
+            compacted = np.ascontiguousarray(matrix[keep]) if len(matrix) else np.zeros((0, 0), dtype=np.float32)
+            np.save(os.path.join(self.directory, files["vectors_file"]), compacted)
+
+            # Persisted records are copied as raw bytes, only new rows are encoded
+            offsets = np.zeros(len(keep) + 1, dtype=np.int64)
+            with open(os.path.join(self.directory, files["records_file"]), "wb") as f:
+                for i, row in enumerate(keep):
+                    record = self._record(row)
+                    f.write(record)
+                    offsets[i + 1] = offsets[i] + len(record)
+            np.save(os.path.join(self.directory, files["offsets_file"]), offsets)
+
+            tmp = os.path.join(self.directory, f"{META_FILE}.tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"generation": generation, **files, "ids": [self._ids[row] for row in keep]},
+                          f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp, os.path.join(self.directory, META_FILE))
+
+            if self._generation:
+                # Processes that still map them keep their pages until they reopen
+                for name in (f"vectors-{self._generation}.npy", f"records-{self._generation}.bin",
+                             f"offsets-{self._generation}.npy"):
+                    old_file = os.path.join(self.directory, name)
+                    if os.path.exists(old_file):
+                        os.remove(old_file)
+            self._open()
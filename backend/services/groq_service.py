@@ -2,15 +2,26 @@
 Groq Model Service - Using llama-3.3-70b-versatile with Instructor
 Provides structured, professional AI responses with enforced formatting
 """
-from groq import Groq
+from groq import Groq, DefaultHttpxClient
 import instructor
 import os
+import copy
+import time
 import asyncio
+import threading
+import contextvars
 from typing import Dict, Any, Optional, Union
 from dotenv import load_dotenv
 from pathlib import Path
 from functools import partial
 from .response_models import PatientResponse, ClinicalResponse, ResearchResponse
+from .provider_stats import ProviderStats, ModelProviderError, find_status_code, is_api_failure, is_client_error
+from .rate_limit_scheduler import RateLimitScheduler
+from .structured_output import completion_text, repair_structured_output
+from .llm_recorder import llm_recorder
+from .usage_tracker import add_usage, note_output_repair
+from .token_budget import token_budget
+from .prompts import PATIENT_MODE_PROMPT, DOCTOR_MODE_PROMPT, RESEARCHER_MODE_PROMPT
 
 # Load .env from backend directory (local dev only)
 try:
@@ -21,165 +32,12 @@ try:
 except:
     pass  # Skip on serverless - env vars come from platform
 
-
-PATIENT_MODE_PROMPT = """You are Kandih ToxWiki, a professional medical information system providing evidence-based responses.
-
-CRITICAL URL FORMATS (use these EXACT patterns):
-- PubMed: https://pubmed.ncbi.nlm.nih.gov/[PMID]/ (e.g., https://pubmed.ncbi.nlm.nih.gov/31167055/)
-- FDA: https://www.fda.gov/drugs/information-drug-class/[drug-name-lowercase] (e.g., https://www.fda.gov/drugs/information-drug-class/acetaminophen)
-- DailyMed: https://dailymed.nlm.nih.gov/dailymed/drugInfo.cfm?setid=[SETID]
-- NIH/NLM: https://www.ncbi.nlm.nih.gov/books/[ID]/
-- DOI: https://doi.org/[DOI] (e.g., https://doi.org/10.1056/NEJMra1807061)
-
-⚠️ CRITICAL REFERENCE RULES - NEVER VIOLATE:
-1. ONLY cite sources you KNOW are real and accurate
-2. If you cite PMID 31167055, the ONLY valid metadata is: Finnerup, N. B. (2019). Nonnarcotic Methods of Pain Management. The New England Journal of Medicine.
-3. DO NOT make up fake titles, authors, or journals to match a PMID
-4. If you don't know the exact reference details, use fewer citations rather than hallucinating
-5. Each PMID has ONE correct title/authors/journal - they cannot be changed
-6. VERIFY: Is this a real PubMed article? Does the title match the PMID? Do the authors match?
-7. When in doubt, cite only well-known sources like FDA drug labels or major review articles you're certain about
-
-FORMATTING RULES:
-1. Write in flowing, professional paragraphs - NO bullet points, NO emojis, NO markdown
-2. Use superscript citations [1], [2-3] at the end of sentences
-3. Group related citations together for cleaner reading
-4. Write in clear, accessible language for educated general readers
-5. NEVER assume patient has a condition - provide neutral educational information
-
-STRUCTURE:
-- Opening paragraph: Define the topic clearly
-- Mechanism paragraph: Explain how it works
-- Clinical use paragraph: Indications, dosing, practical information
-- Safety paragraph: Important safety information
-- Optional: Suggest ONE relevant follow-up question
-- References section with full formatting
-
-EXAMPLE:
-
-Paracetamol, also known as acetaminophen, is a widely used over-the-counter analgesic and antipyretic medication. It is one of the most commonly used pain relievers and fever reducers worldwide.[1-2]
-
-Acetaminophen works primarily by inhibiting cyclooxygenase pathways in the central nervous system, reducing prostaglandin production responsible for pain and fever.[3] Unlike nonsteroidal anti-inflammatory drugs, it lacks significant anti-inflammatory properties and does not inhibit platelet aggregation.[1]
-
-The medication is indicated for mild to moderate pain including headache, toothache, muscle aches, backache, arthritis pain, menstrual cramps, and common cold symptoms, as well as for fever reduction.[4] The typical adult therapeutic dose is 650-1000 mg every 4-6 hours, with a maximum daily dose of 4000 mg.[2]
-
-The primary safety concern is hepatotoxicity with excessive dosing. Acetaminophen has been a leading cause of acute liver failure in the United States.[1] Severe liver damage can occur with doses exceeding 4000 mg daily in healthy adults, or with lower doses in patients with liver disease or chronic alcohol use.[2-3]
-
-Would you like information about acetaminophen overdose management?
-
-References:
-[1] Finnerup, N. B. (2019). Nonnarcotic Methods of Pain Management. The New England Journal of Medicine, 380(25), 2440-2448. doi:10.1056/NEJMra1807061. PMID: 31167055. https://pubmed.ncbi.nlm.nih.gov/31167055/
-[2] Martinez-De la Torre, A., et al. (2020). High-Dose Acetaminophen Safety. JAMA Network Open, 3(10), e2022897. doi:10.1001/jamanetworkopen.2020.22897. PMID: 33021645. https://pubmed.ncbi.nlm.nih.gov/33021645/
-CRITICAL URL FORMATS (use these EXACT patterns):
-- PubMed: https://pubmed.ncbi.nlm.nih.gov/[PMID]/ (must end with /)
-- FDA: https://www.fda.gov/drugs/information-drug-class/[drug-name-lowercase] (lowercase, hyphens for spaces)
-- DailyMed: https://dailymed.nlm.nih.gov/dailymed/drugInfo.cfm?setid=[SETID]
-- Clinical trials: https://clinicaltrials.gov/study/[NCT-ID]
-- DOI links: https://doi.org/[DOI]
-
-⚠️ CRITICAL REFERENCE RULES - NEVER VIOLATE:
-1. ONLY cite real, verified sources - NO hallucinated references
-2. Each PMID has exactly ONE correct title, ONE set of authors, ONE journal
-3. If citing PMID 31167055: ONLY valid metadata is Finnerup NB, NEJM 2019, "Nonnarcotic Methods of Pain Management"
-4. DO NOT invent fake metadata to fill reference fields
-5. Better to have 3 accurate citations than 8 fake ones
-6. VERIFY: Does this PMID actually exist? Does the title match what I'm claiming?
-7. Use only sources you're absolutely certain about - major trials, FDA labels, landmark papers
-
-[3] Food and Drug Administration. (2024). Acetaminophen Information. Food and Drug Administration. https://www.fda.gov/drugs/information-drug-class/acetaminophen
-
-NEVER use emojis, "Key Points" sections, or markdown formatting."""
-
-
-DOCTOR_MODE_PROMPT = """You are Kandih ToxWiki, a clinical decision support system providing evidence-based medication information.
-
-FORMATTING RULES:
-1. Write in professional clinical paragraphs using appropriate medical terminology
-2. Use superscript citations [1], [2-3] at the end of sentences
-3. NO markdown formatting, NO emojis
-4. Integrate information into flowing prose
-
-STRUCTURE:
-- Clinical overview: Drug class, mechanism, primary indications
-- Mechanism of action: Detailed pharmacological pathway
-- Clinical efficacy: Dosing, administration, effectiveness data
-- Safety profile: Adverse effects, contraindications, drug interactions
-- Optional: Forward-looking clinical question
-- References with PMIDs
-
-EXAMPLE:
-
-Sildenafil citrate is an oral phosphodiesterase type 5 (PDE5) inhibitor approved for the treatment of erectile dysfunction and pulmonary arterial hypertension. It was the first effective oral therapy for erectile dysfunction, receiving FDA approval in 1998.[1]
-
-Sildenafil functions as a selective PDE5 inhibitor with approximately 4,000-fold selectivity for PDE5 compared to PDE3, though only 10-fold selectivity over PDE6 found in retinal photoreceptors.[2-3] During sexual stimulation, nitric oxide release in the corpus cavernosum activates guanylate cyclase, increasing cyclic GMP levels and causing smooth muscle relaxation with resultant penile blood inflow.[4]
-
-The recommended starting dose for erectile dysfunction is 50 mg taken approximately one hour before sexual activity, with dosing flexibility from 30 minutes to 4 hours beforehand.[4] Dose titration ranges from 25 mg to 100 mg based on efficacy and tolerability, with a maximum frequency of once daily.[4]
-
-CRITICAL URL FORMATS (use these EXACT patterns):
-- PubMed: https://pubmed.ncbi.nlm.nih.gov/[PMID]/ (ALWAYS include trailing slash)
-- PubMed Central: https://www.ncbi.nlm.nih.gov/pmc/articles/PMC[PMCID]/
-- FDA: https://www.fda.gov/drugs/information-drug-class/[drug-name-lowercase]
-- DOI: https://doi.org/[DOI] (e.g., https://doi.org/10.1056/NEJMra1807061)
-- ClinicalTrials: https://clinicaltrials.gov/study/[NCT-ID]
-- DrugBank: https://go.drugbank.com/drugs/[DB-ID]
-
-⚠️ CRITICAL REFERENCE RULES - NEVER VIOLATE:
-1. ZERO TOLERANCE for hallucinated or fake references
-2. Each PMID is locked to specific metadata: PMID 31167055 = Finnerup, N.B. (2019) "Nonnarcotic Methods of Pain Management" NEJM 380(25):2440-2448
-3. DO NOT invent authors, titles, or journals to match a PMID you don't know
-4. Prefer 3-4 verified citations over 6 uncertain ones
-5. If you cite a paper, you MUST know its exact title, authors, journal, and year
-6. Use landmark papers you're certain about: major RCTs, FDA approvals, Cochrane reviews
-7. VERIFY before citing: Is this real? Do all fields match the actual publication?
-
-Common adverse effects include headache, flushing, dyspepsia, nasal congestion, and transient visual disturbances, which are dose-dependent and generally well-tolerated.[2][5] Absolute contraindications include concurrent nitrate use due to potentially severe hypotension, and recent cardiovascular events within 6 months.[4]
-
-Would you like cardiovascular risk stratification guidelines for sexual activity in cardiac patients?
-
-References:
-[1] Shamloul, R., & Ghanem, H. (2013). Erectile Dysfunction. Lancet, 381(9861), 153-165. doi:10.1016/S0140-6736(12)60520-0. PMID: 23040455. https://pubmed.ncbi.nlm.nih.gov/23040455/
-[2] Cartledge, J., & Eardley, I. (1999). Sildenafil Expert Review. Expert Opinion on Pharmacotherapy, 1(1), 137-147. PMID: 11249556. https://pubmed.ncbi.nlm.nih.gov/11249556/
-[3] Food and Drug Administration. (2024). Sildenafil Citrate Information. Food and Drug Administration. https://www.fda.gov/drugs/information-drug-class/erectile-dysfunction
-
-NEVER provide specific treatment recommendations."""
-
-
-RESEARCHER_MODE_PROMPT = """You are Kandih ToxWiki, a clinical research analysis system specializing in pharmaceutical safety and translational medicine.
-
-FORMATTING RULES:
-1. Write in dense, technical paragraphs using advanced scientific terminology
-2. Use superscript citations [1], [2-4] at appropriate intervals
-3. NO markdown formatting
-4. Provide quantitative data (IC50, hazard ratios, p-values) where relevant
-5. Focus on mechanistic depth
-
-STRUCTURE:
-- Drug class overview: Molecular target, mechanism, pharmacological rationale
-- Pharmacology: Detailed mechanism, selectivity, PK/PD parameters
-- Clinical evidence: Trial data, efficacy endpoints
-- Safety profile: Adverse events, class effects, mechanistic basis
-- Special considerations: Drug interactions, genetic polymorphisms
-- Optional: Research gaps or analytical follow-up question
-- Complete academic references with DOIs
-
-EXAMPLE:
-
-Dipeptidyl peptidase-4 inhibitors function by prolonging the biological activity of incretin hormones GLP-1 and GIP through selective, competitive inhibition of the DPP-4 enzyme.[1] The class demonstrates weight neutrality and minimal intrinsic hypoglycemia risk due to the glucose-dependent nature of incretin-mediated insulin secretion.[2]
-
-DPP-4 is a ubiquitously expressed serine exopeptidase with substrate specificity for penultimate proline or alanine residues, present on lymphocyte surfaces, vascular endothelium, and in soluble form in plasma.[3] Beyond incretin degradation, DPP-4 participates in immune regulation, T-cell activation, and chemokine processing.[4]
-
-Large cardiovascular outcome trials (SAVOR-TIMI 53, EXAMINE, TECOS) have not demonstrated increased infection rates or major adverse cardiovascular events across the class.[5-7] However, agent-specific cardiovascular heterogeneity exists, with saxagliptin demonstrating a 27% relative increase in heart failure hospitalizations (HR 1.27, 95% CI 1.07-1.51, p=0.007) in SAVOR-TIMI 53,[5] a signal not replicated with sitagliptin or alogliptin at comparable follow-up durations.[6-7]
-
-All approved agents achieve greater than 80% DPP-4 inhibition at therapeutic doses, with plasma DPP-4 activity suppression correlating with HbA1c reduction of approximately 0.5-0.8% versus placebo in add-on therapy.[2]
-
-Future research priorities include clarifying pancreatitis signals and understanding the mechanistic basis for saxagliptin heart failure effects.
-
-References:
-[1] Dipeptidyl Peptidase 4 Inhibitors. Deacon CF. Nature Reviews Endocrinology. 2020;16(11):642-653. doi:10.1038/s41574-020-0399-8. https://pubmed.ncbi.nlm.nih.gov/32855537/
-[2] Sitagliptin Efficacy. Aroda VR, et al. Diabetes Care. 2006;29(12):2638-2643. https://pubmed.ncbi.nlm.nih.gov/17130196/
-[3] CD26/DPP-IV in T Cell Activation. Morimoto C, Schlossman SF. Immunology Today. 1998;19(5):228-235. https://pubmed.ncbi.nlm.nih.gov/9613041/
-
-Focus on mechanistic depth and quantitative evidence."""
+# Seconds a models-list probe result stays fresh before a background refresh
+GROQ_HEALTH_TTL_SECONDS = float(os.getenv("GROQ_HEALTH_TTL_SECONDS", "60"))
+GROQ_HEALTH_PROBE_TIMEOUT = float(os.getenv("GROQ_HEALTH_PROBE_TIMEOUT", "5"))
+# Time budget for one answer including rate-limit waits and retries
+GROQ_REQUEST_DEADLINE_SECONDS = float(os.getenv("GROQ_REQUEST_DEADLINE_SECONDS", "45"))
+GROQ_MAX_429_ATTEMPTS = int(os.getenv("GROQ_MAX_429_ATTEMPTS", "3"))
 
 
 class GroqModelService:
@@ -188,19 +46,35 @@ class GroqModelService:
     def __init__(self):
         self.api_key = os.getenv("GROQ_API_KEY")
         self.model_name = os.getenv("GROQ_MODEL", "llama-3.3-70b-versatile")
+        self.summary_model_name = os.getenv("GROQ_SUMMARY_MODEL", "llama-3.1-8b-instant")
         
         self.openfda_key = os.getenv("OPENFDA_API_KEY")
         self.ncbi_key = os.getenv("NCBI_API_KEY")
         
+        # Passive health from real calls + cached active probe
+        self.stats = ProviderStats("groq")
+        self._probe_result: Optional[Dict[str, Any]] = None
+        self._probe_lock = threading.Lock()
+        self._probe_running = False
+        # Budgets parsed from x-ratelimit-* / Retry-After headers on every response
+        self.rate_limits = RateLimitScheduler("groq", max_attempts=GROQ_MAX_429_ATTEMPTS)
+        
         is_vercel = os.getenv('VERCEL') == '1'
         
+        self.enabled = bool(self.api_key)
+        
         if not self.api_key:
             if not is_vercel:
                 print("⚠️  WARNING: GROQ_API_KEY not set")
             self.client = None
             self.instructor_client = None
         else:
-            self.client = Groq(api_key=self.api_key)
+            # SDK retries are disabled - rate_limits schedules retries with the header budgets
+            self.client = Groq(
+                api_key=self.api_key,
+                max_retries=0,
+                http_client=DefaultHttpxClient(event_hooks={"response": [self.rate_limits.httpx_hook]})
+            )
             self.instructor_client = instructor.from_groq(
                 self.client,
                 mode=instructor.Mode.JSON
@@ -218,7 +92,8 @@ class GroqModelService:
         max_tokens: int = 2000,
         temperature: float = 0.7,
         enable_tools: bool = False,
-        conversation_history: list = None
+        conversation_history: list = None,
+        conversation_summary: Optional[str] = None
     ) -> str:
         """Generate a structured, professionally formatted response"""
         user_query = query or question
@@ -228,6 +103,28 @@ class GroqModelService:
         if not self.instructor_client:
             return "Error: GROQ_API_KEY not configured"
         
+        try:
+            return await self.generate(
+                query=user_query,
+                context=context,
+                user_mode=user_mode,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                conversation_history=conversation_history,
+                conversation_summary=conversation_summary
+            )
+        except ModelProviderError as e:
+            return f"API error: {e}"
+    
+    def build_messages(
+        self,
+        user_query: str,
+        context: str = "",
+        user_mode: str = "patient",
+        conversation_history: list = None,
+        conversation_summary: Optional[str] = None
+    ) -> tuple:
+        """Build (messages, response_model) for a persona-specific request"""
         mode_config = {
             "patient": (PATIENT_MODE_PROMPT, PatientResponse),
             "doctor": (DOCTOR_MODE_PROMPT, ClinicalResponse),
@@ -247,78 +144,320 @@ Please provide a well-structured, educational response with proper citations and
         
         messages = [{"role": "system", "content": system_prompt}]
         
+        if conversation_summary:
+            messages.append({
+                "role": "system",
+                "content": f"Summary of the earlier conversation (for context only):\n{conversation_summary}"
+            })
+        
         if conversation_history and len(conversation_history) > 0:
-            messages.extend(conversation_history[-10:])
+            # Already windowed by the caller (memory_service.build_prompt_history)
+            messages.extend(conversation_history)
         
         messages.append({"role": "user", "content": user_content})
+        return messages, response_model
+    
+    async def generate(
+        self,
+        query: str = None,
+        question: str = None,
+        context: str = "",
+        user_mode: str = "patient",
+        max_tokens: int = 2000,
+        temperature: float = 0.7,
+        conversation_history: list = None,
+        conversation_summary: Optional[str] = None,
+        deadline: Optional[float] = None
+    ) -> str:
+        """
+        Generate a response, raising ModelProviderError on API-level failures
+        
+        Rate limits, outages, timeouts and rejected requests (bad key, forbidden
+        model, malformed request) are raised (no blind second send to Groq) so the
+        router can fail over. 429s are first retried by the rate-limit scheduler
+        while that still fits the deadline (absolute time.monotonic()). Only an
+        error carrying the model's output is worth more work: schema validation
+        failures are repaired locally first, and only output that can't be
+        salvaged costs a second, plain completion.
+        """
+        user_query = query or question
+        if not user_query:
+            raise ValueError("No question provided")
+        if not self.instructor_client:
+            raise ModelProviderError("GROQ_API_KEY not configured", provider="groq")
+        
+        messages, response_model = self.build_messages(
+            user_query, context, user_mode, conversation_history, conversation_summary
+        )
+        if deadline is None:
+            deadline = time.monotonic() + GROQ_REQUEST_DEADLINE_SECONDS
+        # Rough token reservation: ~4 chars per prompt token plus the completion budget
+        estimated_tokens = sum(len(str(m.get("content", ""))) for m in messages) // 4 + max_tokens
         
         try:
-            loop = asyncio.get_event_loop()
-            
-            structured_response = await loop.run_in_executor(
-                None,
-                partial(
+            structured_response = await self.rate_limits.run(
+                # instructor appends the schema to the system prompt in place, so every
+                # (429-retried) attempt gets its own copy of the original messages
+                lambda: self._execute(partial(
                     self.instructor_client.chat.completions.create,
                     model=self.model_name,
                     response_model=response_model,
-                    messages=messages,
+                    messages=copy.deepcopy(messages),
                     temperature=temperature,
-                    max_tokens=max_tokens
-                )
+                    max_tokens=max_tokens,
+                    max_retries=1
+                )),
+                deadline=deadline,
+                estimated_tokens=estimated_tokens
             )
             
             formatted_text = structured_response.to_plain_text()
             return formatted_text
-                    
+        
+        except ModelProviderError:
+            raise
         except Exception as e:
-            error_msg = str(e)
+            raw_text = completion_text(e)
+            if is_api_failure(e) or (raw_text is None and getattr(e, "last_completion", None) is None):
+                # No output to repair - a re-send would be rejected the same way
+                raise self._provider_error(e) from e
+            repaired, flags = repair_structured_output(raw_text, response_model)
+            if repaired is not None:
+                print(f"[GROQ] Repaired structured output locally: {', '.join(flags) or 'lenient parse'}")
+                note_output_repair("groq", flags or ["lenient_parse"])
+                return repaired.to_plain_text()
+            print(f"[GROQ] Structured output not repairable ({', '.join(flags)}), retrying without schema")
+            if self._finish_reason(getattr(e, "last_completion", None)) == "length":
+                # Validation failed because the JSON was cut off - the same budget would cut it off again
+                max_tokens = token_budget.retry_budget(max_tokens)
+                print(f"[GROQ] Structured output truncated, retrying with max_tokens={max_tokens}")
+        
+        # Output failed schema validation beyond repair - retry once without a schema
+        try:
+            completion = await self.rate_limits.run(
+                lambda: self._execute(partial(
+                    self.client.chat.completions.create,
+                    model=self.model_name,
+                    messages=copy.deepcopy(messages),
+                    temperature=temperature,
+                    max_tokens=max_tokens
+                )),
+                deadline=deadline,
+                estimated_tokens=estimated_tokens
+            )
+            return completion.choices[0].message.content
+        except ModelProviderError:
+            raise
+        except Exception as fallback_error:
+            raise self._provider_error(fallback_error) from fallback_error
+    
+    async def _execute(self, fn, health: bool = True):
+        """
+        Run one blocking SDK call in the executor, recording its outcome (health=False: usage only)
+
+        Usage is recorded by the worker thread (in the caller's context), so a call
+        whose awaiting task is cancelled - e.g. a losing hedge - is still accounted
+        when its completion arrives. Cancelled calls are not health samples.
+        """
+        loop = asyncio.get_event_loop()
+        started = time.monotonic()
+
+        def call():
             try:
-                loop = asyncio.get_event_loop()
-                completion = await loop.run_in_executor(
-                    None,
-                    partial(
-                        self.client.chat.completions.create,
-                        model=self.model_name,
-                        messages=messages,
-                        temperature=temperature,
-                        max_tokens=max_tokens
-                    )
-                )
-                return completion.choices[0].message.content
-            except:
-                return f"API error: {error_msg}"
+                result = fn()
+            except Exception as e:
+                # Validation failures still carry a real API completion
+                self._record_call(started, fn, getattr(e, "last_completion", None))
+                raise
+            self._record_call(started, fn, getattr(result, "_raw_response", result))
+            return result
+
+        try:
+            result = await loop.run_in_executor(None, contextvars.copy_context().run, call)
+        except Exception as e:
+            if health:
+                self._record_outcome(started, e)
+            raise
+        if health:
+            self._record_outcome(started)
+        return result
     
-    async def check_health(self) -> Dict[str, Any]:
-        """Check if Groq API is accessible"""
-        if not self.client:
-            return {
-                "status": "unhealthy",
-                "error": "GROQ_API_KEY not configured"
-            }
+    @staticmethod
+    def _finish_reason(completion) -> Optional[str]:
+        try:
+            return completion.choices[0].finish_reason
+        except (AttributeError, IndexError, TypeError):
+            return None
+    
+    def _record_call(self, started: float, fn, completion):
+        """Account the completion's tokens and log it for offline replay (LLM_RECORD_PATH)"""
+        if completion is None:
+            return
+        params = getattr(fn, "keywords", {})
+        try:
+            choice = completion.choices[0]
+        except (AttributeError, IndexError, TypeError):
+            return
+        add_usage(
+            "groq", params.get("model", self.model_name), getattr(completion, "usage", None),
+            finish_reason=choice.finish_reason, max_tokens=params.get("max_tokens")
+        )
+        if llm_recorder.enabled:
+            llm_recorder.record(
+                "groq", params.get("model", self.model_name), params.get("messages", []), params,
+                choice.message.content, (time.monotonic() - started) * 1000,
+                usage=getattr(completion, "usage", None), finish_reason=choice.finish_reason
+            )
+    
+    def _provider_error(self, error: BaseException) -> ModelProviderError:
+        """Wrap an SDK error so callers can route around it"""
+        return ModelProviderError(
+            str(error),
+            provider="groq",
+            status_code=find_status_code(error),
+            timeout="timeout" in type(error).__name__.lower()
+        )
+    
+    def _record_outcome(self, started: float, error: Optional[BaseException] = None):
+        """Feed passive health: API-level failures and rejected requests count against the provider"""
+        latency_ms = (time.monotonic() - started) * 1000
+        if error is None:
+            self.stats.record(latency_ms, ok=True)
+            return
+        # Schema validation failures (400s included) carry the model's output - the API
+        # answered fine; a revoked key, forbidden model or malformed request did not
+        rejected = is_client_error(error) and completion_text(error) is None
+        self.stats.record(
+            latency_ms,
+            ok=not (is_api_failure(error) or rejected),
+            status_code=find_status_code(error),
+            error=str(error)
+        )
+    
+    async def summarize_conversation(
+        self,
+        previous_summary: Optional[str],
+        messages: list,
+        max_tokens: int = 300
+    ) -> Optional[str]:
+        """
+        Fold older conversation turns into a short rolling summary
+
+        Returns None when the call fails or comes back empty, so the caller does not
+        mark the turns as covered.
+        """
+        if not self.client or not messages:
+            return None
+        
+        transcript = "\n".join(
+            f"{m.get('role', 'user').upper()}: {m.get('content', '')}" for m in messages
+        )
+        prompt_parts = []
+        if previous_summary:
+            prompt_parts.append(f"Existing summary:\n{previous_summary}")
+        prompt_parts.append(f"New conversation turns:\n{transcript}")
+        prompt_parts.append(
+            "Update the summary so it covers everything above. Keep drug names, doses, "
+            "conditions, the user's stated situation and any open questions. "
+            "Write at most 8 short sentences of plain text."
+        )
         
         try:
-            loop = asyncio.get_event_loop()
-            completion = await loop.run_in_executor(
-                None,
+            # Counted in usage and the recorder, but the smaller summary model's
+            # latency stays out of the provider health stats used for routing
+            completion = await self._execute(
                 partial(
                     self.client.chat.completions.create,
-                    model=self.model_name,
-                    messages=[{"role": "user", "content": "test"}],
-                    max_tokens=5
-                )
+                    model=self.summary_model_name,
+                    messages=[
+                        {"role": "system", "content": "You maintain a concise running summary of a medical information chat."},
+                        {"role": "user", "content": "\n\n".join(prompt_parts)}
+                    ],
+                    temperature=0.2,
+                    max_tokens=max_tokens
+                ),
+                health=False
             )
-            
-            return {
-                "status": "healthy",
-                "model": self.model_name,
-                "instructor": "enabled"
-            }
-                    
+            summary = (completion.choices[0].message.content or "").strip()
+            return summary or None
         except Exception as e:
+            print(f"[MEMORY] Summarization failed: {e}")
+            return None
+    
+    def _probe(self) -> Dict[str, Any]:
+        """Lightweight active probe: list models (no tokens, no completion quota)"""
+        started = time.monotonic()
+        try:
+            self.client.models.list(timeout=GROQ_HEALTH_PROBE_TIMEOUT)
+            result = {"status": "healthy"}
+        except Exception as e:
+            result = {"status": "unhealthy", "error": str(e)[:200]}
+        result["latency_ms"] = int((time.monotonic() - started) * 1000)
+        result["checked_at"] = time.time()
+        self._probe_result = result
+        return result
+    
+    def _refresh_probe_in_background(self):
+        """Start a probe thread unless one is already running"""
+        with self._probe_lock:
+            if self._probe_running:
+                return
+            self._probe_running = True
+        
+        def run():
+            try:
+                self._probe()
+            finally:
+                with self._probe_lock:
+                    self._probe_running = False
+        
+        threading.Thread(target=run, daemon=True).start()
+    
+    async def check_health(self, force_refresh: bool = False) -> Dict[str, Any]:
+        """
+        Check if Groq API is accessible
+        
+        Answers from passive stats and the cached probe without any network I/O;
+        a stale probe is refreshed in the background. force_refresh awaits a fresh probe
+        (used once at startup).
+        """
+        if not self.client:
             return {
                 "status": "unhealthy",
-                "error": str(e)
+                "error": "GROQ_API_KEY not configured"
             }
+        
+        if force_refresh:
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(None, self._probe)
+        
+        probe = self._probe_result
+        if probe is None or time.time() - probe["checked_at"] > GROQ_HEALTH_TTL_SECONDS:
+            self._refresh_probe_in_background()
+        
+        passive = self.stats.passive_status()
+        if passive is not None:
+            status = passive
+        elif probe is not None:
+            status = probe["status"]
+        else:
+            status = "unknown"
+        
+        result = {
+            "status": status,
+            "model": self.model_name,
+            "instructor": "enabled",
+            "probe": probe,
+            "passive": self.stats.snapshot(),
+            "rate_limits": self.rate_limits.snapshot()
+        }
+        if status != "healthy":
+            result["error"] = (
+                (probe or {}).get("error")
+                or self.stats.last_error
+                or "health probe pending"
+            )
+        return result
 
 
 groq_service = GroqModelService()
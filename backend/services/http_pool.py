@@ -0,0 +1,44 @@
+"""
+HTTP Pool - shared httpx.AsyncClient instances per event loop
+An AsyncClient's connections belong to the loop that opened them, and the serverless
+handlers create a fresh loop per request, so clients are cached per (loop, name)
+and dropped together with their loop
+"""
+import asyncio
+import threading
+import weakref
+from typing import Callable, Dict
+
+import httpx
+
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, httpx.AsyncClient]]" = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+def get_async_client(name: str, factory: Callable[[], httpx.AsyncClient]) -> httpx.AsyncClient:
+    """
+    Return the pooled client called `name` for the running loop, creating it with factory()
+
+    Must be called from inside a running event loop.
+    """
+    loop = asyncio.get_running_loop()
+    with _lock:
+        per_loop = _clients.setdefault(loop, {})
+        client = per_loop.get(name)
+        if client is None or client.is_closed:
+            client = factory()
+            per_loop[name] = client
+        return client
+
+
+async def close_async_clients():
+    """Close every pooled client of the running loop (call before closing the loop)"""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        per_loop = _clients.pop(loop, {})
+    for client in per_loop.values():
+        try:
+            await client.aclose()
+        except Exception as e:
+            print(f"[HTTP POOL] Closing client failed: {e}")
+
@@ -0,0 +1,106 @@
+"""
+Index Manifest - which files are in the RAG index, at which content hash, as which chunks
+Lets scripts/index_documents.py re-embed only new or changed files and delete the
+chunks of files that changed or disappeared
+"""
+import os
+import json
+import hashlib
+from typing import Dict, List, Optional, Tuple
+
+MANIFEST_VERSION = 1
+
+
+def file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class IndexManifest:
+    """
+    JSON manifest: {relative path: {sha256, size, mtime, chunk_ids, duplicates}}
+
+    chunk_ids are the chunks actually stored for the file; duplicates maps the IDs
+    of its chunks dropped as near-duplicates to the stored chunk kept instead.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.files: Dict[str, Dict] = {}
+        if os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("version") == MANIFEST_VERSION:
+                    self.files = data.get("files", {})
+            except Exception as e:
+                print(f"⚠ Ignoring unreadable manifest {path}: {e}")
+
+    def plan(self, files: Dict[str, str]) -> Tuple[Dict[str, str], Dict[str, str], List[str], List[str]]:
+        """
+        Compare files on disk ({relative path: absolute path}) with the manifest
+
+        Returns (new, changed, unchanged, removed); new and changed map the relative
+        path to its sha256. Files whose size and mtime match the manifest are not
+        re-hashed. An unchanged file whose dropped duplicates point at chunks of a
+        changed or removed file counts as changed: once those chunks are deleted its
+        content is only in the index again after it is re-indexed.
+        """
+        new, changed, unchanged = {}, {}, []
+        for rel, path in files.items():
+            entry = self.files.get(rel)
+            stat = os.stat(path)
+            if entry and entry.get("size") == stat.st_size and entry.get("mtime") == stat.st_mtime:
+                unchanged.append(rel)
+                continue
+            sha = file_sha256(path)
+            if entry is None:
+                new[rel] = sha
+            elif entry.get("sha256") != sha:
+                changed[rel] = sha
+            else:
+                # Touched but identical - just refresh the stat shortcut
+                entry["mtime"] = stat.st_mtime
+                entry["size"] = stat.st_size
+                unchanged.append(rel)
+        removed = [rel for rel in self.files if rel not in files]
+
+        deleted = {cid for rel in list(changed) + removed for cid in self.chunk_ids(rel)}
+        while deleted:
+            orphaned = [rel for rel in unchanged if set(self.duplicates(rel).values()) & deleted]
+            for rel in orphaned:
+                print(f"  ↻ {rel}: re-indexing, its near-duplicate chunks were kept by a changed or removed file")
+                unchanged.remove(rel)
+                changed[rel] = self.files[rel]["sha256"]
+            # Re-indexing deletes their chunks too, which may orphan further files
+            deleted = {cid for rel in orphaned for cid in self.chunk_ids(rel)}
+        return new, changed, unchanged, removed
+
+    def chunk_ids(self, rel: str) -> List[str]:
+        return list(self.files.get(rel, {}).get("chunk_ids", []))
+
+    def duplicates(self, rel: str) -> Dict[str, str]:
+        return dict(self.files.get(rel, {}).get("duplicates", {}))
+
+    def record(self, rel: str, path: str, sha256: str, chunk_ids: List[str], duplicates: Optional[Dict[str, str]] = None):
+        stat = os.stat(path)
+        self.files[rel] = {"sha256": sha256, "size": stat.st_size, "mtime": stat.st_mtime,
+                           "chunk_ids": chunk_ids, "duplicates": duplicates or {}}
+
+    def forget(self, rel: str):
+        self.files.pop(rel, None)
+
+    def save(self):
+        """Atomic write so an interrupted run never leaves a torn manifest"""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "files": self.files}, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
+
+    @property
+    def total_chunks(self) -> int:
+        return sum(len(entry.get("chunk_ids", [])) for entry in self.files.values())
@@ -1,6 +1,84 @@
+import os
+import re
+import asyncio
+import threading
 from sqlalchemy.orm import Session
 from ..db.models import Interaction, Reference
-from typing import List, Optional
+from typing import Iterable, List, Optional
+
+# user_modes answered straight from curated high-quality evidence (comma-separated, empty disables)
+FAST_PATH_MODES = {m.strip() for m in os.getenv("FAST_PATH_MODES", "patient").split(",") if m.strip()}
+# Longer questions usually ask something the curated entry doesn't cover
+FAST_PATH_MAX_WORDS = int(os.getenv("FAST_PATH_MAX_WORDS", "15"))
+# Generate a full LLM answer in the background and store it on the chat log
+FAST_PATH_ENRICH = os.getenv("FAST_PATH_ENRICH", "0") == "1"
+
+# The fast path only answers "does X interact with Y"-style questions...
+_INTERACTION_INTENT = re.compile(
+    r"\b(interact\w*|mix\w*|combin\w*|together|safe|okay|ok to|avoid|affect\w*"
+    r"|can i (?:eat|drink|have)|should i (?:eat|drink|have)"
+    r"|(?:take|taking|use|using|have|having|eat|eating|drink|drinking)\b.+\bwith)\b"
+)
+# ...or just name the pair: "simvastatin grapefruit", "simvastatin and grapefruit juice" (§ = a recognised name)
+_PAIR_ONLY = re.compile(
+    r"^§(?: (?:juice|foods?|products?))? (?:(?:with|and|plus|\+|&) )?§(?: (?:juice|foods?|products?))?(?: interactions?)?$"
+)
+# ...never ones about a dose taken, an overdose, symptoms or an emergency - those go to the model
+_NOT_FAST_PATH = re.compile(
+    r"\d|\b(overdos\w*|too (?:much|many)|took|taken|ate|drank|swallow\w*|poison\w*"
+    r"|emergency|hospital|er|911|ambulance|help|what (?:do|should) i do|dose|doses|dosage|mg|pills?|tablets?"
+    r"|symptom\w*|feel\w*|sick|pain\w*|hurt\w*|\w*aches?|sore|cramp\w*|muscle\w*|dizz\w*|vomit\w*|nause\w*|bleed\w*|rash|swell\w*|faint\w*"
+    r"|seizure\w*|breath\w*|chest|heart rate|palpitation\w*|unconscious|confus\w*|side effects?"
+    r"|reaction|allerg\w*|pregnan\w*|child|children|kid|baby|infant)\b"
+)
+
+
+def is_plain_interaction_question(text: str, names: Iterable[str] = ()) -> bool:
+    """
+    True for a general "does X interact with Y" question with no dose, symptom or
+    emergency; names (recognised drug and food names) also admit a bare pair
+
+    >>> is_plain_interaction_question("Can I take simvastatin with grapefruit?")
+    True
+    >>> is_plain_interaction_question("is grapefruit safe with simvastatin")
+    True
+    >>> is_plain_interaction_question("simvastatin grapefruit", ["simvastatin", "grapefruit"])
+    True
+    >>> is_plain_interaction_question("Simvastatin and grapefruit juice?", ["simvastatin", "grapefruit"])
+    True
+    >>> is_plain_interaction_question("simvastatin grapefruit")
+    False
+    >>> is_plain_interaction_question("I took 80 mg simvastatin with grapefruit and my muscles hurt")
+    False
+    >>> is_plain_interaction_question("why does simvastatin cause grapefruit problems", ["simvastatin", "grapefruit"])
+    False
+    """
+    text_l = " ".join(text.lower().split())
+    if _NOT_FAST_PATH.search(text_l):
+        return False
+    if _INTERACTION_INTENT.search(text_l):
+        return True
+    pair = text_l.rstrip("?.! ")
+    for name in sorted(set(names), key=len, reverse=True):
+        pair = re.sub(r"\b" + re.escape(name) + r"\b", "§", pair)
+    return bool(_PAIR_ONLY.match(pair))
+
+
+def _food_terms(inter: Interaction) -> List[str]:
+    """Words that signal the food side of an interaction: food groups plus the title after the dash"""
+    terms = []
+    for group in inter.food_groups or []:
+        term = str(group).replace("_", " ").lower()
+        terms.append(term)
+        if term.endswith("s"):
+            terms.append(term[:-1])
+    if inter.title and "—" in inter.title:
+        for part in re.split(r"\band\b|,", inter.title.split("—", 1)[1].lower()):
+            part = part.strip()
+            if len(part) > 3:
+                terms.append(part)
+    return terms
+
 
 class InteractionService:
     @staticmethod
@@ -60,12 +138,128 @@ class InteractionService:
                 matches.append(inter)
         return matches
 
+    @staticmethod
+    def to_evidence_dict(inter: Interaction) -> dict:
+        """Serialize an interaction (with references) to the evidence shape used in responses"""
+        refs = [{"id": r.id, "title": r.title, "url": r.url, "excerpt": r.excerpt}
+                for r in getattr(inter, 'references', []) or []]
+        return {
+            "id": inter.id, "drug_name": inter.drug_name, "title": inter.title,
+            "summary": inter.summary, "mechanism": inter.mechanism,
+            "food_groups": inter.food_groups, "recommended_actions": inter.recommended_actions,
+            "evidence_quality": inter.evidence_quality, "references": refs
+        }
+
+    @staticmethod
+    def find_high_confidence_match(db: Session, text: str) -> Optional[Interaction]:
+        """
+        Return the single curated high-quality interaction a short question is clearly about.
+
+        Both the drug name and one of its foods must appear as whole words, and the
+        question must be a plain interaction question (is_plain_interaction_question,
+        which also accepts the bare pair); anything ambiguous (zero or several
+        matches) returns None and goes to the LLM.
+        """
+        text_l = " ".join(text.lower().split())
+        if len(text_l.split()) > FAST_PATH_MAX_WORDS or _NOT_FAST_PATH.search(text_l):
+            return None
+
+        def mentions(term: str) -> bool:
+            return re.search(r"\b" + re.escape(term) + r"\b", text_l) is not None
+
+        candidates = db.query(Interaction).filter(Interaction.evidence_quality == 'high').all()
+        matches = [
+            inter for inter in candidates
+            if inter.drug_name and mentions(inter.drug_name)
+            and any(mentions(term) for term in _food_terms(inter))
+        ]
+        if len(matches) != 1:
+            return None
+        names = [matches[0].drug_name] + [term for term in _food_terms(matches[0]) if mentions(term)]
+        return matches[0] if is_plain_interaction_question(text_l, names) else None
+
+    @staticmethod
+    def build_fast_path_answer(db: Session, inter: Interaction) -> tuple[str, dict, dict]:
+        """
+        Deterministic answer for a matched interaction.
+
+        Returns (answer, provenance, evidence) - answer uses the same
+        paragraphs + "References:" layout as the LLM answers.
+        """
+        evidence = InteractionService.to_evidence_dict(inter)
+        # Evidence IDs go in the provenance, not the user-facing text
+        consumer_summary, evidence_ids = build_consumer_summary_from_evidence(db, [evidence], with_sources=False)
+
+        paragraphs = [" ".join(p for p in (inter.summary, inter.mechanism) if p)]
+        if consumer_summary:
+            paragraphs.append(consumer_summary)
+        if evidence["references"]:
+            citations = "".join(f"[{i}]" for i in range(1, len(evidence["references"]) + 1))
+            paragraphs[0] = f"{paragraphs[0]} {citations}"
+        answer = "\n\n".join(paragraphs)
+        if evidence["references"]:
+            answer += "\n\nReferences:\n" + "\n".join(
+                f"[{i}] {ref['title']}. {ref['url']}" for i, ref in enumerate(evidence["references"], start=1)
+            )
+
+        provenance = {"source": "evidence_fast_path", "evidence_ids": evidence_ids}
+        return answer, provenance, evidence
+
+    @staticmethod
+    async def enrich_fast_path_answer(chat_log_id: int, question: str, user_mode: str, fast_answer: str):
+        """Ask the LLM for a full answer (grounded on the fast one) and store it on the chat log"""
+        from ..db.database import SessionLocal
+        from ..db.models import ChatLog
+        from .model_router import model_service
+
+        try:
+            enriched = await model_service.generate_response(
+                question=question,
+                context=f"=== CURATED INTERACTION EVIDENCE ===\n{fast_answer}",
+                user_mode=user_mode
+            )
+        except Exception as e:
+            print(f"[FAST PATH] Enrichment failed: {e}")
+            return
+
+        db = SessionLocal()
+        try:
+            chat_log = db.query(ChatLog).filter(ChatLog.id == chat_log_id).first()
+            if chat_log:
+                metadata = dict(chat_log.extra_metadata or {})
+                metadata["enriched_answer"] = enriched
+                chat_log.extra_metadata = metadata
+                db.commit()
+                print(f"[FAST PATH] Stored enriched answer on chat log {chat_log_id}")
+        except Exception as e:
+            print(f"[FAST PATH] Saving enrichment failed: {e}")
+            db.rollback()
+        finally:
+            db.close()
+
+    @staticmethod
+    def schedule_enrichment(chat_log_id: int, question: str, user_mode: str, fast_answer: str):
+        """Run enrich_fast_path_answer in a background thread when FAST_PATH_ENRICH is on"""
+        if not FAST_PATH_ENRICH:
+            return
+        thread = threading.Thread(
+            target=lambda: asyncio.run(
+                InteractionService.enrich_fast_path_answer(chat_log_id, question, user_mode, fast_answer)
+            ),
+            daemon=True
+        )
+        thread.start()
+
 
 interaction_service = InteractionService()
 
-def build_consumer_summary_from_evidence(db: Session, evidence_list: List[dict], max_items: int = 2) -> tuple[str, list]:
+def build_consumer_summary_from_evidence(db: Session, evidence_list: List[dict], max_items: int = 2,
+                                         with_sources: bool = True) -> tuple[str, list]:
     """Deterministically build a short consumer-friendly summary from DB evidence.
 
+    with_sources=False leaves out the "Sources: <evidence ids>" suffix, for answers
+    that cite their references themselves.
+
     Returns (summary, evidence_ids_used)
     """
     def clean(s: Optional[str]) -> str:
@@ -112,7 +306,7 @@ def build_consumer_summary_from_evidence(db: Session, evidence_list: List[dict],
         sentences.append("Recommendation: " + "; ".join(recommendations))
 
     # Add provenance suffix with source indices
-    if ids:
+    if ids and with_sources:
         sentences.append("Sources: " + ", ".join([str(i) for i in ids]))
 
     full = " ".join(sentences).strip()
@@ -0,0 +1,105 @@
+"""
+LLM Recorder - append-only JSONL log of provider calls
+One compact line per completion (prompt hash, params, output, latency, token usage)
+so scripts/llm_replay_server.py can replay real traffic at realistic latencies
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+from typing import Any, Dict, Iterator, List, Optional
+
+# Empty disables recording
+LLM_RECORD_PATH = os.getenv("LLM_RECORD_PATH", "")
+# Full prompts can contain patient details - only the hash is stored unless enabled
+LLM_RECORD_MESSAGES = os.getenv("LLM_RECORD_MESSAGES", "0") == "1"
+
+# Request params worth keeping alongside the prompt hash
+RECORDED_PARAMS = ("temperature", "max_tokens", "top_p", "stream")
+
+
+def prompt_hash(model: str, messages: List[Dict[str, Any]]) -> str:
+    """Stable hash of (model, messages) used to match a replayed request to its recording"""
+    canonical = json.dumps(
+        {"model": model, "messages": [{"role": m.get("role"), "content": m.get("content")} for m in messages]},
+        sort_keys=True, separators=(",", ":"), ensure_ascii=False
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:32]
+
+
+def usage_dict(usage: Any) -> Optional[Dict[str, int]]:
+    """Normalize an SDK usage object or API usage dict to prompt/completion/total tokens"""
+    if usage is None:
+        return None
+    get = usage.get if isinstance(usage, dict) else lambda key: getattr(usage, key, None)
+    values = {key: get(key) for key in ("prompt_tokens", "completion_tokens", "total_tokens")}
+    if all(v is None for v in values.values()):
+        return None
+    return {key: int(v or 0) for key, v in values.items()}
+
+
+class LLMRecorder:
+    """Thread-safe JSONL appender; a no-op unless LLM_RECORD_PATH is set"""
+
+    def __init__(self, path: str = LLM_RECORD_PATH, record_messages: bool = LLM_RECORD_MESSAGES):
+        self.path = path
+        self.record_messages = record_messages
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def record(
+        self,
+        provider: str,
+        model: str,
+        messages: List[Dict[str, Any]],
+        params: Dict[str, Any],
+        output: Optional[str],
+        latency_ms: float,
+        usage: Any = None,
+        ttft_ms: Optional[float] = None,
+        finish_reason: Optional[str] = None
+    ):
+        """Append one call; never raises into the request path"""
+        if not self.enabled:
+            return
+        entry = {
+            "ts": round(time.time(), 3),
+            "provider": provider,
+            "model": model,
+            "prompt_hash": prompt_hash(model, messages),
+            "params": {k: params[k] for k in RECORDED_PARAMS if params.get(k) is not None},
+            "latency_ms": round(latency_ms, 1),
+            "ttft_ms": round(ttft_ms, 1) if ttft_ms is not None else None,
+            "usage": usage_dict(usage),
+            "finish_reason": finish_reason,
+            "output": output,
+        }
+        if self.record_messages:
+            entry["messages"] = messages
+        try:
+            line = json.dumps(entry, separators=(",", ":"), ensure_ascii=False)
+            with self._lock:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+        except Exception as e:
+            print(f"[RECORDER] Failed to write LLM recording: {e}")
+
+
+def load_recordings(path: str) -> Iterator[Dict[str, Any]]:
+    """Yield recorded calls from a JSONL file, skipping torn or malformed lines"""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+llm_recorder = LLMRecorder()
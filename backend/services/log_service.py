@@ -1,5 +1,7 @@
+from sqlalchemy import func
 from sqlalchemy.orm import Session
-from ..db.models import ChatLog, Session as SessionModel
+from ..db.models import ChatLog, LLMCall, Session as SessionModel
+from .usage_tracker import RequestUsage, estimate_cost
 from typing import List, Optional
 from datetime import datetime, timedelta
 
@@ -15,9 +17,14 @@ class LogService:
         user_id: Optional[str] = None,
         ip_address: Optional[str] = None,
         user_agent: Optional[str] = None,
-        extra_metadata: Optional[dict] = None
+        extra_metadata: Optional[dict] = None,
+        user_mode: Optional[str] = None,
+        usage: Optional[RequestUsage] = None
     ) -> ChatLog:
-        """Create a new chat log entry with tracking data"""
+        """Create a new chat log entry with tracking data and token usage"""
+        has_usage = usage is not None and usage.has_usage
+        if usage is not None and usage.output_repairs:
+            extra_metadata = {**(extra_metadata or {}), "structured_repair": usage.output_repairs}
         chat_log = ChatLog(
             session_id=session_id,
             user_id=user_id,
@@ -27,13 +34,35 @@ class LogService:
             response_time_ms=response_time_ms,
             ip_address=ip_address,
             user_agent=user_agent,
-            extra_metadata=extra_metadata
+            extra_metadata=extra_metadata,
+            user_mode=user_mode,
+            prompt_tokens=usage.prompt_tokens if has_usage else None,
+            completion_tokens=usage.completion_tokens if has_usage else None,
+            total_tokens=usage.total_tokens if has_usage else None
         )
         db.add(chat_log)
+        db.flush()
+        LogService.add_llm_calls(db, chat_log.id, usage)
         db.commit()
         db.refresh(chat_log)
         return chat_log
 
+    @staticmethod
+    def add_llm_calls(db: Session, chat_log_id: int, usage: Optional[RequestUsage]):
+        """Stage one llm_calls row per provider completion, so each is priced at its own model"""
+        if usage is None:
+            return
+        for call in usage.calls:
+            db.add(LLMCall(
+                chat_log_id=chat_log_id,
+                provider=call.get("provider"),
+                model=call.get("model"),
+                prompt_tokens=call.get("prompt_tokens") or 0,
+                completion_tokens=call.get("completion_tokens") or 0,
+                total_tokens=call.get("total_tokens") or 0,
+                finish_reason=call.get("finish_reason")
+            ))
+
     @staticmethod
     def get_chat_logs(
         db: Session,
@@ -126,4 +155,93 @@ class LogService:
             "last_active": session.last_active if session else None
         }
 
+    @staticmethod
+    def get_usage_stats(db: Session, days: int = 30) -> dict:
+        """
+        Token usage and estimated cost per day, user mode and model
+
+        Tokens and cost are summed per provider call (llm_calls), so a request that
+        failed over or was hedged is billed at each model's own rate. Older logs
+        without call rows fall back to their answering model (model_used).
+        """
+        cutoff = datetime.utcnow() - timedelta(days=days)
+        day = func.date(ChatLog.created_at)
+        call_rows = db.query(
+            day, ChatLog.user_mode, LLMCall.model,
+            func.count(func.distinct(ChatLog.id)),
+            func.count(LLMCall.id),
+            func.sum(LLMCall.prompt_tokens),
+            func.sum(LLMCall.completion_tokens),
+            func.sum(LLMCall.total_tokens)
+        ).join(LLMCall, LLMCall.chat_log_id == ChatLog.id).filter(
+            ChatLog.created_at >= cutoff
+        ).group_by(day, ChatLog.user_mode, LLMCall.model).all()
+
+        has_calls = db.query(LLMCall.id).filter(LLMCall.chat_log_id == ChatLog.id).exists()
+        legacy_rows = db.query(
+            day, ChatLog.user_mode, ChatLog.model_used,
+            func.count(ChatLog.id),
+            func.count(ChatLog.total_tokens),
+            func.sum(ChatLog.prompt_tokens),
+            func.sum(ChatLog.completion_tokens),
+            func.sum(ChatLog.total_tokens)
+        ).filter(
+            ChatLog.created_at >= cutoff, ~has_calls
+        ).group_by(day, ChatLog.user_mode, ChatLog.model_used).all()
+
+        mode_rows = db.query(
+            ChatLog.user_mode,
+            func.count(ChatLog.id),
+            func.count(ChatLog.total_tokens),
+            func.sum(ChatLog.prompt_tokens),
+            func.sum(ChatLog.completion_tokens),
+            func.sum(ChatLog.total_tokens),
+            func.avg(ChatLog.response_time_ms)
+        ).filter(ChatLog.created_at >= cutoff).group_by(ChatLog.user_mode).all()
+
+        by_mode = {}
+        for user_mode, requests, metered, prompt, completion, total, avg_ms in mode_rows:
+            total = int(total or 0)
+            by_mode[user_mode or "unknown"] = {
+                "requests": int(requests),
+                "metered_requests": int(metered),
+                "prompt_tokens": int(prompt or 0),
+                "completion_tokens": int(completion or 0),
+                "total_tokens": total,
+                "avg_total_tokens": round(total / metered, 1) if metered else None,
+                "avg_response_time_ms": round(float(avg_ms), 2) if avg_ms else None,
+                "estimated_cost_usd": 0.0,
+            }
+
+        # Per day/mode/model; "requests" counts the requests that called (or, for older
+        # logs, were answered by) the model, so a failover request counts once per model
+        daily = {}
+        for date, user_mode, model, requests, calls, prompt, completion, total in list(call_rows) + list(legacy_rows):
+            key = (str(date), user_mode or "unknown", model or "unknown")
+            entry = daily.setdefault(key, {
+                "date": key[0], "user_mode": key[1], "model": key[2], "requests": 0, "calls": 0,
+                "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0
+            })
+            entry["requests"] += int(requests)
+            entry["calls"] += int(calls)
+            entry["prompt_tokens"] += int(prompt or 0)
+            entry["completion_tokens"] += int(completion or 0)
+            entry["total_tokens"] += int(total or 0)
+
+        breakdown = sorted(daily.values(), key=lambda e: (e["date"], e["user_mode"], e["model"]))
+        by_model = {}
+        for entry in breakdown:
+            entry["estimated_cost_usd"] = estimate_cost(entry["model"], entry["prompt_tokens"], entry["completion_tokens"])
+            cost = entry["estimated_cost_usd"] or 0.0
+            agg = by_model.setdefault(entry["model"], {"requests": 0, "calls": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                                                       "total_tokens": 0, "estimated_cost_usd": 0.0})
+            for field in ("requests", "calls", "prompt_tokens", "completion_tokens", "total_tokens"):
+                agg[field] += entry[field]
+            agg["estimated_cost_usd"] = round(agg["estimated_cost_usd"] + cost, 6)
+            mode = by_mode.get(entry["user_mode"])
+            if mode is not None:
+                mode["estimated_cost_usd"] = round(mode["estimated_cost_usd"] + cost, 6)
+
+        return {"days": days, "by_mode": by_mode, "by_model": by_model, "daily": breakdown}
+
 log_service = LogService()
@@ -0,0 +1,145 @@
+"""
+Conversation Memory Service
+Keeps a rolling per-session summary of the turns that fall out of the recent window,
+so long sessions send summary + a few recent turns instead of the full transcript
+"""
+import os
+import asyncio
+from typing import List, Dict, Optional, Tuple
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+# Number of most recent history messages always sent verbatim
+MEMORY_RECENT_MESSAGES = int(os.getenv("MEMORY_RECENT_MESSAGES", "6"))
+# Upper bound on raw messages sent when the summary lags behind
+MEMORY_MAX_RAW_MESSAGES = int(os.getenv("MEMORY_MAX_RAW_MESSAGES", "20"))
+MEMORY_SUMMARY_MAX_CHARS = int(os.getenv("MEMORY_SUMMARY_MAX_CHARS", "2000"))
+# How long a request waits for its summary update after the answer is ready
+MEMORY_SUMMARY_TIMEOUT_SECONDS = float(os.getenv("MEMORY_SUMMARY_TIMEOUT_SECONDS", "4"))
+
+
+class ConversationMemoryService:
+    """Incremental summarization memory stored on the sessions row"""
+
+    def __init__(self):
+        self.recent_messages = MEMORY_RECENT_MESSAGES
+        self.max_raw_messages = MEMORY_MAX_RAW_MESSAGES
+
+    def load_summary(self, db: Session, session_id: str) -> Tuple[Optional[str], int]:
+        """
+        Load the stored summary for a session
+
+        Returns:
+            (summary, summarized_message_count) - (None, 0) if missing or columns not migrated
+        """
+        try:
+            row = db.execute(
+                text("SELECT conversation_summary, summarized_message_count FROM sessions WHERE session_id = :sid LIMIT 1"),
+                {"sid": session_id}
+            ).fetchone()
+        except Exception as e:
+            print(f"[MEMORY] Summary lookup failed: {e}")
+            db.rollback()
+            return None, 0
+
+        if not row or not row[0]:
+            return None, 0
+        return row[0], int(row[1] or 0)
+
+    def build_prompt_history(
+        self,
+        db: Session,
+        session_id: str,
+        conversation_history: List[Dict]
+    ) -> Tuple[Optional[str], List[Dict]]:
+        """
+        Split the full history into (summary, raw messages to send)
+
+        Everything not yet covered by the summary is sent verbatim (up to the
+        MEMORY_MAX_RAW_MESSAGES cap), so a lagging or failed summarization costs
+        tokens rather than context.
+        """
+        history = conversation_history or []
+        summary, covered = self.load_summary(db, session_id) if db is not None else (None, 0)
+
+        # Summary refers to a longer history than we were sent - don't trust it
+        if covered > len(history):
+            summary, covered = None, 0
+
+        start = min(covered, max(len(history) - self.recent_messages, 0))
+        raw = history[start:][-self.max_raw_messages:]
+        return summary, raw
+
+    async def update_summary(self, session_id: str, conversation_history: List[Dict]):
+        """Fold messages that left the recent window into the session summary"""
+        from ..db.database import SessionLocal
+        from .model_router import model_service
+
+        history = conversation_history or []
+        cutoff = len(history) - self.recent_messages
+        if cutoff <= 0:
+            return
+
+        db = SessionLocal()
+        try:
+            summary, covered = self.load_summary(db, session_id)
+            if covered > cutoff:
+                summary, covered = None, 0
+            new_messages = history[covered:cutoff]
+            if not new_messages:
+                return
+
+            summarize = getattr(model_service, "summarize_conversation", None)
+            if summarize is None:
+                return
+            updated = await summarize(summary, new_messages)
+            if not updated or updated == summary:
+                # Nothing new was summarized; leave the turns uncovered so prompts keep them verbatim
+                print(f"[MEMORY] Summary for {session_id} not updated; {len(new_messages)} messages stay uncovered")
+                return
+
+            db.execute(
+                text("UPDATE sessions SET conversation_summary = :summary, summarized_message_count = :count WHERE session_id = :sid"),
+                {"summary": updated[:MEMORY_SUMMARY_MAX_CHARS], "count": cutoff, "sid": session_id}
+            )
+            db.commit()
+            print(f"[MEMORY] Summary for {session_id} now covers {cutoff} messages")
+        except Exception as e:
+            print(f"[MEMORY] Summary update failed: {e}")
+            db.rollback()
+        finally:
+            db.close()
+
+    def start_update(self, loop: asyncio.AbstractEventLoop, session_id: str,
+                     conversation_history: List[Dict]) -> Optional[asyncio.Task]:
+        """
+        Begin update_summary on the request's event loop, to run alongside answer generation
+
+        Serverless handlers are frozen once the response is sent, so the update
+        can't outlive the request; it folds in what left the window on earlier turns
+        while this turn's answer is generated, and finish_update() collects it.
+        Create it outside track_usage() so its tokens aren't billed to the answer.
+        """
+        if len(conversation_history or []) <= self.recent_messages:
+            return None
+        history = list(conversation_history)
+        return loop.create_task(asyncio.wait_for(self.update_summary(session_id, history), MEMORY_SUMMARY_TIMEOUT_SECONDS))
+
+    async def finish_update(self, task: Optional[asyncio.Task], cancel: bool = False):
+        """Wait for start_update's task (bounded by MEMORY_SUMMARY_TIMEOUT_SECONDS), or cancel it"""
+        if task is None:
+            return
+        if cancel:
+            task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        except asyncio.TimeoutError:
+            # Turns stay uncovered and are sent verbatim; the next request retries
+            print(f"[MEMORY] Summary update over {MEMORY_SUMMARY_TIMEOUT_SECONDS}s budget, retrying next turn")
+        except Exception as e:
+            print(f"[MEMORY] Summary update failed: {e}")
+
+
+memory_service = ConversationMemoryService()
@@ -1,13 +1,444 @@
 """
-Model Service - Using Groq SDK with Compound Model
+Model Router - latency-aware multi-provider routing
+Sends each request to the best healthy provider (Groq, DeepSeek) using rolling
+p50/p95 latency, error rate and 429 state, with a per-mode preference order
 """
 import os
+import time
+import asyncio
+import inspect
+import threading
+from typing import AsyncIterator, Dict, Any, List, Optional, Tuple
+
+from .groq_service import groq_service
+from .deepseek_service import deepseek_service
+from .provider_stats import ModelProviderError, watch_first_token
+from .usage_tracker import attempt_usage
+from .admission_controller import admission_controller, priority_for
+
+# Per-mode preference order, e.g. "patient:groq,deepseek;researcher:deepseek,groq"
+DEFAULT_PREFERENCE = os.getenv("MODEL_ROUTER_DEFAULT", "groq,deepseek")
+MODEL_ROUTER_PREFERENCES = os.getenv("MODEL_ROUTER_PREFERENCES", "")
+# Seconds to avoid a provider after a 429 when it sent no Retry-After
+RATE_LIMIT_COOLDOWN_SECONDS = float(os.getenv("MODEL_ROUTER_429_COOLDOWN", "30"))
+# Latency assumed for a provider with no recent samples
+DEFAULT_LATENCY_MS = float(os.getenv("MODEL_ROUTER_DEFAULT_LATENCY_MS", "4000"))
+# Score multiplier per step down the preference list (0.5 = 2nd choice must be ~1.5x faster to win)
+PREFERENCE_PENALTY = float(os.getenv("MODEL_ROUTER_PREFERENCE_PENALTY", "0.5"))
+
+# Overall time budget for one answer (Vercel kills the chat function at 60s)
+MODEL_REQUEST_DEADLINE_SECONDS = float(os.getenv("MODEL_REQUEST_DEADLINE_SECONDS", "45"))
+
+# Hedging: duplicate a slow request to the next provider, first valid answer wins
+MODEL_HEDGE_ENABLED = os.getenv("MODEL_HEDGE_ENABLED", "0").lower() in ("1", "true", "yes")
+MODEL_HEDGE_PERCENTILE = float(os.getenv("MODEL_HEDGE_PERCENTILE", "90"))
+MODEL_HEDGE_MIN_SAMPLES = int(os.getenv("MODEL_HEDGE_MIN_SAMPLES", "20"))
+MODEL_HEDGE_DEFAULT_DELAY_MS = float(os.getenv("MODEL_HEDGE_DEFAULT_DELAY_MS", "8000"))
+MODEL_HEDGE_MIN_DELAY_MS = float(os.getenv("MODEL_HEDGE_MIN_DELAY_MS", "1000"))
+# Hedge budget: each request earns this many hedge credits (0.1 = at most ~10% extra calls)
+MODEL_HEDGE_BUDGET_RATIO = float(os.getenv("MODEL_HEDGE_BUDGET_RATIO", "0.1"))
+MODEL_HEDGE_BUDGET_BURST = float(os.getenv("MODEL_HEDGE_BUDGET_BURST", "3"))
 
 # Only print in local development
 if os.getenv('VERCEL') != '1':
-    print("[Model Service] Using Groq SDK (groq/compound with tools)")
+    print("[Model Service] Using model router (Groq + DeepSeek failover)")
+
+
+def _parse_preferences(raw: str) -> Dict[str, List[str]]:
+    """Parse 'mode:a,b;mode2:b,a' into {mode: [a, b]}"""
+    preferences = {}
+    for part in raw.split(";"):
+        if ":" not in part:
+            continue
+        mode, providers = part.split(":", 1)
+        names = [p.strip() for p in providers.split(",") if p.strip()]
+        if mode.strip() and names:
+            preferences[mode.strip()] = names
+    return preferences
+
+
+class HedgeBudget:
+    """Token bucket capping hedged (duplicate) requests to a fraction of total traffic"""
+
+    def __init__(self, ratio: float = MODEL_HEDGE_BUDGET_RATIO, burst: float = MODEL_HEDGE_BUDGET_BURST):
+        self.ratio = ratio
+        self.burst = burst
+        self.credits = burst
+        self.sent = 0
+        self.won = 0
+        self.denied = 0
+        # What losing attempts cost: completions reported after they were abandoned
+        self.wasted_calls = 0
+        self.wasted_tokens = 0
+        self._lock = threading.Lock()
+
+    def on_request(self):
+        with self._lock:
+            self.credits = min(self.burst, self.credits + self.ratio)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self.credits >= 1.0:
+                self.credits -= 1.0
+                self.sent += 1
+                return True
+            self.denied += 1
+            return False
+
+    def on_wasted(self, usage: Dict[str, int]):
+        with self._lock:
+            self.wasted_calls += 1
+            self.wasted_tokens += usage.get("total_tokens") or usage.get("prompt_tokens", 0) + usage.get("completion_tokens", 0)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "credits": round(self.credits, 2), "sent": self.sent, "won": self.won, "denied": self.denied,
+            "wasted_calls": self.wasted_calls, "wasted_tokens": self.wasted_tokens,
+        }
+
+
+class ModelRouter:
+    """Drop-in replacement for a single model service that routes across providers"""
+
+    def __init__(self, providers: Dict[str, Any], preferences: Optional[Dict[str, List[str]]] = None, default_order: Optional[List[str]] = None):
+        self.providers = providers
+        self.preferences = preferences or {}
+        self.default_order = [p for p in (default_order or list(providers)) if p in providers]
+        self._cooldown_until: Dict[str, float] = {}
+        self._accepted_params: Dict[str, set] = {}
+        self.hedge_enabled = MODEL_HEDGE_ENABLED
+        self.hedge_budget = HedgeBudget()
+
+    # ------------------------------------------------------------------
+    # Compatibility attributes (callers used to hold a single service)
+    # ------------------------------------------------------------------
+    @property
+    def primary(self):
+        return self.providers[self.default_order[0]]
+
+    @property
+    def api_key(self) -> Optional[str]:
+        for name in self.default_order:
+            key = getattr(self.providers[name], "api_key", None)
+            if key:
+                return key
+        return None
+
+    @property
+    def enabled(self) -> bool:
+        return any(self._is_configured(p) for p in self.providers.values())
+
+    @property
+    def model_name(self) -> str:
+        return getattr(self.primary, "model_name", "unknown")
+
+    # ------------------------------------------------------------------
+    # Routing
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _is_configured(service) -> bool:
+        return bool(getattr(service, "enabled", False))
+
+    def _cooling_down(self, name: str) -> bool:
+        return self._cooldown_until.get(name, 0) > time.time()
+
+    def _score(self, name: str, rank: int) -> float:
+        """Lower is better: p95 latency inflated by preference rank and error rate"""
+        snapshot = self.providers[name].stats.snapshot()
+        latency = snapshot["p95_ms"] or DEFAULT_LATENCY_MS
+        error_rate = snapshot["error_rate"] or 0.0
+        return latency * (1 + PREFERENCE_PENALTY * rank) * (1 + 4 * error_rate)
+
+    def candidates(self, user_mode: str = "patient") -> List[str]:
+        """Providers to try, best first; unhealthy or rate-limited ones are kept as a last resort"""
+        order = self.preferences.get(user_mode, self.default_order)
+        order = [n for n in order if n in self.providers and self._is_configured(self.providers[n])]
+
+        def sort_key(item):
+            rank, name = item
+            degraded = self._cooling_down(name) or self.providers[name].stats.passive_status() == "unhealthy"
+            return (degraded, self._score(name, rank))
+
+        return [name for _, name in sorted(enumerate(order), key=sort_key)]
+
+    def _call_kwargs(self, name: str, service, kwargs: Dict[str, Any], method: str = "generate") -> Dict[str, Any]:
+        """Drop arguments a provider's generate() (or other method) doesn't accept"""
+        key = f"{name}.{method}"
+        if key not in self._accepted_params:
+            self._accepted_params[key] = set(inspect.signature(getattr(service, method)).parameters)
+        accepted = self._accepted_params[key]
+        return {k: v for k, v in kwargs.items() if k in accepted}
+
+    def _note_failure(self, name: str, error: ModelProviderError):
+        if error.rate_limited:
+            self._cooldown_until[name] = time.time() + (error.retry_after or RATE_LIMIT_COOLDOWN_SECONDS)
+
+    async def generate_response(
+        self,
+        query: str = None,
+        question: str = None,
+        context: str = "",
+        user_mode: str = "patient",
+        max_tokens: int = 2000,
+        temperature: float = 0.7,
+        conversation_history: list = None,
+        conversation_summary: Optional[str] = None,
+        hedge: Optional[bool] = None,
+        priority: Optional[int] = None,
+        **kwargs
+    ) -> str:
+        """
+        Generate a response on the best available provider, failing over on API errors
+
+        hedge overrides MODEL_HEDGE_ENABLED for this call. priority feeds the admission
+        controller (defaults to the mode's priority).
+
+        Raises:
+            ModelProviderError: when every configured provider failed (status_code is
+            429 if the last failure was a rate limit)
+        """
+        user_query = query or question
+        if not user_query:
+            return "Error: No question provided"
+
+        request = {
+            "query": user_query,
+            "question": user_query,
+            "context": context,
+            "user_mode": user_mode,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "conversation_history": conversation_history,
+            "conversation_summary": conversation_summary,
+            "deadline": time.monotonic() + MODEL_REQUEST_DEADLINE_SECONDS,
+        }
+
+        if priority is None:
+            priority = priority_for(user_mode)
+
+        # Raises AdmissionRejected when the LLM queue is saturated
+        async with admission_controller.slot(priority):
+            candidates = self.candidates(user_mode)
+            use_hedge = self.hedge_enabled if hedge is None else hedge
+            if use_hedge and len(candidates) > 1:
+                return await self._generate_hedged(candidates, request)
+            return await self._generate_sequential(candidates, request)
+
+    async def _call(self, name: str, request: Dict[str, Any]) -> str:
+        service = self.providers[name]
+        try:
+            return await service.generate(**self._call_kwargs(name, service, request))
+        except ModelProviderError as e:
+            self._note_failure(name, e)
+            print(f"[ROUTER] {name} failed ({e.status_code or 'error'}): {str(e)[:120]}")
+            raise
+
+    async def _generate_sequential(self, candidates: List[str], request: Dict[str, Any]) -> str:
+        """Try providers in order, failing over on API-level errors"""
+        last_error: Optional[ModelProviderError] = None
+        for name in candidates:
+            try:
+                return await self._call(name, request)
+            except ModelProviderError as e:
+                last_error = e
+
+        if last_error is None:
+            raise ModelProviderError("No model provider configured", provider="router")
+        raise last_error
+
+    def hedge_delay(self, name: str) -> Tuple[float, bool]:
+        """
+        Seconds to wait on the primary before hedging, and whether the wait is for its
+        first token: the TTFT p90 of a streaming provider, otherwise its full-completion
+        p90 (or the default), clamped
+        """
+        stats = self.providers[name].stats
+        if stats.ttft_samples() >= MODEL_HEDGE_MIN_SAMPLES:
+            return max(stats.ttft_percentile(MODEL_HEDGE_PERCENTILE), MODEL_HEDGE_MIN_DELAY_MS) / 1000.0, True
+        delay_ms = None
+        if stats.snapshot()["samples"] >= MODEL_HEDGE_MIN_SAMPLES:
+            delay_ms = stats.percentile(MODEL_HEDGE_PERCENTILE)
+        if delay_ms is None:
+            delay_ms = MODEL_HEDGE_DEFAULT_DELAY_MS
+        return max(delay_ms, MODEL_HEDGE_MIN_DELAY_MS) / 1000.0, False
+
+    async def _generate_hedged(self, candidates: List[str], request: Dict[str, Any]) -> str:
+        """
+        Start the primary; if it is slower than its adaptive threshold, send the same
+        request to the next provider and return whichever valid answer arrives first.
+
+        For a streaming primary (DeepSeek) the threshold is its time-to-first-token
+        tail: the hedge fires only if no token has arrived by then, never because a
+        flowing answer is long. Otherwise it applies to the full completion. Cancelling
+        a Groq loser drops its result, but the worker thread finishes the HTTP call in
+        the background; its tokens still reach the request's usage and are charged to
+        the hedge budget as waste.
+        """
+        self.hedge_budget.on_request()
+        primary, secondary, rest = candidates[0], candidates[1], candidates[2:]
+        abandoned = set()
+
+        loop = asyncio.get_running_loop()
+        first_token = asyncio.Event()
+
+        async def attempt(name: str) -> str:
+            def on_usage(usage: Dict[str, int]):
+                if name in abandoned:
+                    self.hedge_budget.on_wasted(usage)
+            def on_first_token():
+                if name == primary:
+                    loop.call_soon_threadsafe(first_token.set)
+            with attempt_usage(on_usage), watch_first_token(on_first_token):
+                return await self._call(name, request)
+
+        tasks = {asyncio.ensure_future(attempt(primary)): primary}
+
+        delay, until_first_token = self.hedge_delay(primary)
+        waiters = set(tasks)
+        if until_first_token:
+            waiters.add(asyncio.ensure_future(first_token.wait()))
+        done, _ = await asyncio.wait(waiters, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+        for waiter in waiters - set(tasks):
+            waiter.cancel()
+        if not done and self.hedge_budget.try_spend():
+            print(f"[ROUTER] {primary} slower than hedge threshold - hedging to {secondary}")
+            tasks[asyncio.ensure_future(attempt(secondary))] = secondary
+
+        last_error: Optional[ModelProviderError] = None
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                error = task.exception()
+                if error is None and (task.result() or "").strip():
+                    winner = tasks[task]
+                    for loser in pending:
+                        loser.cancel()
+                        abandoned.add(tasks[loser])
+                        # Its elapsed time is censored (the call never finished): not a latency sample
+                        self.providers[tasks[loser]].stats.record_cancelled()
+                    if winner != primary:
+                        self.hedge_budget.won += 1
+                    return task.result()
+                if isinstance(error, ModelProviderError):
+                    last_error = error
+                elif error is not None:
+                    for other in pending:
+                        other.cancel()
+                    raise error
+
+        # Every hedged attempt failed - fall back to the remaining providers
+        remaining = rest if secondary in tasks.values() else [secondary] + rest
+        if remaining:
+            return await self._generate_sequential(remaining, request)
+        raise last_error or ModelProviderError("All model providers failed", provider="router")
+
+    async def stream_response(
+        self,
+        query: str = None,
+        question: str = None,
+        context: str = "",
+        user_mode: str = "patient",
+        max_tokens: int = 2000,
+        temperature: float = 0.7,
+        conversation_history: list = None,
+        conversation_summary: Optional[str] = None,
+        priority: Optional[int] = None
+    ) -> AsyncIterator[str]:
+        """
+        Stream an answer from the best provider
+
+        Providers without stream_response yield their full answer as one chunk.
+        Failover only happens before the first chunk - a stream that breaks
+        mid-answer raises ModelProviderError to the caller.
+        """
+        user_query = query or question
+        if not user_query:
+            raise ValueError("No question provided")
+
+        request = {
+            "query": user_query,
+            "question": user_query,
+            "context": context,
+            "user_mode": user_mode,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "conversation_history": conversation_history,
+            "conversation_summary": conversation_summary,
+            "deadline": time.monotonic() + MODEL_REQUEST_DEADLINE_SECONDS,
+        }
+        if priority is None:
+            priority = priority_for(user_mode)
+
+        async with admission_controller.slot(priority):
+            last_error: Optional[ModelProviderError] = None
+            for name in self.candidates(user_mode):
+                service = self.providers[name]
+                if not hasattr(service, "stream_response"):
+                    try:
+                        yield await self._call(name, request)
+                        return
+                    except ModelProviderError as e:
+                        last_error = e
+                        continue
+
+                streamed = False
+                try:
+                    async for chunk in service.stream_response(**self._call_kwargs(name, service, request, "stream_response")):
+                        streamed = True
+                        yield chunk
+                    return
+                except ModelProviderError as e:
+                    self._note_failure(name, e)
+                    print(f"[ROUTER] {name} stream failed ({e.status_code or 'error'}): {str(e)[:120]}")
+                    if streamed:
+                        raise
+                    last_error = e
+
+            raise last_error or ModelProviderError("No model provider configured", provider="router")
+
+    async def summarize_conversation(self, previous_summary, messages, max_tokens: int = 300):
+        """Delegate summarization to the first configured provider that supports it (None if none did)"""
+        for name in self.default_order:
+            service = self.providers[name]
+            if self._is_configured(service) and hasattr(service, "summarize_conversation"):
+                return await service.summarize_conversation(previous_summary, messages, max_tokens=max_tokens)
+        return None
+
+    async def check_health(self, force_refresh: bool = False) -> Dict[str, Any]:
+        """Aggregate provider health; healthy if any configured provider is usable"""
+        providers = {}
+        for name, service in self.providers.items():
+            if not self._is_configured(service):
+                providers[name] = {"status": "not_configured"}
+                continue
+            providers[name] = await service.check_health(force_refresh=force_refresh)
+            providers[name]["cooling_down"] = self._cooling_down(name)
+
+        statuses = [p["status"] for p in providers.values()]
+        if "healthy" in statuses:
+            status = "healthy"
+        elif "unknown" in statuses:
+            status = "unknown"
+        else:
+            status = "unhealthy"
+
+        result = {"status": status, "providers": providers}
+        if self.hedge_enabled:
+            result["hedging"] = self.hedge_budget.snapshot()
+        admission = admission_controller.metrics()
+        result["admission"] = {k: admission[k] for k in ("in_flight", "queued", "admitted", "rejected")}
+        if status != "healthy":
+            errors = [p.get("error") for p in providers.values() if p.get("error")]
+            result["error"] = errors[0] if errors else "no healthy model provider"
+        return result
+
 
-from .groq_service import groq_service as model_service
+model_service = ModelRouter(
+    providers={"groq": groq_service, "deepseek": deepseek_service},
+    preferences=_parse_preferences(MODEL_ROUTER_PREFERENCES),
+    default_order=[p.strip() for p in DEFAULT_PREFERENCE.split(",") if p.strip()]
+)
 
 # Export the active model service
-__all__ = ["model_service"]
+__all__ = ["model_service", "ModelRouter"]
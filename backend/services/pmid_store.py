@@ -0,0 +1,258 @@
+"""
+PMID Store - local SQLite copy of PubMed article metadata
+Filled from every PubMedService fetch and bulk-loadable from the PubMed baseline
+(scripts/load_pubmed_baseline.py), so cited references can be checked against
+real metadata without a network call on the request path
+"""
+import os
+import re
+import time
+import sqlite3
+import threading
+import unicodedata
+from difflib import SequenceMatcher
+from typing import Any, Dict, Iterable, List, Optional
+
+PMID_STORE_PATH = os.getenv(
+    "PMID_STORE_PATH",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "../pmid-store.sqlite"))
+)
+# Empty path or "0" disables the store (e.g. read-only serverless filesystems)
+PMID_STORE_ENABLED = os.getenv("PMID_STORE_ENABLED", "1") == "1" and bool(PMID_STORE_PATH)
+# Normalized title similarity (0-1) a citation needs to count as the same article
+PMID_TITLE_MATCH_THRESHOLD = float(os.getenv("PMID_TITLE_MATCH_THRESHOLD", "0.85"))
+# Online-first and print years often differ by one
+PMID_YEAR_TOLERANCE = int(os.getenv("PMID_YEAR_TOLERANCE", "1"))
+
+# SQLite's default limit on host parameters is 999
+_LOOKUP_BATCH = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS articles (
+    pmid TEXT PRIMARY KEY,
+    doi TEXT,
+    title TEXT,
+    authors TEXT,
+    journal TEXT,
+    year INTEGER,
+    volume_issue TEXT,
+    pages TEXT,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_articles_doi ON articles (lower(doi));
+"""
+
+_COLUMNS = ("pmid", "doi", "title", "authors", "journal", "year", "volume_issue", "pages")
+
+
+def normalize_doi(doi: Optional[str]) -> Optional[str]:
+    """Lowercase bare DOI ("https://doi.org/10.1/X" -> "10.1/x")"""
+    if not doi:
+        return None
+    doi = doi.strip().lower()
+    doi = re.sub(r"^(https?://)?(dx\.)?doi\.org/", "", doi)
+    doi = re.sub(r"^doi:\s*", "", doi)
+    return doi.rstrip(".") or None
+
+
+def normalize_title(title: Optional[str]) -> str:
+    """Accent-, case- and punctuation-insensitive title for comparison"""
+    if not title:
+        return ""
+    title = unicodedata.normalize("NFKD", title)
+    title = "".join(c for c in title if not unicodedata.combining(c)).lower()
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", title).split())
+
+
+def first_author_surname(authors: Any) -> str:
+    """Normalized surname of the first author ("Smith, J, Doe, A" or ["Smith J", ...])"""
+    if isinstance(authors, (list, tuple)):
+        authors = authors[0] if authors else ""
+    if not authors:
+        return ""
+    first = str(authors).split(",")[0].strip()
+    # "Smith J" / "Smith JA" - drop trailing initials
+    parts = first.split()
+    if len(parts) > 1 and parts[-1].isupper() and len(parts[-1]) <= 3:
+        first = " ".join(parts[:-1])
+    return normalize_title(first)
+
+
+def title_similarity(a: Optional[str], b: Optional[str]) -> float:
+    a, b = normalize_title(a), normalize_title(b)
+    if not a or not b:
+        return 0.0
+    if a == b:
+        return 1.0
+    return SequenceMatcher(None, a, b, autojunk=False).ratio()
+
+
+def title_matches(cited: Optional[str], stored: Optional[str], threshold: float = PMID_TITLE_MATCH_THRESHOLD) -> bool:
+    """
+    Whether a cited title names the stored article
+
+    Titles parsed from citation lines may run on into the journal ("Title.
+    Journal, 12(3)") since a title can itself contain ". ", so the cited text is
+    also compared by its leading part the length of the stored title.
+    """
+    if title_similarity(cited, stored) >= threshold:
+        return True
+    cited, stored = normalize_title(cited), normalize_title(stored)
+    if not cited or not stored or len(cited) <= len(stored):
+        return False
+    return SequenceMatcher(None, cited[:len(stored)], stored, autojunk=False).ratio() >= threshold
+
+
+def _year(value: Any) -> Optional[int]:
+    match = re.search(r"\d{4}", str(value)) if value is not None else None
+    return int(match.group()) if match else None
+
+
+class PMIDStore:
+    """Thread-safe SQLite store keyed by PMID with a DOI index"""
+
+    def __init__(self, path: str = PMID_STORE_PATH, enabled: bool = PMID_STORE_ENABLED):
+        self.path = path
+        self.enabled = enabled
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        """Open lazily; a store that cannot be opened disables itself"""
+        if self._conn is not None or not self.enabled:
+            return self._conn
+        try:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        except Exception as e:
+            print(f"[PMID] Store unavailable at {self.path}: {e}")
+            self.enabled = False
+        return self._conn
+
+    def upsert_articles(self, articles: Iterable[Dict]) -> int:
+        """Insert or refresh article dictionaries (pubmed_service format); returns rows written"""
+        now = time.time()
+        rows = [
+            (str(a["pmid"]), a.get("doi"), a.get("title"), a.get("authors"), a.get("journal"),
+             a.get("year"), a.get("volume_issue"), a.get("pages"), now)
+            for a in articles if a and a.get("pmid")
+        ]
+        if not rows:
+            return 0
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return 0
+            try:
+                with conn:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO articles "
+                        "(pmid, doi, title, authors, journal, year, volume_issue, pages, updated_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        rows
+                    )
+            except Exception as e:
+                print(f"[PMID] Upsert failed: {e}")
+                return 0
+        return len(rows)
+
+    def delete(self, pmids: Iterable[str]) -> int:
+        """Drop PMIDs (baseline update files retract citations)"""
+        pmids = [(str(p),) for p in pmids]
+        with self._lock:
+            conn = self._connect()
+            if conn is None or not pmids:
+                return 0
+            with conn:
+                conn.executemany("DELETE FROM articles WHERE pmid = ?", pmids)
+        return len(pmids)
+
+    def _select(self, column: str, values: List[str]) -> List[Dict]:
+        """Rows whose column (an indexed expression) is in values"""
+        rows = []
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return []
+            for start in range(0, len(values), _LOOKUP_BATCH):
+                batch = values[start:start + _LOOKUP_BATCH]
+                rows.extend(conn.execute(
+                    f"SELECT {', '.join(_COLUMNS)} FROM articles "
+                    f"WHERE {column} IN ({', '.join('?' * len(batch))})",
+                    batch
+                ).fetchall())
+        return [
+            {**dict(zip(_COLUMNS, row)), "url": f"https://pubmed.ncbi.nlm.nih.gov/{row[0]}/"}
+            for row in rows
+        ]
+
+    def get_many(self, pmids: Iterable[str] = (), dois: Iterable[str] = ()) -> Dict[str, Dict]:
+        """Articles keyed by PMID and by normalized DOI, one query per 500 keys"""
+        pmids = list(dict.fromkeys(str(p).strip() for p in pmids if p))
+        dois = list(dict.fromkeys(d for d in (normalize_doi(d) for d in dois) if d))
+        found = {}
+        for article in (self._select("pmid", pmids) if pmids else []) + (self._select("lower(doi)", dois) if dois else []):
+            found[article["pmid"]] = article
+            if article.get("doi"):
+                found[normalize_doi(article["doi"])] = article
+        return found
+
+    def verify_references(self, references: List[Dict], articles: Optional[Dict[str, Dict]] = None) -> List[Dict]:
+        """
+        Check cited references against stored metadata in one batched lookup
+
+        Each reference (pmid and/or doi, title, authors, year) gets a result with
+        status "verified", "mismatch" (with the disagreeing fields) or "unknown"
+        (not in the store) and, when found, the stored record. Articles fetched
+        elsewhere (by PMID) can be passed in to be checked against as well.
+        """
+        known = self.get_many(
+            pmids=[r.get("pmid") for r in references],
+            dois=[r.get("doi") for r in references]
+        )
+        for article in (articles or {}).values():
+            known[article["pmid"]] = article
+            if article.get("doi"):
+                known[normalize_doi(article["doi"])] = article
+        results = []
+        for ref in references:
+            pmid = str(ref.get("pmid") or "").strip()
+            record = known.get(pmid) or known.get(normalize_doi(ref.get("doi")) or "")
+            if record is None:
+                results.append({"reference": ref, "status": "unknown", "mismatches": [], "record": None})
+                continue
+
+            mismatches = []
+            if pmid and pmid != record["pmid"]:
+                # DOI points at a different PMID than the one cited
+                mismatches.append("pmid")
+            if ref.get("title") and not title_matches(ref["title"], record["title"]):
+                mismatches.append("title")
+            cited_author, stored_author = first_author_surname(ref.get("authors")), first_author_surname(record["authors"])
+            if cited_author and stored_author and cited_author != stored_author:
+                mismatches.append("authors")
+            cited_year, stored_year = _year(ref.get("year")), record.get("year")
+            if cited_year and stored_year and abs(cited_year - stored_year) > PMID_YEAR_TOLERANCE:
+                mismatches.append("year")
+
+            results.append({
+                "reference": ref,
+                "status": "mismatch" if mismatches else "verified",
+                "mismatches": mismatches,
+                "record": record,
+            })
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return {"enabled": False}
+            count = conn.execute("SELECT COUNT(*) FROM articles").fetchone()[0]
+        return {"enabled": True, "path": self.path, "articles": count}
+
+
+pmid_store = PMIDStore()
@@ -0,0 +1,193 @@
+"""
+Provider Stats - rolling outcome window for model providers
+Passive health and latency percentiles derived from real calls, no extra API traffic
+"""
+import os
+import time
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Any, Iterator, List, Optional
+
+PROVIDER_STATS_WINDOW = int(os.getenv("PROVIDER_STATS_WINDOW", "200"))
+PROVIDER_STATS_WINDOW_SECONDS = float(os.getenv("PROVIDER_STATS_WINDOW_SECONDS", "300"))
+PASSIVE_MIN_SAMPLES = int(os.getenv("PASSIVE_HEALTH_MIN_SAMPLES", "3"))
+PASSIVE_MAX_ERROR_RATE = float(os.getenv("PASSIVE_HEALTH_MAX_ERROR_RATE", "0.5"))
+PASSIVE_MAX_CONSECUTIVE_FAILURES = int(os.getenv("PASSIVE_HEALTH_MAX_CONSECUTIVE_FAILURES", "3"))
+
+
+def find_status_code(error: BaseException) -> Optional[int]:
+    """Return the HTTP status code carried by an SDK/httpx error (or its cause), if any"""
+    seen = set()
+    current = error
+    while current is not None and id(current) not in seen:
+        seen.add(id(current))
+        status = getattr(current, "status_code", None)
+        if status is None and getattr(current, "response", None) is not None:
+            status = getattr(current.response, "status_code", None)
+        if isinstance(status, int):
+            return status
+        # Wrappers like instructor's retry exception carry the original error as first arg
+        wrapped = current.args[0] if current.args and isinstance(current.args[0], BaseException) else None
+        current = wrapped or current.__cause__ or current.__context__
+    return None
+
+
+def is_api_failure(error: BaseException) -> bool:
+    """True for rate limits, 5xx, connection and timeout errors (not schema/validation problems)"""
+    status_code = find_status_code(error)
+    if status_code is not None:
+        return status_code == 429 or status_code >= 500
+    current, seen = error, set()
+    while current is not None and id(current) not in seen:
+        seen.add(id(current))
+        name = type(current).__name__.lower()
+        if "connection" in name or "timeout" in name:
+            return True
+        wrapped = current.args[0] if current.args and isinstance(current.args[0], BaseException) else None
+        current = wrapped or current.__cause__ or current.__context__
+    return False
+
+
+def is_client_error(error: BaseException) -> bool:
+    """True for 4xx responses other than 429: bad key, forbidden model, malformed request"""
+    status_code = find_status_code(error)
+    return status_code is not None and 400 <= status_code < 500 and status_code != 429
+
+
+# Per-attempt listener for a streaming provider's first token (the router's hedge timer)
+_first_token_listener: contextvars.ContextVar[Optional[Callable[[], None]]] = contextvars.ContextVar("llm_first_token", default=None)
+
+
+@contextmanager
+def watch_first_token(listener: Callable[[], None]) -> Iterator[None]:
+    """Call listener when a provider streaming inside the block receives its first token"""
+    token = _first_token_listener.set(listener)
+    try:
+        yield
+    finally:
+        _first_token_listener.reset(token)
+
+
+def note_first_token():
+    """Streaming providers call this once per completion, when the first token arrives"""
+    listener = _first_token_listener.get()
+    if listener is not None:
+        listener()
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, int(round(q / 100.0 * (len(values) - 1)))))]
+
+
+class ModelProviderError(Exception):
+    """A provider call failed at the API level (rate limit, outage, timeout) - safe to fail over"""
+
+    def __init__(
+        self,
+        message: str,
+        provider: str,
+        status_code: Optional[int] = None,
+        retry_after: Optional[float] = None,
+        timeout: bool = False
+    ):
+        super().__init__(message)
+        self.provider = provider
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.timeout = timeout
+
+    @property
+    def rate_limited(self) -> bool:
+        return self.status_code == 429
+
+
+class ProviderStats:
+    """Thread-safe rolling window of (timestamp, latency_ms, ok, status_code, ttft_ms) samples"""
+
+    def __init__(self, name: str, window_size: int = PROVIDER_STATS_WINDOW, window_seconds: float = PROVIDER_STATS_WINDOW_SECONDS):
+        self.name = name
+        self.window_seconds = window_seconds
+        self._samples = deque(maxlen=window_size)
+        self._lock = threading.Lock()
+        self.consecutive_failures = 0
+        self.last_success_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.last_error_at: Optional[float] = None
+        # Calls abandoned before completing (e.g. losing hedges): their elapsed time is
+        # only a lower bound on latency, so they are counted but never sampled
+        self.cancelled = 0
+
+    def record_cancelled(self):
+        with self._lock:
+            self.cancelled += 1
+
+    def record(
+        self,
+        latency_ms: float,
+        ok: bool = True,
+        status_code: Optional[int] = None,
+        error: Optional[str] = None,
+        ttft_ms: Optional[float] = None
+    ):
+        """Record the outcome of one real provider call (ttft_ms: time to first token, if streamed)"""
+        now = time.time()
+        with self._lock:
+            self._samples.append((now, float(latency_ms), ok, status_code, ttft_ms))
+            if ok:
+                self.consecutive_failures = 0
+                self.last_success_at = now
+            else:
+                self.consecutive_failures += 1
+                self.last_error = (error or (f"HTTP {status_code}" if status_code else "error"))[:200]
+                self.last_error_at = now
+
+    def _recent(self):
+        cutoff = time.time() - self.window_seconds
+        with self._lock:
+            return [s for s in self._samples if s[0] >= cutoff]
+
+    def percentile(self, q: float, successful_only: bool = True) -> Optional[float]:
+        """Latency percentile (0-100) over the recent window"""
+        return _percentile([s[1] for s in self._recent() if s[2] or not successful_only], q)
+
+    def ttft_samples(self) -> int:
+        return sum(1 for s in self._recent() if s[2] and s[4] is not None)
+
+    def ttft_percentile(self, q: float) -> Optional[float]:
+        """Time-to-first-token percentile over recent successful streamed calls"""
+        return _percentile([s[4] for s in self._recent() if s[2] and s[4] is not None], q)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Summary of the recent window for health and routing decisions"""
+        recent = self._recent()
+        errors = [s for s in recent if not s[2]]
+        return {
+            "samples": len(recent),
+            "error_rate": round(len(errors) / len(recent), 3) if recent else None,
+            "rate_limited": sum(1 for s in recent if s[3] == 429),
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "ttft_p50_ms": self.ttft_percentile(50),
+            "ttft_p95_ms": self.ttft_percentile(95),
+            "consecutive_failures": self.consecutive_failures,
+            "cancelled": self.cancelled,
+            "last_success_at": self.last_success_at,
+            "last_error": self.last_error,
+            "last_error_at": self.last_error_at,
+        }
+
+    def passive_status(self) -> Optional[str]:
+        """'healthy'/'unhealthy' from real traffic, or None when there is too little recent data"""
+        if (self.consecutive_failures >= PASSIVE_MAX_CONSECUTIVE_FAILURES
+                and self.last_error_at and time.time() - self.last_error_at < self.window_seconds):
+            return "unhealthy"
+        recent = self._recent()
+        if len(recent) < PASSIVE_MIN_SAMPLES:
+            return None
+        error_rate = sum(1 for s in recent if not s[2]) / len(recent)
+        return "unhealthy" if error_rate > PASSIVE_MAX_ERROR_RATE else "healthy"
@@ -1,11 +1,268 @@
 """
 PubMed API Service - Query real articles from NCBI PubMed
+Sync methods (requests) for scripts, *_async methods on a pooled httpx client for
+request handlers; both share the query/PMID caches and the E-utilities rate limit
 """
 import os
+import time
+import asyncio
+import threading
 import requests
-from typing import List, Dict, Optional
+import httpx
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 from xml.etree import ElementTree as ET
 
+from .http_pool import get_async_client
+from .pmid_store import pmid_store
+
+PUBMED_CACHE_TTL_SECONDS = float(os.getenv("PUBMED_CACHE_TTL_SECONDS", "86400"))
+PUBMED_CACHE_MAX_ENTRIES = int(os.getenv("PUBMED_CACHE_MAX_ENTRIES", "5000"))
+# IDs per efetch; larger sets go through epost + WebEnv paging
+PUBMED_EFETCH_BATCH = int(os.getenv("PUBMED_EFETCH_BATCH", "200"))
+PUBMED_TIMEOUT_SECONDS = float(os.getenv("PUBMED_TIMEOUT_SECONDS", "15"))
+
+
+class TTLCache:
+    """Small thread-safe LRU cache with per-entry expiry"""
+
+    def __init__(self, max_entries: int = PUBMED_CACHE_MAX_ENTRIES, ttl: float = PUBMED_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._data), "hits": self.hits, "misses": self.misses}
+
+
+class RateLimiter:
+    """Spaces E-utilities calls (NCBI allows 3/s, 10/s with an API key) across threads and loops"""
+
+    def __init__(self, per_second: float):
+        self.interval = 1.0 / per_second
+        self._next_at = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Claim the next slot; returns seconds to wait before using it"""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_at)
+            self._next_at = slot + self.interval
+            return slot - now
+
+    def wait(self):
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    async def wait_async(self):
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def _text(elem) -> Optional[str]:
+    """Full text of an element including inline markup (<i>, <sup> in titles)"""
+    if elem is None:
+        return None
+    value = "".join(elem.itertext()).strip()
+    return value or None
+
+
+def parse_pubmed_article(article_elem) -> Optional[Dict]:
+    """
+    Parse one <PubmedArticle> into an article dictionary
+    
+    Uses direct child paths from the PubMed DTD - no recursive .// searches, which
+    also keeps DOIs of cited works (ReferenceList) from leaking into the result.
+    """
+    try:
+        medline = article_elem.find("MedlineCitation")
+        article_node = medline.find("Article")
+        pmid = medline.findtext("PMID")
+        
+        title = _text(article_node.find("ArticleTitle")) or "No title"
+        
+        authors = []
+        author_elems = article_node.findall("AuthorList/Author")
+        for author in author_elems[:3]:  # First 3 authors
+            lastname = author.findtext("LastName")
+            initials = author.findtext("Initials")
+            forename = author.findtext("ForeName")
+            if lastname:
+                if initials:
+                    authors.append(f"{lastname}, {initials}")
+                elif forename:
+                    authors.append(f"{lastname}, {forename[0]}")
+                else:
+                    authors.append(lastname)
+            elif author.findtext("CollectiveName"):
+                authors.append(author.findtext("CollectiveName"))
+        # Add et al. if more than 3 authors
+        if len(author_elems) > 3:
+            authors.append("et al.")
+        author_string = ", ".join(authors) if authors else "Unknown authors"
+        
+        journal_title = article_node.findtext("Journal/Title") or "Unknown journal"
+        issue_node = article_node.find("Journal/JournalIssue")
+        volume = issue = year = None
+        if issue_node is not None:
+            volume = issue_node.findtext("Volume")
+            issue = issue_node.findtext("Issue")
+            year = issue_node.findtext("PubDate/Year")
+            if not year:
+                # e.g. <MedlineDate>1998 Dec-1999 Jan</MedlineDate>
+                medline_date = issue_node.findtext("PubDate/MedlineDate") or ""
+                year = medline_date[:4] if medline_date[:4].isdigit() else None
+        
+        pages = article_node.findtext("Pagination/MedlinePgn")
+        
+        doi = None
+        for aid in article_elem.findall("PubmedData/ArticleIdList/ArticleId"):
+            if aid.get("IdType") == "doi":
+                doi = aid.text
+                break
+        if doi is None:
+            for eloc in article_node.findall("ELocationID"):
+                if eloc.get("EIdType") == "doi":
+                    doi = eloc.text
+                    break
+        
+        # Build volume/issue string
+        volume_issue = None
+        if volume:
+            volume_issue = f"{volume}({issue})" if issue else volume
+        
+        return {
+            "pmid": pmid,
+            "title": title,
+            "authors": author_string,
+            "journal": journal_title,
+            "year": int(year) if year else None,
+            "volume_issue": volume_issue,
+            "pages": pages,
+            "doi": doi,
+            "url": f"https://pubmed.ncbi.nlm.nih.gov/{pmid}/"
+        }
+    except Exception as e:
+        print(f"[PUBMED] Parse error: {e}")
+        return None
+
+
+def parse_esummary_record(record: Dict) -> Optional[Dict]:
+    """Convert one esummary (retmode=json) document into the parse_pubmed_article format"""
+    pmid = str(record.get("uid") or "")
+    if not pmid or record.get("error"):
+        return None
+    
+    authors = []
+    names = [a.get("name") for a in record.get("authors", []) if a.get("name")]
+    for name in names[:3]:
+        # "Smith JA" -> "Smith, JA"; collective names have no initials
+        parts = name.rsplit(" ", 1)
+        authors.append(f"{parts[0]}, {parts[1]}" if len(parts) == 2 and parts[1].isupper() else name)
+    if len(names) > 3:
+        authors.append("et al.")
+    
+    doi = None
+    for aid in record.get("articleids", []):
+        if aid.get("idtype") == "doi":
+            doi = aid.get("value")
+            break
+    
+    year = (record.get("pubdate") or record.get("epubdate") or "")[:4]
+    volume, issue = record.get("volume"), record.get("issue")
+    volume_issue = (f"{volume}({issue})" if issue else volume) if volume else None
+    
+    return {
+        "pmid": pmid,
+        "title": record.get("title") or "No title",
+        "authors": ", ".join(authors) if authors else "Unknown authors",
+        "journal": record.get("fulljournalname") or record.get("source") or "Unknown journal",
+        "year": int(year) if year.isdigit() else None,
+        "volume_issue": volume_issue,
+        "pages": record.get("pages") or None,
+        "doi": doi,
+        "url": f"https://pubmed.ncbi.nlm.nih.gov/{pmid}/"
+    }
+
+
+def iter_pubmed_articles(source) -> Iterator[Dict]:
+    """
+    Stream articles out of efetch XML (a path or binary file object) with iterparse
+    
+    Each <PubmedArticle> is parsed as soon as it closes and then cleared from the
+    tree, so memory stays flat no matter how many PMIDs the payload holds.
+    """
+    root = None
+    for event, elem in ET.iterparse(source, events=("start", "end")):
+        if root is None and event == "start":
+            root = elem
+        elif event == "end" and elem.tag == "PubmedArticle":
+            article = parse_pubmed_article(elem)
+            elem.clear()
+            root.clear()
+            if article:
+                yield article
+
+
+class PubMedArticleStream:
+    """Incremental counterpart of iter_pubmed_articles for chunks arriving from an async response"""
+    
+    def __init__(self):
+        self._parser = ET.XMLPullParser(events=("start", "end"))
+        self._root = None
+    
+    def feed(self, chunk: bytes) -> List[Dict]:
+        """Feed raw bytes; returns the articles completed by this chunk"""
+        self._parser.feed(chunk)
+        return self._drain()
+    
+    def close(self) -> List[Dict]:
+        self._parser.close()
+        return self._drain()
+    
+    def _drain(self) -> List[Dict]:
+        articles = []
+        for event, elem in self._parser.read_events():
+            if self._root is None and event == "start":
+                self._root = elem
+            elif event == "end" and elem.tag == "PubmedArticle":
+                article = parse_pubmed_article(elem)
+                elem.clear()
+                self._root.clear()
+                if article:
+                    articles.append(article)
+        return articles
+
 
 class PubMedService:
     """Service for querying PubMed API and getting real article metadata"""
@@ -14,6 +271,43 @@ class PubMedService:
         self.api_key = os.getenv("NCBI_API_KEY", "")
         self.base_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils"
         self.email = os.getenv("NCBI_EMAIL", "toxwiki@example.com")
+        self.rate_limiter = RateLimiter(10.0 if self.api_key else 3.0)
+        self.query_cache = TTLCache()
+        self.article_cache = TTLCache()
+    
+    def _params(self, **params) -> Dict[str, Any]:
+        params.setdefault("db", "pubmed")
+        params["email"] = self.email
+        if self.api_key:
+            params["api_key"] = self.api_key
+        return params
+    
+    def _cache_articles(self, articles: Iterable[Dict]) -> Iterator[Dict]:
+        fetched = []
+        for article in articles:
+            self.article_cache.set(article["pmid"], article)
+            fetched.append(article)
+            yield article
+        # Keep the local metadata store current for offline citation checks
+        pmid_store.upsert_articles(fetched)
+    
+    def _cached_articles(self, pmids: Iterable[str]) -> Tuple[Dict[str, Dict], List[str]]:
+        """Split PMIDs into (cached articles by PMID, PMIDs still to fetch)"""
+        found, missing = {}, []
+        for pmid in dict.fromkeys(str(p) for p in pmids):
+            article = self.article_cache.get(pmid)
+            if article is None:
+                missing.append(pmid)
+            else:
+                found[pmid] = article
+        if missing:
+            stored = pmid_store.get_many(pmids=missing)
+            for pmid in missing:
+                if pmid in stored:
+                    found[pmid] = stored[pmid]
+                    self.article_cache.set(pmid, stored[pmid])
+            missing = [pmid for pmid in missing if pmid not in found]
+        return found, missing
     
     def search_articles(self, query: str, max_results: int = 10) -> List[str]:
         """
@@ -26,19 +320,14 @@ class PubMedService:
         Returns:
             List of PMIDs as strings
         """
-        params = {
-            "db": "pubmed",
-            "term": query,
-            "retmax": max_results,
-            "retmode": "json",
-            "sort": "relevance",
-            "email": self.email
-        }
+        cached = self.query_cache.get((query, max_results))
+        if cached is not None:
+            return list(cached)
         
-        if self.api_key:
-            params["api_key"] = self.api_key
+        params = self._params(term=query, retmax=max_results, retmode="json", sort="relevance")
         
         try:
+            self.rate_limiter.wait()
             response = requests.get(
                 f"{self.base_url}/esearch.fcgi",
                 params=params,
@@ -48,6 +337,7 @@ class PubMedService:
             data = response.json()
             
             pmids = data.get("esearchresult", {}).get("idlist", [])
+            self.query_cache.set((query, max_results), pmids)
             return pmids
         except Exception as e:
             print(f"[PUBMED] Search failed: {e}")
@@ -66,141 +356,89 @@ class PubMedService:
         if not pmids:
             return []
         
-        params = {
-            "db": "pubmed",
-            "id": ",".join(pmids),
-            "retmode": "xml",
-            "email": self.email
-        }
+        found, missing = self._cached_articles(pmids)
         
-        if self.api_key:
-            params["api_key"] = self.api_key
+        try:
+            for start in range(0, len(missing), PUBMED_EFETCH_BATCH):
+                self.rate_limiter.wait()
+                with requests.post(
+                    f"{self.base_url}/efetch.fcgi",
+                    data=self._params(id=",".join(missing[start:start + PUBMED_EFETCH_BATCH]), retmode="xml"),
+                    timeout=PUBMED_TIMEOUT_SECONDS,
+                    stream=True
+                ) as response:
+                    response.raise_for_status()
+                    response.raw.decode_content = True
+                    for article in self._cache_articles(iter_pubmed_articles(response.raw)):
+                        found[article["pmid"]] = article
+        except Exception as e:
+            print(f"[PUBMED] Fetch failed: {e}")
+        
+        return [found[str(p)] for p in dict.fromkeys(pmids) if str(p) in found]
+    
+    def fetch_summaries(self, pmids: List[str], timeout: float = PUBMED_TIMEOUT_SECONDS) -> Tuple[Dict[str, Dict], List[str]]:
+        """
+        Lightweight metadata for PMIDs with a single esummary call
+        
+        Returns (articles by PMID, PMIDs PubMed reports as invalid). Cached and
+        stored articles are served without a request.
+        """
+        found, missing = self._cached_articles(pmids)
+        invalid = []
+        if not missing:
+            return found, invalid
         
         try:
-            response = requests.get(
-                f"{self.base_url}/efetch.fcgi",
-                params=params,
-                timeout=15
+            self.rate_limiter.wait()
+            response = requests.post(
+                f"{self.base_url}/esummary.fcgi",
+                data=self._params(id=",".join(missing), retmode="json"),
+                timeout=timeout
             )
             response.raise_for_status()
-            
-            # Parse XML response
-            root = ET.fromstring(response.content)
-            articles = []
-            
-            for article_elem in root.findall(".//PubmedArticle"):
-                article = self._parse_article_xml(article_elem)
+            result = response.json().get("result", {})
+        except Exception as e:
+            print(f"[PUBMED] Summary failed: {e}")
+            return found, invalid
+        
+        articles = []
+        for pmid in missing:
+            record = result.get(pmid) or {}
+            if record.get("error"):
+                invalid.append(pmid)
+            elif record:
+                article = parse_esummary_record(record)
                 if article:
                     articles.append(article)
-            
-            return articles
-        except Exception as e:
-            print(f"[PUBMED] Fetch failed: {e}")
-            return []
+        for article in self._cache_articles(articles):
+            found[article["pmid"]] = article
+        return found, invalid
     
-    def _parse_article_xml(self, article_elem) -> Optional[Dict]:
-        """Parse XML element into article dictionary"""
+    def find_pmids_by_doi(self, dois: List[str], timeout: float = PUBMED_TIMEOUT_SECONDS) -> List[str]:
+        """PMIDs of the articles with these DOIs, from a single esearch [doi] query"""
+        dois = sorted({d for d in dois if d})
+        if not dois:
+            return []
+        cached = self.query_cache.get(("doi", tuple(dois)))
+        if cached is not None:
+            return list(cached)
+
+        term = " OR ".join(f'"{doi}"[doi]' for doi in dois)
         try:
-            medline = article_elem.find(".//MedlineCitation")
-            article_node = medline.find(".//Article")
-            
-            # Get PMID
-            pmid = medline.find(".//PMID").text
-            
-            # Get title
-            title_elem = article_node.find(".//ArticleTitle")
-            title = title_elem.text if title_elem is not None else "No title"
-            
-            # Get authors
-            authors = []
-            author_list = article_node.find(".//AuthorList")
-            if author_list is not None:
-                for author in author_list.findall(".//Author")[:3]:  # First 3 authors
-                    lastname = author.find(".//LastName")
-                    forename = author.find(".//ForeName")
-                    initials = author.find(".//Initials")
-                    
-                    if lastname is not None:
-                        if initials is not None:
-                            authors.append(f"{lastname.text}, {initials.text}")
-                        elif forename is not None:
-                            authors.append(f"{lastname.text}, {forename.text[0]}")
-                        else:
-                            authors.append(lastname.text)
-                
-                # Add et al. if more than 3 authors
-                if len(author_list.findall(".//Author")) > 3:
-                    authors.append("et al.")
-            
-            author_string = ", ".join(authors) if authors else "Unknown authors"
-            
-            # Get journal
-            journal_elem = article_node.find(".//Journal")
-            journal_title = "Unknown journal"
-            volume = None
-            issue = None
-            year = None
-            pages = None
-            
-            if journal_elem is not None:
-                journal_title_elem = journal_elem.find(".//Title")
-                if journal_title_elem is not None:
-                    journal_title = journal_title_elem.text
-                
-                # Get publication date
-                pub_date = journal_elem.find(".//PubDate")
-                if pub_date is not None:
-                    year_elem = pub_date.find(".//Year")
-                    if year_elem is not None:
-                        year = year_elem.text
-                
-                # Get volume/issue
-                issue_node = journal_elem.find(".//JournalIssue")
-                if issue_node is not None:
-                    vol_elem = issue_node.find(".//Volume")
-                    if vol_elem is not None:
-                        volume = vol_elem.text
-                    
-                    issue_elem = issue_node.find(".//Issue")
-                    if issue_elem is not None:
-                        issue = issue_elem.text
-            
-            # Get pagination
-            pagination = article_node.find(".//Pagination/MedlinePgn")
-            if pagination is not None:
-                pages = pagination.text
-            
-            # Get DOI
-            doi = None
-            article_ids = article_elem.findall(".//ArticleId")
-            for aid in article_ids:
-                if aid.get("IdType") == "doi":
-                    doi = aid.text
-                    break
-            
-            # Build volume/issue string
-            volume_issue = None
-            if volume:
-                if issue:
-                    volume_issue = f"{volume}({issue})"
-                else:
-                    volume_issue = volume
-            
-            return {
-                "pmid": pmid,
-                "title": title,
-                "authors": author_string,
-                "journal": journal_title,
-                "year": int(year) if year else None,
-                "volume_issue": volume_issue,
-                "pages": pages,
-                "doi": doi,
-                "url": f"https://pubmed.ncbi.nlm.nih.gov/{pmid}/"
-            }
+            self.rate_limiter.wait()
+            response = requests.post(
+                f"{self.base_url}/esearch.fcgi",
+                data=self._params(term=term, retmax=len(dois), retmode="json"),
+                timeout=timeout
+            )
+            response.raise_for_status()
+            pmids = response.json().get("esearchresult", {}).get("idlist", [])
         except Exception as e:
-            print(f"[PUBMED] Parse error: {e}")
-            return None
-    
+            print(f"[PUBMED] DOI search failed: {e}")
+            return []
+        self.query_cache.set(("doi", tuple(dois)), pmids)
+        return pmids
+
     def get_references_for_topic(self, topic: str, max_refs: int = 6) -> List[Dict]:
         """
         Get real PubMed references for a topic
@@ -221,7 +459,11 @@ class PubMedService:
         # Fetch article details
         articles = self.fetch_article_details(pmids)
         
-        # Format for use in responses
+        return self._format_references(articles)
+    
+    @staticmethod
+    def _format_references(articles: List[Dict]) -> List[Dict]:
+        """Format articles for use in responses"""
         references = []
         for i, article in enumerate(articles, start=1):
             if article:
@@ -237,8 +479,112 @@ class PubMedService:
                     "doi": article.get("doi"),
                     "url": article["url"]
                 })
-        
         return references
+    
+    # ------------------------------------------------------------------
+    # Async API (pooled client, never blocks the event loop)
+    # ------------------------------------------------------------------
+    def _client(self) -> httpx.AsyncClient:
+        return get_async_client("pubmed", lambda: httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=httpx.Timeout(PUBMED_TIMEOUT_SECONDS, connect=5.0),
+            limits=httpx.Limits(max_connections=10, max_keepalive_connections=10)
+        ))
+    
+    async def _request(self, endpoint: str, **params) -> httpx.Response:
+        """Rate-limited POST to an E-utilities endpoint (POST keeps long ID lists out of the URL)"""
+        await self.rate_limiter.wait_async()
+        response = await self._client().post(f"/{endpoint}", data=self._params(**params))
+        response.raise_for_status()
+        return response
+    
+    async def _efetch_stream(self, **params) -> List[Dict]:
+        """efetch with the XML parsed incrementally while it downloads"""
+        await self.rate_limiter.wait_async()
+        stream = PubMedArticleStream()
+        articles = []
+        async with self._client().stream("POST", "/efetch.fcgi", data=self._params(retmode="xml", **params)) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes():
+                articles.extend(stream.feed(chunk))
+        articles.extend(stream.close())
+        # The PMID store upsert is SQLite I/O - keep it off the event loop
+        return await asyncio.to_thread(lambda: list(self._cache_articles(articles)))
+    
+    async def search_articles_async(self, query: str, max_results: int = 10) -> List[str]:
+        """Async search_articles"""
+        cached = self.query_cache.get((query, max_results))
+        if cached is not None:
+            return list(cached)
+        
+        try:
+            response = await self._request(
+                "esearch.fcgi", term=query, retmax=max_results, retmode="json", sort="relevance"
+            )
+            data = response.json()
+        except Exception as e:
+            print(f"[PUBMED] Search failed: {e}")
+            return []
+        
+        pmids = data.get("esearchresult", {}).get("idlist", [])
+        self.query_cache.set((query, max_results), pmids)
+        return pmids
+    
+    async def fetch_article_details_async(self, pmids: List[str]) -> List[Dict]:
+        """
+        Async fetch_article_details; only uncached PMIDs hit the API
+        
+        Up to PUBMED_EFETCH_BATCH IDs go in one efetch. Larger sets are uploaded
+        once with epost and paged out of the WebEnv history session.
+        """
+        if not pmids:
+            return []
+        
+        found, missing = await asyncio.to_thread(self._cached_articles, pmids)
+        try:
+            if len(missing) <= PUBMED_EFETCH_BATCH:
+                if missing:
+                    for article in await self._efetch_stream(id=",".join(missing)):
+                        found[article["pmid"]] = article
+            else:
+                posted = await self._request("epost.fcgi", id=",".join(missing))
+                root = ET.fromstring(posted.content)
+                webenv, query_key = root.findtext("WebEnv"), root.findtext("QueryKey")
+                for start in range(0, len(missing), PUBMED_EFETCH_BATCH):
+                    for article in await self._efetch_stream(
+                        WebEnv=webenv, query_key=query_key, retstart=start, retmax=PUBMED_EFETCH_BATCH
+                    ):
+                        found[article["pmid"]] = article
+        except Exception as e:
+            print(f"[PUBMED] Fetch failed: {e}")
+        
+        return [found[str(p)] for p in dict.fromkeys(pmids) if str(p) in found]
+    
+    async def get_references_for_topic_async(self, topic: str, max_refs: int = 6) -> List[Dict]:
+        """Async get_references_for_topic"""
+        return (await self.get_references_for_topics_async([topic], max_refs=max_refs)).get(topic, [])
+    
+    async def get_references_for_topics_async(self, topics: List[str], max_refs: int = 6) -> Dict[str, List[Dict]]:
+        """
+        References for many topics with one article fetch
+        
+        Searches run concurrently (rate limited); the union of their PMIDs is
+        fetched in as few efetch calls as the batch size allows.
+        """
+        topics = list(dict.fromkeys(t for t in topics if t))
+        results = await asyncio.gather(*(self.search_articles_async(t, max_results=max_refs) for t in topics))
+        pmids_by_topic = dict(zip(topics, results))
+        
+        all_pmids = [pmid for pmids in results for pmid in pmids]
+        articles = {a["pmid"]: a for a in await self.fetch_article_details_async(all_pmids)}
+        
+        return {
+            topic: self._format_references([articles[p] for p in pmids if p in articles])
+            for topic, pmids in pmids_by_topic.items()
+        }
+    
+    def cache_stats(self) -> Dict[str, Dict[str, int]]:
+        return {"queries": self.query_cache.stats(), "articles": self.article_cache.stats()}
 
 
 # Global instance
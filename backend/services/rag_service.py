@@ -1,85 +1,460 @@
 import os
-from typing import List, Optional
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.vectorstores import Chroma
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+import time
+import asyncio
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
 from dotenv import load_dotenv
 
+from .pubmed_service import TTLCache
+from .bm25_index import BM25Index
+
 load_dotenv()
 
 ENABLE_RAG = os.getenv("ENABLE_RAG", "false").lower() == "true"
 VECTOR_DB_PATH = os.getenv("VECTOR_DB_PATH", "./data/vectorstore")
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+# "chroma" or "flat" (memory-mapped NumPy matrix, see flat_vector_store.py)
+RAG_BACKEND = os.getenv("RAG_BACKEND", "chroma").lower()
+RAG_FLAT_PATH = os.getenv("RAG_FLAT_PATH", os.path.join(VECTOR_DB_PATH, "flat"))
+# Directory of the active backend; the manifest and BM25 index live beside it
+RAG_STORE_PATH = RAG_FLAT_PATH if RAG_BACKEND == "flat" else VECTOR_DB_PATH
+# Retrieval runs on its own small pool; beyond RAG_MAX_PENDING queued lookups, requests skip RAG
+RAG_RETRIEVAL_WORKERS = int(os.getenv("RAG_RETRIEVAL_WORKERS", "2"))
+RAG_MAX_PENDING = int(os.getenv("RAG_MAX_PENDING", "8"))
+RAG_RETRIEVAL_TIMEOUT_SECONDS = float(os.getenv("RAG_RETRIEVAL_TIMEOUT_SECONDS", "2.0"))
+RAG_EMBEDDING_CACHE_SIZE = int(os.getenv("RAG_EMBEDDING_CACHE_SIZE", "1024"))
+RAG_RESULT_CACHE_SIZE = int(os.getenv("RAG_RESULT_CACHE_SIZE", "256"))
+RAG_CACHE_TTL_SECONDS = float(os.getenv("RAG_CACHE_TTL_SECONDS", "3600"))
+RAG_MANIFEST_PATH = os.getenv("RAG_MANIFEST_PATH", os.path.join(RAG_STORE_PATH, "index_manifest.json"))
+RAG_CHUNK_SIZE = int(os.getenv("RAG_CHUNK_SIZE", "1000"))
+RAG_CHUNK_OVERLAP = int(os.getenv("RAG_CHUNK_OVERLAP", "200"))
+# Chunks per embedding call (sentence-transformers batch); 64 suits CPU MiniLM
+RAG_EMBED_BATCH_SIZE = int(os.getenv("RAG_EMBED_BATCH_SIZE", "64"))
+# Hybrid retrieval: BM25 ranking fused with vector ranking (reciprocal rank fusion)
+RAG_HYBRID = os.getenv("RAG_HYBRID", "true").lower() == "true"
+RAG_BM25_PATH = os.getenv("RAG_BM25_PATH", os.path.join(RAG_STORE_PATH, "bm25_index.json"))
+RAG_RRF_K = int(os.getenv("RAG_RRF_K", "60"))
+RAG_CANDIDATES = int(os.getenv("RAG_CANDIDATES", "20"))
+# Optional cross-encoder (e.g. cross-encoder/ms-marco-MiniLM-L-6-v2) reranking the fused top candidates
+RAG_RERANK_MODEL = os.getenv("RAG_RERANK_MODEL", "")
+RAG_RERANK_TOP_N = int(os.getenv("RAG_RERANK_TOP_N", "20"))
+# Near-duplicate chunks (MinHash/LSH) are dropped before embedding
+RAG_DEDUP = os.getenv("RAG_DEDUP", "true").lower() == "true"
+RAG_DEDUP_PATH = os.getenv("RAG_DEDUP_PATH", os.path.join(RAG_STORE_PATH, "dedup_signatures.npz"))
+
+
+def chunk_id(chunk) -> str:
+    """Content-derived ID - re-adding an identical chunk overwrites instead of duplicating"""
+    source = f"{chunk.metadata.get('source', '')}|{chunk.metadata.get('page', '')}|{chunk.page_content}"
+    return hashlib.sha1(source.encode("utf-8")).hexdigest()
+
+
+def _add_duplicate_source(metadata: Dict[str, Any], source: Optional[str]) -> bool:
+    """Record source in metadata["duplicate_sources"]; False if it is already there"""
+    if not source or source == metadata.get("source"):
+        return False
+    # Comma-joined: Chroma metadata values must be scalars
+    sources = [s for s in (metadata.get("duplicate_sources") or "").split(",") if s]
+    if source in sources:
+        return False
+    metadata["duplicate_sources"] = ",".join(sources + [source])
+    return True
+
 
 class RAGService:
+    """
+    Hybrid (vector + BM25) retrieval over indexed papers
+
+    The embedding model and Chroma store load in a background thread
+    (start_background_load) so a cold start can serve requests right away;
+    retrieval returns no context until the load has finished.
+    """
+
     def __init__(self):
         self.enabled = ENABLE_RAG
         self.vectorstore = None
-        
-        if self.enabled:
-            try:
-                # Initialize embeddings
-                self.embeddings = HuggingFaceEmbeddings(
-                    model_name=EMBEDDING_MODEL,
-                    model_kwargs={'device': 'cpu'},
-                    encode_kwargs={'normalize_embeddings': True}
-                )
-                
-                # Try to load existing vectorstore
-                if os.path.exists(VECTOR_DB_PATH):
-                    self.vectorstore = Chroma(
-                        persist_directory=VECTOR_DB_PATH,
-                        embedding_function=self.embeddings
-                    )
-                    print(f"✓ RAG enabled: Loaded vectorstore from {VECTOR_DB_PATH}")
-                else:
-                    print(f"⚠ RAG enabled but no vectorstore found at {VECTOR_DB_PATH}")
-                    print("  Add documents to ./data/papers/ and run the indexing script")
-            except Exception as e:
-                print(f"⚠ RAG initialization failed: {e}")
-                self.enabled = False
+        self.embeddings = None
+        self.bm25: Optional[BM25Index] = None
+        self.dedup = None  # NearDuplicateIndex once loaded (needs numpy)
+        self.reranker = None
+        # disabled -> not_loaded -> loading -> ready | no_index | failed
+        self.state = "not_loaded" if self.enabled else "disabled"
+        self.load_time_ms: Optional[int] = None
+        self.error: Optional[str] = None
+        self._loaded = threading.Event()
+        self._load_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._executor = ThreadPoolExecutor(max_workers=RAG_RETRIEVAL_WORKERS, thread_name_prefix="rag")
+        self._pending = threading.BoundedSemaphore(RAG_MAX_PENDING)
+        self.embedding_cache = TTLCache(max_entries=RAG_EMBEDDING_CACHE_SIZE, ttl=RAG_CACHE_TTL_SECONDS)
+        self.result_cache = TTLCache(max_entries=RAG_RESULT_CACHE_SIZE, ttl=RAG_CACHE_TTL_SECONDS)
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def start_background_load(self):
+        """Begin loading without blocking the caller (idempotent)"""
+        with self._load_lock:
+            if not self.enabled or self._thread is not None or self._loaded.is_set():
+                return
+            self.state = "loading"
+            self._thread = threading.Thread(target=self._load, name="rag-load", daemon=True)
+            self._thread.start()
+
+    def wait_until_loaded(self, timeout: Optional[float] = None) -> bool:
+        """Load (in the background if not yet started) and wait for it; True once finished"""
+        self.start_background_load()
+        return self._loaded.wait(timeout) if self.enabled else False
+
+    def _load(self):
+        started = time.perf_counter()
+        try:
+            # Heavy imports (torch, chromadb) stay off the import path
+            from langchain_community.embeddings import HuggingFaceEmbeddings
+
+            # The flat store reads chunk text by ID, so BM25 need not keep a second copy
+            self.bm25 = BM25Index(RAG_BM25_PATH, store_text=RAG_BACKEND != "flat")
+            if RAG_DEDUP:
+                try:
+                    # numpy is only needed with RAG installed, not on the API import path
+                    from .dedup import NearDuplicateIndex
+                    self.dedup = NearDuplicateIndex(RAG_DEDUP_PATH)
+                except ImportError as e:
+                    print(f"⚠ Near-duplicate detection unavailable, indexing every chunk: {e}")
+
+            # Initialize embeddings
+            self.embeddings = HuggingFaceEmbeddings(
+                model_name=EMBEDDING_MODEL,
+                model_kwargs={'device': 'cpu'},
+                encode_kwargs={'normalize_embeddings': True, 'batch_size': RAG_EMBED_BATCH_SIZE}
+            )
+
+            # Try to load existing vectorstore
+            self.vectorstore = self._open_vectorstore()
+            if self.vectorstore is not None:
+                self.state = "ready"
+                print(f"✓ RAG enabled: Loaded {RAG_BACKEND} vectorstore from {RAG_STORE_PATH}")
+            else:
+                self.state = "no_index"
+                print(f"⚠ RAG enabled but no vectorstore found at {RAG_STORE_PATH}")
+                print("  Add documents to ./data/papers/ and run the indexing script")
+
+            if RAG_RERANK_MODEL:
+                try:
+                    from sentence_transformers import CrossEncoder
+                    self.reranker = CrossEncoder(RAG_RERANK_MODEL, device='cpu')
+                except Exception as e:
+                    print(f"⚠ Reranker unavailable, using fused ranking: {e}")
+        except Exception as e:
+            print(f"⚠ RAG initialization failed: {e}")
+            self.error = str(e)[:200]
+            self.state = "failed"
+            self.enabled = False
+        finally:
+            self.load_time_ms = int((time.perf_counter() - started) * 1000)
+            print(f"[RAG] Load finished in {self.load_time_ms}ms ({self.state})")
+            self._loaded.set()
+
+    def _open_vectorstore(self, create: bool = False):
+        """The configured backend's store, or None if it has no index yet (unless create)"""
+        if RAG_BACKEND == "flat":
+            from .flat_vector_store import FlatVectorStore
+            if create or FlatVectorStore.exists(RAG_FLAT_PATH):
+                return FlatVectorStore(RAG_FLAT_PATH, embedding_function=self.embeddings)
+            return None
+
+        from langchain_community.vectorstores import Chroma
+        if create or os.path.exists(VECTOR_DB_PATH):
+            return Chroma(persist_directory=VECTOR_DB_PATH, embedding_function=self.embeddings)
+        return None
+
+    def status(self) -> Dict[str, Any]:
+        """Readiness for health checks"""
+        return {
+            "enabled": self.enabled,
+            "state": self.state,
+            "ready": self.ready,
+            "backend": RAG_BACKEND,
+            "load_time_ms": self.load_time_ms,
+            "error": self.error,
+            "bm25_chunks": self.bm25.size if self.bm25 else None,
+            "reranker": RAG_RERANK_MODEL if self.reranker else None,
+            "dedup": self.dedup.stats() if self.dedup else None,
+            "cache": {"embeddings": self.embedding_cache.stats(), "results": self.result_cache.stats()},
+        }
+
+    @staticmethod
+    def _cache_key(query: str, k: int):
+        return (" ".join(query.lower().split()), k)
+
+    def _embed_query(self, query: str) -> List[float]:
+        key = " ".join(query.lower().split())
+        embedding = self.embedding_cache.get(key)
+        if embedding is None:
+            embedding = self.embeddings.embed_query(query)
+            self.embedding_cache.set(key, embedding)
+        return embedding
+
+    def search(self, query: str, k: int = 3) -> List[Dict[str, Any]]:
+        """
+        Top-k chunks ({id, text, metadata, score}) for a query
+
+        Vector and BM25 candidate lists are merged by reciprocal rank fusion, so a
+        chunk that matches an exact drug name or dose ranks even when its embedding
+        is only loosely similar. With RAG_RERANK_MODEL set, a cross-encoder
+        reorders the fused top candidates.
+        """
+        candidates = max(RAG_CANDIDATES, k)
+        docs = self.vectorstore.similarity_search_by_vector(self._embed_query(query), k=candidates)
+        chunks = {chunk_id(doc): {"text": doc.page_content, "metadata": doc.metadata} for doc in docs}
+        rankings = [list(chunks)]
+
+        if RAG_HYBRID and self.bm25 is not None and self.bm25.size:
+            lexical = [cid for cid, _ in self.bm25.search(query, candidates)]
+            for cid in lexical:
+                if cid not in chunks:
+                    doc = self._lexical_chunk(cid)
+                    if doc is not None:
+                        chunks[cid] = doc
+            rankings.append([cid for cid in lexical if cid in chunks])
+
+        fused: Dict[str, float] = {}
+        for ranking in rankings:
+            for rank, cid in enumerate(ranking):
+                fused[cid] = fused.get(cid, 0.0) + 1.0 / (RAG_RRF_K + rank + 1)
+        ranked = sorted(fused, key=fused.get, reverse=True)
+
+        scores = fused
+        if self.reranker is not None and len(ranked) > 1:
+            top = ranked[:max(RAG_RERANK_TOP_N, k)]
+            scores = dict(zip(top, (float(s) for s in self.reranker.predict([(query, chunks[cid]["text"]) for cid in top]))))
+            ranked = sorted(top, key=scores.get, reverse=True)
+
+        return [{"id": cid, **chunks[cid], "score": scores[cid]} for cid in ranked[:k]]
+
+    def _lexical_chunk(self, cid: str) -> Optional[Dict[str, Any]]:
+        """Text and metadata of a BM25-only hit, from the flat store or the BM25 index"""
+        if hasattr(self.vectorstore, "get_chunk"):
+            chunk = self.vectorstore.get_chunk(cid)
+            return {"text": chunk.page_content, "metadata": chunk.metadata} if chunk is not None else None
+        doc = self.bm25.get(cid)
+        return {"text": doc["text"], "metadata": doc["metadata"]} if doc is not None else None
+
+    def _search(self, query: str, k: int) -> Optional[str]:
+        results = self.search(query, k)
+        context = "\n\n".join(r["text"] for r in results)
+        # Empty string caches "nothing relevant" too
+        self.result_cache.set(self._cache_key(query, k), context)
+        return context or None
+
+    def _retrieve(self, query: str, k: int) -> Optional[str]:
+        context = self.result_cache.get(self._cache_key(query, k))
+        if context is not None:
+            return context or None
+        return self._search(query, k)
 
     def retrieve_context(self, query: str, k: int = 3) -> Optional[str]:
-        """Retrieve relevant context for a query"""
-        if not self.enabled or not self.vectorstore:
+        """Retrieve relevant context for a query (None until the store is loaded)"""
+        if not self.ready:
+            self.start_background_load()
+            return None
+
+        try:
+            return self._retrieve(query, k)
+        except Exception as e:
+            print(f"Error retrieving context: {e}")
+            return None
+
+    async def retrieve_context_async(self, query: str, k: int = 3, timeout: float = RAG_RETRIEVAL_TIMEOUT_SECONDS) -> Optional[str]:
+        """
+        retrieve_context off the event loop
+
+        Cached results return immediately; otherwise the embedding and vector
+        search run on the bounded RAG pool. A saturated pool or a lookup slower
+        than timeout yields no context rather than delaying the answer.
+        """
+        if not self.ready:
+            self.start_background_load()
+            return None
+
+        cached = self.result_cache.get(self._cache_key(query, k))
+        if cached is not None:
+            return cached or None
+
+        if not self._pending.acquire(blocking=False):
+            print("[RAG] Retrieval pool saturated - answering without RAG context")
             return None
-        
+
+        def run():
+            try:
+                return self._search(query, k)
+            finally:
+                self._pending.release()
+
         try:
-            docs = self.vectorstore.similarity_search(query, k=k)
-            if docs:
-                context = "\n\n".join([doc.page_content for doc in docs])
-                return context
+            future = asyncio.get_running_loop().run_in_executor(self._executor, run)
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            print(f"[RAG] Retrieval exceeded {timeout}s - answering without RAG context")
             return None
         except Exception as e:
             print(f"Error retrieving context: {e}")
             return None
 
-    def add_documents(self, texts: List[str], metadatas: Optional[List[dict]] = None):
-        """Add documents to the vectorstore"""
-        if not self.enabled:
-            return False
-        
+    def split_documents(self, texts: List[str], metadatas: Optional[List[dict]] = None) -> List[Any]:
+        """Chunk raw texts into Documents"""
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+        text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=RAG_CHUNK_SIZE,
+            chunk_overlap=RAG_CHUNK_OVERLAP
+        )
+        return text_splitter.create_documents(texts, metadatas=metadatas)
+
+    def add_chunks(self, chunks: List[Any], persist: bool = True,
+                   duplicates: Optional[Dict[str, str]] = None) -> Optional[List[str]]:
+        """
+        Embed and store chunks under content-derived IDs; returns the stored IDs (None on failure)
+
+        Chunks go into the vector store and the BM25 index together; near-duplicates
+        of indexed chunks are dropped first and their IDs are not returned (a passed
+        duplicates dict receives dropped ID -> ID of the chunk kept instead). Batch
+        callers pass persist=False and call persist() once at the end.
+        """
+        if not self.wait_until_loaded() or self.embeddings is None:
+            return None
+
         try:
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=1000,
-                chunk_overlap=200
-            )
-            
-            chunks = text_splitter.create_documents(texts, metadatas=metadatas)
-            
+            # A chunk repeated within the batch would be a duplicate ID
+            unique = {chunk_id(chunk): chunk for chunk in chunks}
+            kept, dropped = self._drop_near_duplicates(unique)
+            ids, chunks = list(kept), list(kept.values())
+            if not chunks:
+                self._merge_duplicate_sources(dropped, unique)
+                if duplicates is not None:
+                    duplicates.update(dropped)
+                return []
+
             if not self.vectorstore:
-                self.vectorstore = Chroma.from_documents(
-                    documents=chunks,
-                    embedding=self.embeddings,
-                    persist_directory=VECTOR_DB_PATH
-                )
+                self.vectorstore = self._open_vectorstore(create=True)
+                self.state = "ready"
+            try:
+                self.vectorstore.add_documents(chunks, ids=ids)
+            except Exception:
+                if self.dedup is not None:
+                    # Unstored chunks must not shadow their duplicates on retry
+                    self.dedup.remove(ids)
+                raise
+            self.bm25.add(ids, [c.page_content for c in chunks], [c.metadata for c in chunks])
+            self._merge_duplicate_sources(dropped, unique)
+            if duplicates is not None:
+                duplicates.update(dropped)
+
+            if persist:
+                self.persist()
+            # Cached results predate the new chunks
+            self.result_cache.clear()
+            return ids
+        except Exception as e:
+            print(f"Error adding documents: {e}")
+            return None
+
+    def _drop_near_duplicates(self, chunks: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, str]]:
+        """
+        (chunks that are not near-duplicates of an indexed chunk or one earlier in
+        the batch, dropped ID -> kept ID)
+
+        A duplicate of a chunk in the same batch is merged into it here: its source
+        is appended to the kept chunk's "duplicate_sources" metadata. Duplicates of
+        stored chunks are merged by _merge_duplicate_sources once the batch is in.
+        """
+        if self.dedup is None:
+            return chunks, {}
+        kept, dropped = {}, {}
+        for cid, chunk in chunks.items():
+            duplicate = self.dedup.check_and_add(cid, chunk.page_content)
+            if duplicate is None:
+                kept[cid] = chunk
+                continue
+            dropped[cid] = duplicate
+            if duplicate in kept:
+                _add_duplicate_source(kept[duplicate].metadata, chunk.metadata.get("source"))
+        if dropped:
+            print(f"[RAG] Dropped {len(dropped)} near-duplicate chunks of {len(chunks)}")
+        return kept, dropped
+
+    def _merge_duplicate_sources(self, dropped: Dict[str, str], chunks: Dict[str, Any]):
+        """Append the sources of chunks dropped as duplicates of stored chunks to those chunks' metadata"""
+        sources: Dict[str, List[str]] = {}
+        for cid, kept in dropped.items():
+            if kept not in chunks:
+                sources.setdefault(kept, []).append(chunks[cid].metadata.get("source"))
+        if not sources or not self.vectorstore:
+            return
+        try:
+            if hasattr(self.vectorstore, "get_chunk"):
+                stored = {cid: self.vectorstore.get_chunk(cid) for cid in sources}
+                current = {cid: dict(chunk.metadata) for cid, chunk in stored.items() if chunk is not None}
             else:
-                self.vectorstore.add_documents(chunks)
-            
-            self.vectorstore.persist()
+                stored = self.vectorstore.get(ids=list(sources), include=["metadatas"])
+                current = {cid: dict(metadata or {}) for cid, metadata in zip(stored["ids"], stored["metadatas"])}
+            updated = {}
+            for cid, metadata in current.items():
+                added = [_add_duplicate_source(metadata, source) for source in sources[cid]]
+                if any(added):
+                    updated[cid] = metadata
+            if not updated:
+                return
+            if hasattr(self.vectorstore, "update_metadata"):
+                self.vectorstore.update_metadata(list(updated), list(updated.values()))
+            else:
+                self.vectorstore._collection.update(ids=list(updated), metadatas=list(updated.values()))
+            for cid, metadata in updated.items():
+                self.bm25.update_metadata(cid, metadata)
+        except Exception as e:
+            # Provenance only - the duplicate's content is already in the index
+            print(f"[RAG] Could not record duplicate sources: {e}")
+
+    def delete_chunks(self, ids: List[str]) -> bool:
+        """Remove chunks (e.g. of a changed or deleted file) from the store"""
+        if not ids:
+            return True
+        if not self.wait_until_loaded() or not self.vectorstore:
+            return False
+        try:
+            self.vectorstore.delete(ids=list(ids))
+            self.bm25.delete(ids)
+            if self.dedup is not None:
+                self.dedup.remove(ids)
+            self.persist()
+            self.result_cache.clear()
             return True
+        except Exception as e:
+            print(f"Error deleting chunks: {e}")
+            return False
+
+    def persist(self):
+        """Flush the vector store, BM25 index and dedup signatures to disk"""
+        if self.vectorstore:
+            self.vectorstore.persist()
+        if self.bm25 is not None:
+            self.bm25.save()
+        if self.dedup is not None:
+            self.dedup.save()
+
+    def add_documents(self, texts: List[str], metadatas: Optional[List[dict]] = None):
+        """Add documents to the vectorstore"""
+        if not self.wait_until_loaded() or self.embeddings is None:
+            return False
+
+        try:
+            chunks = self.split_documents(texts, metadatas)
         except Exception as e:
             print(f"Error adding documents: {e}")
             return False
+        return self.add_chunks(chunks) is not None
 
 rag_service = RAGService()
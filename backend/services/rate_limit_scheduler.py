@@ -0,0 +1,172 @@
+"""
+Rate Limit Scheduler - Retry-After / x-ratelimit-* aware pacing for LLM providers
+Tracks remaining request/token budgets from response headers across calls and
+delays, retries (jittered backoff) or gives up early so the router can reroute
+"""
+import re
+import time
+import random
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from .provider_stats import ModelProviderError, find_status_code
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """Parse '7.66s', '2m59.56s', '120ms', '1h2m' or plain seconds into seconds"""
+    if value is None:
+        return None
+    value = str(value).strip()
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    units = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+    return sum(float(number) * units[unit] for number, unit in parts)
+
+
+def _int_header(headers, name: str) -> Optional[int]:
+    raw = headers.get(name)
+    try:
+        return int(float(raw)) if raw is not None else None
+    except ValueError:
+        return None
+
+
+class RateLimitScheduler:
+    """
+    Shared per-provider budget fed by every response's headers
+
+    Before a call, delay_for() says how long to wait for the request/token budget
+    to reset. run() applies it, retries 429s with jittered backoff that honours
+    Retry-After, and raises ModelProviderError(429) as soon as waiting would
+    overrun the caller's deadline.
+    """
+
+    def __init__(self, provider: str, max_attempts: int = 3, base_backoff: float = 0.5, max_backoff: float = 10.0):
+        self.provider = provider
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._lock = threading.Lock()
+        self.remaining_requests: Optional[int] = None
+        self.remaining_tokens: Optional[int] = None
+        self.requests_reset_at: Optional[float] = None
+        self.tokens_reset_at: Optional[float] = None
+        self.blocked_until: Optional[float] = None
+        self.throttled = 0
+        self.retried = 0
+        self.rerouted = 0
+
+    def observe_headers(self, headers, status_code: Optional[int] = None):
+        """Update budgets from x-ratelimit-* and Retry-After headers (httpx event hook)"""
+        now = time.monotonic()
+        with self._lock:
+            remaining_requests = _int_header(headers, "x-ratelimit-remaining-requests")
+            remaining_tokens = _int_header(headers, "x-ratelimit-remaining-tokens")
+            reset_requests = parse_duration(headers.get("x-ratelimit-reset-requests"))
+            reset_tokens = parse_duration(headers.get("x-ratelimit-reset-tokens"))
+            if remaining_requests is not None:
+                self.remaining_requests = remaining_requests
+            if remaining_tokens is not None:
+                self.remaining_tokens = remaining_tokens
+            if reset_requests is not None:
+                self.requests_reset_at = now + reset_requests
+            if reset_tokens is not None:
+                self.tokens_reset_at = now + reset_tokens
+
+            retry_after = parse_duration(headers.get("retry-after"))
+            if status_code == 429 and retry_after is None:
+                retry_after = reset_tokens if self.remaining_tokens == 0 else reset_requests
+            if retry_after is not None and (status_code == 429 or status_code == 503):
+                self.blocked_until = max(self.blocked_until or 0.0, now + retry_after)
+
+    def httpx_hook(self, response):
+        """httpx 'response' event hook"""
+        self.observe_headers(response.headers, response.status_code)
+
+    def delay_for(self, estimated_tokens: int = 0) -> float:
+        """Seconds to wait before the next call fits the known budget (0 = send now)"""
+        now = time.monotonic()
+        waits = [0.0]
+        with self._lock:
+            if self.blocked_until and self.blocked_until > now:
+                waits.append(self.blocked_until - now)
+            if self.remaining_requests is not None and self.remaining_requests <= 0 \
+                    and self.requests_reset_at and self.requests_reset_at > now:
+                waits.append(self.requests_reset_at - now)
+            if self.remaining_tokens is not None and self.remaining_tokens < estimated_tokens \
+                    and self.tokens_reset_at and self.tokens_reset_at > now:
+                waits.append(self.tokens_reset_at - now)
+        return max(waits)
+
+    def _reserve(self, estimated_tokens: int):
+        """Optimistically spend budget so concurrent callers see it before headers arrive"""
+        with self._lock:
+            if self.remaining_requests is not None:
+                self.remaining_requests -= 1
+            if self.remaining_tokens is not None:
+                self.remaining_tokens -= estimated_tokens
+
+    def _backoff(self, attempt: int) -> float:
+        ceiling = min(self.max_backoff, self.base_backoff * (2 ** attempt))
+        return random.uniform(ceiling / 2, ceiling)
+
+    async def run(self, call: Callable[[], Awaitable[Any]], deadline: Optional[float] = None, estimated_tokens: int = 0):
+        """
+        Execute call() within the rate limit budget
+
+        Args:
+            call: zero-arg coroutine factory performing one API request
+            deadline: absolute time.monotonic() by which the answer is needed
+            estimated_tokens: prompt + max_tokens estimate for the token budget
+        """
+        attempt = 0
+        while True:
+            wait = self.delay_for(estimated_tokens)
+            if wait > 0:
+                if deadline is not None and time.monotonic() + wait > deadline:
+                    self.rerouted += 1
+                    raise ModelProviderError(
+                        f"{self.provider} rate limit budget exhausted for {wait:.1f}s",
+                        provider=self.provider, status_code=429, retry_after=wait
+                    )
+                self.throttled += 1
+                await asyncio.sleep(wait + random.uniform(0, 0.1 * wait))
+
+            self._reserve(estimated_tokens)
+            try:
+                return await call()
+            except Exception as e:
+                if find_status_code(e) != 429:
+                    raise
+                attempt += 1
+                backoff = max(self.delay_for(estimated_tokens), self._backoff(attempt))
+                if attempt >= self.max_attempts or (deadline is not None and time.monotonic() + backoff > deadline):
+                    self.rerouted += 1
+                    raise ModelProviderError(
+                        str(e), provider=self.provider, status_code=429, retry_after=backoff
+                    ) from e
+                self.retried += 1
+                print(f"[RATE LIMIT] {self.provider} 429 - retrying in {backoff:.2f}s (attempt {attempt + 1})")
+                await asyncio.sleep(backoff)
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "remaining_requests": self.remaining_requests,
+                "remaining_tokens": self.remaining_tokens,
+                "blocked_for_s": round(max(0.0, (self.blocked_until or 0) - now), 2),
+                "throttled": self.throttled,
+                "retried": self.retried,
+                "rerouted": self.rerouted,
+            }
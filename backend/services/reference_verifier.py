@@ -0,0 +1,210 @@
+"""
+Reference Verifier - post-generation check of cited PMIDs/DOIs
+Every reference in an answer's References section is resolved in one batch:
+the local PMID store first, then a single esummary call for the misses (DOI-only
+citations are first mapped to PMIDs with one esearch query). Citations
+whose metadata is slightly off (authors, year) are rewritten from PubMed; those
+pointing at a different or non-existent article are flagged.
+"""
+import os
+import re
+import time
+import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Any, Dict, List, Optional, Tuple
+
+from .pmid_store import pmid_store, normalize_doi
+from .pubmed_service import pubmed_service, TTLCache
+from .response_models import Reference
+
+# "correct" rewrites fixable citations and flags the rest, "flag" only flags, "off" disables
+REFERENCE_VERIFY_MODE = os.getenv("REFERENCE_VERIFY_MODE", "correct").lower()
+# Total time the stage may add to a request, remote lookup included
+REFERENCE_VERIFY_BUDGET_SECONDS = float(os.getenv("REFERENCE_VERIFY_BUDGET_SECONDS", "1.5"))
+REFERENCE_VERIFY_WORKERS = int(os.getenv("REFERENCE_VERIFY_WORKERS", "4"))
+REFERENCE_FLAG_TEXT = os.getenv("REFERENCE_FLAG_TEXT", "[unverified citation]")
+
+_REFERENCES_RE = re.compile(r'References?:\s*\n([\s\S]+)$', re.IGNORECASE)
+_LINE_RE = re.compile(r'^\s*(?:\[(\d+)\]|(\d+)\.)\s*(.+)$')
+_PMID_RE = re.compile(r'(?:PMID:?\s*|pubmed\.ncbi\.nlm\.nih\.gov/)(\d{1,9})', re.IGNORECASE)
+_DOI_RE = re.compile(r'(?:doi:\s*|doi\.org/)(10\.\d{4,9}/\S+)', re.IGNORECASE)
+# APA as written by Reference.format_citation: "Authors. (Year). Title. Journal...". Titles
+# contain ". " too ("vs. ibuprofen", "U.S. children"), so the title runs up to the
+# doi/PMID/URL segment and keeps the journal; pmid_store.title_matches compares by prefix
+_APA_RE = re.compile(
+    r'^(?P<authors>.+?)\.?\s*\((?P<year>\d{4})[a-z]?\)\.\s*(?P<title>.+?)\.?\s*(?=doi:|PMID|https?://|\[|$)',
+    re.IGNORECASE
+)
+_YEAR_RE = re.compile(r'\b(19|20)\d{2}\b')
+
+# Mismatches a rewrite from PubMed can fix without changing which article is cited
+_CORRECTABLE = {"authors", "year"}
+
+
+def extract_references(answer: str) -> List[Dict[str, Any]]:
+    """Cited references (number, pmid, doi, title, authors, year, line) from an answer's References section"""
+    match = _REFERENCES_RE.search(answer or "")
+    if not match:
+        return []
+    offset = match.start(1)
+    references = []
+    for line in match.group(1).split("\n"):
+        line_match = _LINE_RE.match(line)
+        if line_match:
+            citation = line_match.group(3).strip()
+            pmid = _PMID_RE.search(citation)
+            doi = _DOI_RE.search(citation)
+            apa = _APA_RE.match(citation)
+            year = apa.group("year") if apa else (_YEAR_RE.search(citation).group() if _YEAR_RE.search(citation) else None)
+            references.append({
+                "number": int(line_match.group(1) or line_match.group(2)),
+                "pmid": pmid.group(1) if pmid else None,
+                "doi": doi.group(1).rstrip(".,;)") if doi else None,
+                "title": apa.group("title") if apa else None,
+                "authors": apa.group("authors") if apa else None,
+                "year": int(year) if year else None,
+                "line": line,
+                "start": offset,
+            })
+        offset += len(line) + 1
+    return references
+
+
+def format_reference(number: int, record: Dict) -> str:
+    """APA citation line for a stored/fetched article, as the structured models render it"""
+    reference = Reference.model_construct(
+        number=number,
+        authors=(record.get("authors") or "Unknown authors").rstrip("."),
+        title=(record.get("title") or "").rstrip("."),
+        journal=record.get("journal") or "Unknown journal",
+        year=record.get("year") or "n.d.",
+        volume_issue=record.get("volume_issue"),
+        pages=record.get("pages"),
+        doi=record.get("doi"),
+        pmid=record.get("pmid"),
+        url=record.get("url") or f"https://pubmed.ncbi.nlm.nih.gov/{record.get('pmid')}/",
+    )
+    return f"[{number}] {reference.format_citation()}"
+
+
+class ReferenceVerifier:
+    """Resolves and checks an answer's citations within a latency budget"""
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=REFERENCE_VERIFY_WORKERS, thread_name_prefix="refcheck")
+        # PMIDs PubMed said do not exist - not worth asking again
+        self._invalid = TTLCache()
+
+    @property
+    def enabled(self) -> bool:
+        return REFERENCE_VERIFY_MODE in ("correct", "flag")
+
+    def _resolve(self, references: List[Dict], deadline: float) -> Tuple[List[Dict], bool]:
+        """
+        verify_references results, with local misses looked up remotely: DOI-only
+        citations through one esearch [doi] query, then all PMIDs in one esummary call
+        """
+        results = pmid_store.verify_references(references)
+        unknown = [r["reference"] for r in results if r["status"] == "unknown"]
+        unresolved = [
+            ref["pmid"] for ref in unknown
+            if ref.get("pmid") and self._invalid.get(ref["pmid"]) is None
+        ]
+        dois = [normalize_doi(ref["doi"]) for ref in unknown if not ref.get("pmid") and ref.get("doi")]
+        if not unresolved and not dois or deadline - time.monotonic() <= 0.05:
+            return results, False
+
+        if dois:
+            unresolved += pubmed_service.find_pmids_by_doi(dois, timeout=deadline - time.monotonic())
+        remaining = deadline - time.monotonic()
+        if not unresolved or remaining <= 0.05:
+            return results, True
+
+        found, invalid = pubmed_service.fetch_summaries(list(dict.fromkeys(unresolved)), timeout=remaining)
+        for pmid in invalid:
+            self._invalid.set(pmid, True)
+        if found:
+            rechecked = iter(pmid_store.verify_references(unknown, articles=found))
+            results = [next(rechecked) if r["status"] == "unknown" else r for r in results]
+        return results, True
+
+    def verify_answer(self, answer: str, budget: float = REFERENCE_VERIFY_BUDGET_SECONDS) -> Tuple[str, Optional[Dict]]:
+        """(answer with citations corrected/flagged, report) - report is None if nothing was cited"""
+        started = time.monotonic()
+        references = extract_references(answer) if self.enabled else []
+        if not references:
+            return answer, None
+
+        try:
+            results, remote = self._resolve(references, started + budget)
+        except Exception as e:
+            print(f"[REFCHECK] Verification failed: {e}")
+            return answer, None
+
+        counts = {"verified": 0, "corrected": 0, "flagged": 0, "unknown": 0}
+        details = []
+        replacements = []
+        for result in results:
+            ref, status = result["reference"], result["status"]
+            if status == "unknown" and ref.get("pmid") and self._invalid.get(ref["pmid"]):
+                status = "flagged"
+            elif status == "mismatch":
+                fixable = set(result["mismatches"]) <= _CORRECTABLE
+                status = "corrected" if fixable and REFERENCE_VERIFY_MODE == "correct" else "flagged"
+
+            if status == "corrected":
+                replacements.append((ref, format_reference(ref["number"], result["record"])))
+            elif status == "flagged" and REFERENCE_FLAG_TEXT not in ref["line"]:
+                replacements.append((ref, f"{ref['line'].rstrip()} {REFERENCE_FLAG_TEXT}"))
+
+            counts[status] += 1
+            details.append({
+                "number": ref["number"], "pmid": ref.get("pmid"), "doi": normalize_doi(ref.get("doi")),
+                "status": status, "mismatches": result["mismatches"],
+            })
+
+        # Splice from the end so earlier offsets stay valid
+        for ref, line in sorted(replacements, key=lambda item: item[0]["start"], reverse=True):
+            answer = answer[:ref["start"]] + line + answer[ref["start"] + len(ref["line"]):]
+
+        elapsed_ms = int((time.monotonic() - started) * 1000)
+        if counts["corrected"] or counts["flagged"]:
+            print(f"[REFCHECK] {counts['corrected']} corrected, {counts['flagged']} flagged of {len(references)} in {elapsed_ms}ms")
+        return answer, {
+            "checked": len(references),
+            **counts,
+            "remote_lookup": remote,
+            "elapsed_ms": elapsed_ms,
+            "references": details,
+        }
+
+    def submit(self, answer: str) -> Future:
+        """Start verify_answer on the worker pool so the caller can do its logging meanwhile"""
+        return self._executor.submit(self.verify_answer, answer)
+
+    def result(self, future: Optional[Future], answer: str, timeout: float = REFERENCE_VERIFY_BUDGET_SECONDS) -> Tuple[str, Optional[Dict]]:
+        """Outcome of submit(), or the unchanged answer if it overran the budget"""
+        if future is None:
+            return answer, None
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            print("[REFCHECK] Skipped: over latency budget")
+        except Exception as e:
+            print(f"[REFCHECK] Verification failed: {e}")
+        return answer, None
+
+    async def result_async(self, future: Optional[Future], answer: str, timeout: float = REFERENCE_VERIFY_BUDGET_SECONDS) -> Tuple[str, Optional[Dict]]:
+        """result() for async handlers"""
+        if future is None:
+            return answer, None
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            print("[REFCHECK] Skipped: over latency budget")
+        except Exception as e:
+            print(f"[REFCHECK] Verification failed: {e}")
+        return answer, None
+
+
+reference_verifier = ReferenceVerifier()
@@ -0,0 +1,205 @@
+"""
+Structured Output Repair
+Salvages model JSON that failed schema validation (too few paragraphs, a reference
+missing its year, trailing commas...) locally, so we only pay for a second LLM call
+when the output is genuinely unusable
+"""
+import os
+import re
+import json
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+from pydantic import BaseModel, ValidationError
+
+from .response_models import Reference
+
+_CODE_FENCE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$", re.IGNORECASE)
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_YEAR = re.compile(r"\b(19|20)\d{2}\b")
+_PMID = re.compile(r"\d{5,9}")
+
+# A salvaged answer must keep at least this many citable references (capped at the
+# model's own minimum); fewer fall through to the re-ask
+STRUCTURED_REPAIR_MIN_REFERENCES = int(os.getenv("STRUCTURED_REPAIR_MIN_REFERENCES", "1"))
+
+
+def completion_text(error: BaseException) -> Optional[str]:
+    """
+    Raw model text carried by an instructor retry/validation exception, or by a
+    Groq 400 rejecting the model's malformed tool call ("failed_generation"), if any
+    """
+    completion = getattr(error, "last_completion", None)
+    if completion is not None:
+        try:
+            return completion.choices[0].message.content
+        except (AttributeError, IndexError, TypeError):
+            pass
+    current, seen = error, set()
+    while current is not None and id(current) not in seen:
+        seen.add(id(current))
+        body = getattr(current, "body", None)
+        if isinstance(body, dict):
+            detail = body.get("error") if isinstance(body.get("error"), dict) else body
+            if detail.get("failed_generation"):
+                return detail["failed_generation"]
+        wrapped = current.args[0] if current.args and isinstance(current.args[0], BaseException) else None
+        current = wrapped or current.__cause__ or current.__context__
+    return None
+
+
+def parse_json_leniently(raw_text: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Parse a JSON object out of model text: code fences, prose around it, trailing commas"""
+    if not raw_text:
+        return None
+    text = _CODE_FENCE.sub("", raw_text.strip())
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end <= start:
+        return None
+    text = text[start:end + 1]
+
+    for candidate in (text, _TRAILING_COMMA.sub(r"\1", text)):
+        try:
+            data = json.loads(candidate, strict=False)
+        except json.JSONDecodeError:
+            continue
+        return data if isinstance(data, dict) else None
+    return None
+
+
+def _length_bounds(response_model: Type[BaseModel], field_name: str) -> Tuple[int, Optional[int]]:
+    """(min_length, max_length) declared on a list field via min_items/max_items"""
+    field = response_model.model_fields.get(field_name)
+    low, high = 0, None
+    for constraint in getattr(field, "metadata", []) or []:
+        low = getattr(constraint, "min_length", low)
+        high = getattr(constraint, "max_length", high)
+    return low, high
+
+
+def _as_text(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple)):
+        value = ", ".join(str(v) for v in value if v)
+    value = str(value).strip()
+    return value or None
+
+
+def _repair_paragraphs(value: Any, low: int, high: Optional[int], flags: List[str]) -> List[str]:
+    if isinstance(value, str):
+        value = re.split(r"\n\s*\n", value)
+        flags.append("paragraphs_split")
+    paragraphs = [p for p in (_as_text(v) for v in (value or [])) if p]
+    if high is not None and len(paragraphs) > high:
+        # Keep the content - fold the overflow into the last allowed paragraph
+        paragraphs = paragraphs[:high - 1] + [" ".join(paragraphs[high - 1:])]
+        flags.append("paragraphs_merged")
+    if len(paragraphs) < low:
+        flags.append("paragraphs_below_min")
+    return paragraphs
+
+
+def _repair_reference(raw: Any, index: int, flags: List[str]) -> Optional[BaseModel]:
+    """Coerce one reference; returns None when it can't be made citable"""
+    if not isinstance(raw, dict):
+        return None
+    ref = {key: _as_text(value) for key, value in raw.items()}
+    if not ref.get("title"):
+        return None
+
+    try:
+        ref["number"] = int(str(ref.get("number") or "").strip("[] ") or index)
+    except ValueError:
+        ref["number"] = index
+
+    pmid = ref.get("pmid")
+    if pmid:
+        match = _PMID.search(pmid)
+        ref["pmid"] = match.group(0) if match else None
+    if not ref.get("url"):
+        if ref.get("pmid"):
+            ref["url"] = f"https://pubmed.ncbi.nlm.nih.gov/{ref['pmid']}/"
+        elif ref.get("doi"):
+            ref["url"] = f"https://doi.org/{ref['doi']}"
+        else:
+            return None
+        flags.append("reference_url_filled")
+    if not ref.get("journal"):
+        ref["journal"] = ""
+        flags.append("reference_journal_missing")
+    if not ref.get("authors"):
+        ref["authors"] = ref["journal"] or "Anonymous"
+        flags.append("reference_authors_filled")
+
+    year_source = " ".join(str(ref.get(k) or "") for k in ("year", "volume_issue", "journal", "title"))
+    year = _YEAR.search(year_source)
+    ref["year"] = int(year.group(0)) if year else 0
+
+    fields = {k: v for k, v in ref.items() if k in Reference.model_fields}
+    try:
+        reference = Reference.model_validate(fields)
+    except ValidationError:
+        return None
+    if not year:
+        # APA convention for an undated source
+        reference = reference.model_copy(update={"year": "n.d."})
+        flags.append("reference_year_missing")
+    return reference
+
+
+def _repair_references(value: Any, low: int, high: Optional[int], flags: List[str]) -> List[BaseModel]:
+    raw_refs = value if isinstance(value, list) else []
+    references = []
+    for i, raw in enumerate(raw_refs, start=1):
+        reference = _repair_reference(raw, i, flags)
+        if reference is None:
+            flags.append("reference_dropped")
+            continue
+        references.append(reference)
+    if high is not None and len(references) > high:
+        references = references[:high]
+        flags.append("references_truncated")
+    if len(references) < low:
+        flags.append("references_below_min")
+    return references
+
+
+def repair_structured_output(
+    raw_text: Optional[str],
+    response_model: Type[BaseModel]
+) -> Tuple[Optional[BaseModel], List[str]]:
+    """
+    Repair model output against a *Response model (PatientResponse etc.)
+
+    Returns:
+        (instance, flags) - instance is None when repair failed. Flags name every
+        relaxation applied; min/max item constraints are relaxed via model_construct
+        rather than rejected, except that an answer left with fewer than
+        STRUCTURED_REPAIR_MIN_REFERENCES references is not accepted.
+    """
+    flags: List[str] = []
+    data = parse_json_leniently(raw_text)
+    if data is None:
+        return None, ["unparseable"]
+
+    low, high = _length_bounds(response_model, "paragraphs")
+    paragraphs = _repair_paragraphs(data.get("paragraphs"), low, high, flags)
+    if not paragraphs:
+        return None, flags + ["no_paragraphs"]
+
+    low, high = _length_bounds(response_model, "references")
+    references = _repair_references(data.get("references"), low, high, flags)
+    if len(references) < min(low, STRUCTURED_REPAIR_MIN_REFERENCES):
+        # The answer contract requires citations - re-ask rather than ship none
+        return None, flags + ["too_few_references"]
+
+    values = {"paragraphs": paragraphs, "references": references}
+    for name in response_model.model_fields:
+        if name not in values:
+            values[name] = _as_text(data.get(name))
+
+    try:
+        return response_model.model_validate(values), flags
+    except ValidationError:
+        # Only relaxed count/year constraints remain - every field was coerced above
+        return response_model.model_construct(**values), flags
@@ -0,0 +1,135 @@
+"""
+Token Budget - adaptive max_tokens per user_mode
+Learns each persona's answer-length distribution from recorded usage and reserves
+a high percentile plus headroom, instead of one fixed limit that is either slow
+(too high) or silently truncates structured output (too low)
+"""
+import os
+import math
+import threading
+from collections import deque
+from typing import Any, Dict, Optional
+
+from sqlalchemy import text
+
+# Fixed limits used until a mode has enough samples
+DEFAULT_MAX_TOKENS = {"patient": 1400, "doctor": 1500, "researcher": 1600}
+TOKEN_BUDGET_PERCENTILE = float(os.getenv("TOKEN_BUDGET_PERCENTILE", "95"))
+TOKEN_BUDGET_HEADROOM = float(os.getenv("TOKEN_BUDGET_HEADROOM", "0.15"))
+TOKEN_BUDGET_MIN_SAMPLES = int(os.getenv("TOKEN_BUDGET_MIN_SAMPLES", "20"))
+TOKEN_BUDGET_WINDOW = int(os.getenv("TOKEN_BUDGET_WINDOW", "300"))
+TOKEN_BUDGET_FLOOR = int(os.getenv("TOKEN_BUDGET_FLOOR", "600"))
+TOKEN_BUDGET_CEILING = int(os.getenv("TOKEN_BUDGET_CEILING", "4000"))
+# A truncated answer needed more than its budget - count it as this multiple of the budget
+TOKEN_BUDGET_TRUNCATION_BUMP = float(os.getenv("TOKEN_BUDGET_TRUNCATION_BUMP", "1.25"))
+
+
+def is_truncated(finish_reason: Optional[str], completion_tokens: Optional[int] = None, max_tokens: Optional[int] = None) -> bool:
+    """True when the model stopped because it ran out of max_tokens"""
+    if finish_reason == "length":
+        return True
+    return bool(max_tokens and completion_tokens and completion_tokens >= max_tokens)
+
+
+class TokenBudgetController:
+    """Per-mode rolling window of answer lengths (completion tokens)"""
+
+    def __init__(self):
+        self._samples: Dict[str, deque] = {}
+        self._observed: Dict[str, int] = {}
+        self._truncated: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._seeded = False
+
+    def _window(self, user_mode: str) -> deque:
+        if user_mode not in self._samples:
+            self._samples[user_mode] = deque(maxlen=TOKEN_BUDGET_WINDOW)
+        return self._samples[user_mode]
+
+    @property
+    def seeded(self) -> bool:
+        return self._seeded
+
+    def seed_from_db(self, db) -> None:
+        """Load recent answer lengths from chat_logs once per process"""
+        with self._lock:
+            if self._seeded:
+                return
+            self._seeded = True
+        try:
+            rows = db.execute(
+                text("SELECT user_mode, completion_tokens FROM chat_logs "
+                     "WHERE completion_tokens IS NOT NULL AND user_mode IS NOT NULL "
+                     "ORDER BY id DESC LIMIT :limit"),
+                {"limit": TOKEN_BUDGET_WINDOW * len(DEFAULT_MAX_TOKENS)}
+            ).fetchall()
+        except Exception as e:
+            print(f"[TOKENS] Could not seed token budgets: {e}")
+            db.rollback()
+            return
+        with self._lock:
+            for user_mode, completion_tokens in reversed(rows):
+                self._window(user_mode).append(int(completion_tokens))
+        print(f"[TOKENS] Seeded token budgets from {len(rows)} chat logs")
+
+    def max_tokens_for(self, user_mode: str) -> int:
+        """max_tokens to reserve for the next answer in this mode"""
+        default = DEFAULT_MAX_TOKENS.get(user_mode, DEFAULT_MAX_TOKENS["patient"])
+        with self._lock:
+            samples = sorted(self._samples.get(user_mode, ()))
+        if len(samples) < TOKEN_BUDGET_MIN_SAMPLES:
+            return default
+        index = min(len(samples) - 1, int(math.ceil(TOKEN_BUDGET_PERCENTILE / 100.0 * len(samples))) - 1)
+        budget = int(math.ceil(samples[max(index, 0)] * (1 + TOKEN_BUDGET_HEADROOM)))
+        return max(TOKEN_BUDGET_FLOOR, min(TOKEN_BUDGET_CEILING, budget))
+
+    def retry_budget(self, max_tokens: int) -> int:
+        """Budget for re-asking after an answer was cut off at max_tokens"""
+        return min(TOKEN_BUDGET_CEILING, int(math.ceil(max_tokens * TOKEN_BUDGET_TRUNCATION_BUMP)))
+
+    def observe(self, user_mode: str, completion_tokens: Optional[int], max_tokens: Optional[int] = None, finish_reason: Optional[str] = None):
+        """Record one answer's length; truncated answers count as longer than their budget"""
+        if not completion_tokens:
+            return
+        truncated = is_truncated(finish_reason, completion_tokens, max_tokens)
+        sample = completion_tokens
+        if truncated:
+            sample = int(max(completion_tokens, max_tokens or 0) * TOKEN_BUDGET_TRUNCATION_BUMP)
+            print(f"[TOKENS] {user_mode} answer truncated at {max_tokens or completion_tokens} tokens")
+        with self._lock:
+            self._window(user_mode).append(sample)
+            self._observed[user_mode] = self._observed.get(user_mode, 0) + 1
+            if truncated:
+                self._truncated[user_mode] = self._truncated.get(user_mode, 0) + 1
+
+    def observe_usage(self, user_mode: str, usage: Any):
+        """Record the answering completion of a RequestUsage (usage_tracker)"""
+        calls = getattr(usage, "calls", None)
+        if not calls:
+            return
+        # Earlier attempts only matter if they were cut off (e.g. truncated JSON that failed validation)
+        for call in calls[:-1]:
+            if is_truncated(call.get("finish_reason"), call.get("completion_tokens"), call.get("max_tokens")):
+                self.observe(user_mode, call.get("completion_tokens"), call.get("max_tokens"), call.get("finish_reason"))
+        final = calls[-1]
+        self.observe(user_mode, final.get("completion_tokens"), final.get("max_tokens"), final.get("finish_reason"))
+
+    def snapshot(self) -> Dict[str, Any]:
+        modes = set(DEFAULT_MAX_TOKENS) | set(self._samples)
+        result = {}
+        for user_mode in sorted(modes):
+            with self._lock:
+                samples = len(self._samples.get(user_mode, ()))
+                observed = self._observed.get(user_mode, 0)
+                truncated = self._truncated.get(user_mode, 0)
+            result[user_mode] = {
+                "max_tokens": self.max_tokens_for(user_mode),
+                "samples": samples,
+                "observed": observed,
+                "truncated": truncated,
+                "truncation_rate": round(truncated / observed, 3) if observed else None,
+            }
+        return result
+
+
+token_budget = TokenBudgetController()
@@ -0,0 +1,121 @@
+"""
+Usage Tracker - per-request token accounting
+Provider services report the usage block of every completion; the chat handler
+collects it for the request in flight (contextvar) and stores it on chat_logs
+"""
+import os
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from .llm_recorder import usage_dict
+
+# USD per million (prompt, completion) tokens; override with "model:in:out;model:in:out"
+DEFAULT_PRICING = {
+    "llama-3.3-70b-versatile": (0.59, 0.79),
+    "llama-3.1-8b-instant": (0.05, 0.08),
+    "deepseek-chat": (0.27, 1.10),
+}
+
+
+def _parse_pricing(raw: str) -> Dict[str, tuple]:
+    pricing = dict(DEFAULT_PRICING)
+    for item in raw.split(";"):
+        parts = item.strip().split(":")
+        if len(parts) != 3:
+            continue
+        try:
+            pricing[parts[0].strip()] = (float(parts[1]), float(parts[2]))
+        except ValueError:
+            continue
+    return pricing
+
+
+LLM_PRICING = _parse_pricing(os.getenv("LLM_PRICING", ""))
+
+
+def estimate_cost(model: Optional[str], prompt_tokens: int, completion_tokens: int) -> Optional[float]:
+    """Estimated USD cost, or None for a model without a price"""
+    price = LLM_PRICING.get(model or "")
+    if price is None:
+        return None
+    return round((prompt_tokens * price[0] + completion_tokens * price[1]) / 1_000_000, 6)
+
+
+class RequestUsage:
+    """Token totals for every completion made while serving one request"""
+
+    def __init__(self):
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.total_tokens = 0
+        self.calls: List[Dict[str, Any]] = []
+        self.model: Optional[str] = None
+        # Answers accepted only after local structured-output repair (relaxation flags)
+        self.output_repairs: List[Dict[str, Any]] = []
+        # Completions are reported from executor threads (hedged attempts can overlap)
+        self._lock = threading.Lock()
+
+    def add(self, provider: str, model: str, usage: Dict[str, int], finish_reason: Optional[str] = None, max_tokens: Optional[int] = None):
+        with self._lock:
+            self.prompt_tokens += usage["prompt_tokens"]
+            self.completion_tokens += usage["completion_tokens"]
+            self.total_tokens += usage["total_tokens"] or usage["prompt_tokens"] + usage["completion_tokens"]
+            self.calls.append({
+                "provider": provider, "model": model, **usage,
+                "finish_reason": finish_reason, "max_tokens": max_tokens
+            })
+            # The answer comes from the last completion
+            self.model = model
+
+    @property
+    def has_usage(self) -> bool:
+        return bool(self.calls)
+
+
+_current: contextvars.ContextVar[Optional[RequestUsage]] = contextvars.ContextVar("llm_request_usage", default=None)
+# Per-attempt listener, e.g. the router charging a hedged loser's tokens to the hedge budget
+_attempt_listener: contextvars.ContextVar[Optional[Callable[[Dict[str, int]], None]]] = contextvars.ContextVar("llm_attempt_usage", default=None)
+
+
+@contextmanager
+def track_usage() -> Iterator[RequestUsage]:
+    """with track_usage() as usage: <generate> - tasks started inside inherit the tracker"""
+    usage = RequestUsage()
+    token = _current.set(usage)
+    try:
+        yield usage
+    finally:
+        _current.reset(token)
+
+
+def note_output_repair(provider: str, flags: List[str]):
+    """Record that the current request's answer was repaired locally, so the chat log shows it"""
+    tracker = _current.get()
+    if tracker is not None:
+        with tracker._lock:
+            tracker.output_repairs.append({"provider": provider, "flags": list(flags)})
+
+
+@contextmanager
+def attempt_usage(listener: Callable[[Dict[str, int]], None]) -> Iterator[None]:
+    """Also pass the usage of completions made inside the block to listener"""
+    token = _attempt_listener.set(listener)
+    try:
+        yield
+    finally:
+        _attempt_listener.reset(token)
+
+
+def add_usage(provider: str, model: str, usage: Any, finish_reason: Optional[str] = None, max_tokens: Optional[int] = None):
+    """Report a completion's usage block (SDK object or dict) for the current request"""
+    normalized = usage_dict(usage)
+    if normalized is None:
+        return
+    listener = _attempt_listener.get()
+    if listener is not None:
+        listener(normalized)
+    tracker = _current.get()
+    if tracker is not None:
+        tracker.add(provider, model, normalized, finish_reason=finish_reason, max_tokens=max_tokens)
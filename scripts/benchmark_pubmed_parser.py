@@ -0,0 +1,195 @@
+"""
+Benchmark the streaming PubMed efetch parser against the previous fromstring parser
+
+Usage:
+    python scripts/benchmark_pubmed_parser.py [--articles 500] [--repeat 3] [--file efetch.xml]
+
+Without --file a synthetic efetch payload is generated with realistic structure
+(abstracts, MeSH headings and ~30 cited references per article).
+"""
+
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+from io import BytesIO
+from xml.etree import ElementTree as ET
+
+# Add repo root to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from backend.services.pubmed_service import iter_pubmed_articles
+
+
+def legacy_parse_article(article_elem):
+    """The parser fetch_article_details used before the streaming rewrite (recursive .// lookups)"""
+    try:
+        medline = article_elem.find(".//MedlineCitation")
+        article_node = medline.find(".//Article")
+        pmid = medline.find(".//PMID").text
+        title_elem = article_node.find(".//ArticleTitle")
+        title = title_elem.text if title_elem is not None else "No title"
+
+        authors = []
+        author_list = article_node.find(".//AuthorList")
+        if author_list is not None:
+            for author in author_list.findall(".//Author")[:3]:
+                lastname = author.find(".//LastName")
+                forename = author.find(".//ForeName")
+                initials = author.find(".//Initials")
+                if lastname is not None:
+                    if initials is not None:
+                        authors.append(f"{lastname.text}, {initials.text}")
+                    elif forename is not None:
+                        authors.append(f"{lastname.text}, {forename.text[0]}")
+                    else:
+                        authors.append(lastname.text)
+            if len(author_list.findall(".//Author")) > 3:
+                authors.append("et al.")
+        author_string = ", ".join(authors) if authors else "Unknown authors"
+
+        journal_elem = article_node.find(".//Journal")
+        journal_title, volume, issue, year, pages = "Unknown journal", None, None, None, None
+        if journal_elem is not None:
+            journal_title_elem = journal_elem.find(".//Title")
+            if journal_title_elem is not None:
+                journal_title = journal_title_elem.text
+            pub_date = journal_elem.find(".//PubDate")
+            if pub_date is not None:
+                year_elem = pub_date.find(".//Year")
+                if year_elem is not None:
+                    year = year_elem.text
+            issue_node = journal_elem.find(".//JournalIssue")
+            if issue_node is not None:
+                vol_elem = issue_node.find(".//Volume")
+                if vol_elem is not None:
+                    volume = vol_elem.text
+                issue_elem = issue_node.find(".//Issue")
+                if issue_elem is not None:
+                    issue = issue_elem.text
+        pagination = article_node.find(".//Pagination/MedlinePgn")
+        if pagination is not None:
+            pages = pagination.text
+
+        doi = None
+        for aid in article_elem.findall(".//ArticleId"):
+            if aid.get("IdType") == "doi":
+                doi = aid.text
+                break
+
+        volume_issue = f"{volume}({issue})" if volume and issue else volume
+        return {
+            "pmid": pmid, "title": title, "authors": author_string, "journal": journal_title,
+            "year": int(year) if year else None, "volume_issue": volume_issue, "pages": pages,
+            "doi": doi, "url": f"https://pubmed.ncbi.nlm.nih.gov/{pmid}/"
+        }
+    except Exception:
+        return None
+
+
+def legacy_parse(content: bytes):
+    root = ET.fromstring(content)
+    return [a for a in (legacy_parse_article(e) for e in root.findall(".//PubmedArticle")) if a]
+
+
+def streaming_parse(content: bytes):
+    return list(iter_pubmed_articles(BytesIO(content)))
+
+
+def synthetic_efetch(count: int, refs_per_article: int = 30) -> bytes:
+    """efetch-shaped XML with the bulky parts real payloads have"""
+    parts = ["<?xml version=\"1.0\" ?><PubmedArticleSet>"]
+    abstract = " ".join(["Hepatotoxicity was assessed across cohorts with dose-dependent exposure."] * 12)
+    for n in range(count):
+        pmid = 30000000 + n
+        authors = "".join(
+            f"<Author ValidYN=\"Y\"><LastName>Author{a}</LastName><ForeName>First{a}</ForeName><Initials>F</Initials>"
+            f"<AffiliationInfo><Affiliation>Department of Pharmacology, University {a}</Affiliation></AffiliationInfo></Author>"
+            for a in range(6)
+        )
+        mesh = "".join(
+            f"<MeshHeading><DescriptorName UI=\"D{m:06d}\" MajorTopicYN=\"N\">Term {m}</DescriptorName></MeshHeading>"
+            for m in range(15)
+        )
+        references = "".join(
+            f"<Reference><Citation>Cited work {r}. J Tox. 2001;{r}:1-9.</Citation><ArticleIdList>"
+            f"<ArticleId IdType=\"pubmed\">{10000000 + r}</ArticleId><ArticleId IdType=\"doi\">10.9999/cited.{r}</ArticleId>"
+            f"</ArticleIdList></Reference>"
+            for r in range(refs_per_article)
+        )
+        parts.append(
+            f"<PubmedArticle><MedlineCitation Status=\"MEDLINE\" Owner=\"NLM\"><PMID Version=\"1\">{pmid}</PMID>"
+            f"<Article PubModel=\"Print\"><Journal><ISSN IssnType=\"Print\">0000-0000</ISSN>"
+            f"<JournalIssue CitedMedium=\"Print\"><Volume>{n % 90 + 1}</Volume><Issue>{n % 12 + 1}</Issue>"
+            f"<PubDate><Year>{1990 + n % 35}</Year><Month>Jan</Month></PubDate></JournalIssue>"
+            f"<Title>Journal of Toxicology {n % 7}</Title></Journal>"
+            f"<ArticleTitle>Study {n} of drug interactions and hepatotoxicity</ArticleTitle>"
+            f"<Pagination><MedlinePgn>{n}-{n + 9}</MedlinePgn></Pagination>"
+            f"<Abstract><AbstractText>{abstract}</AbstractText></Abstract>"
+            f"<AuthorList CompleteYN=\"Y\">{authors}</AuthorList></Article>"
+            f"<MeshHeadingList>{mesh}</MeshHeadingList></MedlineCitation>"
+            f"<PubmedData><ArticleIdList><ArticleId IdType=\"pubmed\">{pmid}</ArticleId>"
+            f"<ArticleId IdType=\"doi\">10.1000/study.{n}</ArticleId></ArticleIdList>"
+            f"<ReferenceList>{references}</ReferenceList></PubmedData></PubmedArticle>"
+        )
+    parts.append("</PubmedArticleSet>")
+    return "".join(parts).encode("utf-8")
+
+
+def measure(parse, content: bytes, repeat: int):
+    """(best seconds, peak traced MiB, articles)"""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        articles = parse(content)
+        best = min(best, time.perf_counter() - started)
+    tracemalloc.start()
+    parse(content)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak / (1024 * 1024), articles
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark PubMed efetch XML parsers")
+    parser.add_argument("--articles", type=int, default=500, help="Synthetic articles to generate")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per parser (best is reported)")
+    parser.add_argument("--file", help="Parse a saved efetch XML file instead of synthetic data")
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, "rb") as f:
+            content = f.read()
+        source = args.file
+    else:
+        content = synthetic_efetch(args.articles)
+        source = f"synthetic ({args.articles} articles)"
+
+    print("=" * 60)
+    print("🔬 PubMed efetch parser benchmark")
+    print("=" * 60)
+    print(f"Input: {source}, {len(content) / (1024 * 1024):.1f} MiB")
+
+    legacy_s, legacy_mb, legacy_articles = measure(legacy_parse, content, args.repeat)
+    stream_s, stream_mb, stream_articles = measure(streaming_parse, content, args.repeat)
+
+    print(f"\n{'parser':<12}{'articles':>10}{'best s':>10}{'art/s':>10}{'peak MiB':>10}")
+    for name, seconds, peak, articles in (
+        ("fromstring", legacy_s, legacy_mb, legacy_articles),
+        ("iterparse", stream_s, stream_mb, stream_articles),
+    ):
+        print(f"{name:<12}{len(articles):>10}{seconds:>10.3f}{len(articles) / seconds:>10.0f}{peak:>10.1f}")
+    print(f"\nSpeedup: {legacy_s / stream_s:.2f}x, peak memory: {legacy_mb / max(stream_mb, 1e-9):.1f}x lower")
+
+    differing = [
+        new["pmid"] for old, new in zip(legacy_articles, stream_articles) if old != new
+    ]
+    if len(legacy_articles) != len(stream_articles) or differing:
+        print(f"⚠ Outputs differ for {len(differing)} articles (e.g. {differing[:5]})")
+    else:
+        print("✓ Both parsers produced identical articles")
+
+
+if __name__ == "__main__":
+    main()
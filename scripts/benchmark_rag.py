@@ -0,0 +1,323 @@
+"""
+Benchmark RAG retrieval quality and speed on a fixed corpus
+
+Each backend configuration indexes scripts/rag_benchmark/corpus into a fresh
+temporary store and runs every query in scripts/rag_benchmark/queries.json.
+Configurations run in separate processes because rag_service reads its
+settings from the environment at import time.
+
+Reported per configuration:
+    recall@k, MRR    document-level relevance: each query lists the corpus files that
+                     answer it, and a retrieved chunk counts if its source is one of them
+    latency          retrieve_context with caches cleared (p50/p95/p99/mean ms) and on a cache hit
+    build            seconds to chunk, embed and persist the corpus, and the store size on disk
+
+Results are written as JSON so runs can be compared across commits
+(--compare prints the deltas against an earlier report; --output - keeps stdout pure JSON).
+
+Usage:
+    python scripts/benchmark_rag.py [--configs chroma:hybrid,chroma:vector,flat:hybrid,flat:vector]
+                                    [--k 1,3,5,10] [--repeat 5] [--output rag_benchmark.json]
+                                    [--compare previous.json]
+
+Model and chunking settings (EMBEDDING_MODEL, RAG_CHUNK_SIZE, RAG_RERANK_MODEL, ...)
+come from the environment as usual.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+
+import numpy as np
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BENCHMARK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rag_benchmark')
+
+# Add repo root to path
+sys.path.insert(0, REPO_ROOT)
+
+DEFAULT_CONFIGS = "chroma:hybrid,chroma:vector,flat:hybrid,flat:vector"
+# Unset so every store file lands in the temporary VECTOR_DB_PATH
+STORE_OVERRIDES = ("RAG_FLAT_PATH", "RAG_MANIFEST_PATH", "RAG_BM25_PATH", "RAG_DEDUP_PATH")
+
+
+def load_queries(path: str) -> list:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)["queries"]
+
+
+def load_corpus(directory: str) -> dict:
+    """{file name: text} for the benchmark corpus"""
+    corpus = {}
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".txt"):
+            with open(os.path.join(directory, name), encoding="utf-8") as f:
+                corpus[name] = f.read()
+    return corpus
+
+
+def directory_bytes(directory: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(directory) for name in names
+    )
+
+
+def latency_summary(samples: list) -> dict:
+    ms = np.array(samples) * 1000
+    return {
+        "p50": round(float(np.percentile(ms, 50)), 3),
+        "p95": round(float(np.percentile(ms, 95)), 3),
+        "p99": round(float(np.percentile(ms, 99)), 3),
+        "mean": round(float(ms.mean()), 3),
+        "samples": len(samples),
+    }
+
+
+def score_ranking(sources: list, relevant: set, ks: list):
+    """({k: recall@k}, reciprocal rank of the first relevant chunk) for one query"""
+    recall = {k: len(relevant & set(sources[:k])) / len(relevant) for k in ks}
+    reciprocal_rank = next((1.0 / (rank + 1) for rank, source in enumerate(sources) if source in relevant), 0.0)
+    return recall, reciprocal_rank
+
+
+def run_config(args) -> dict:
+    """Worker: index the corpus and run the queries with the environment's configuration"""
+    from backend.services import rag_service as rag_module
+    from backend.services.rag_service import rag_service
+
+    ks = sorted(int(k) for k in args.k.split(","))
+    queries = load_queries(args.queries)
+    corpus = load_corpus(args.corpus)
+
+    if not rag_service.wait_until_loaded() or rag_service.embeddings is None:
+        raise RuntimeError(f"RAG unavailable: {rag_service.status()['error']}")
+
+    # Build
+    started = time.perf_counter()
+    names = list(corpus)
+    chunks = rag_service.split_documents([corpus[n] for n in names], [{"source": n, "page": 0} for n in names])
+    stored = 0
+    for i in range(0, len(chunks), rag_module.RAG_EMBED_BATCH_SIZE):
+        ids = rag_service.add_chunks(chunks[i:i + rag_module.RAG_EMBED_BATCH_SIZE], persist=False)
+        if ids is None:
+            raise RuntimeError("add_chunks failed")
+        stored += len(ids)
+    rag_service.persist()
+    build_seconds = time.perf_counter() - started
+
+    # Quality
+    recall_sums = {k: 0.0 for k in ks}
+    reciprocal_ranks = []
+    misses = []
+    for q in queries:
+        results = rag_service.search(q["query"], k=ks[-1])
+        sources = [r["metadata"].get("source") for r in results]
+        recall, reciprocal_rank = score_ranking(sources, set(q["relevant"]), ks)
+        for k in ks:
+            recall_sums[k] += recall[k]
+        reciprocal_ranks.append(reciprocal_rank)
+        if not reciprocal_rank:
+            misses.append(q["id"])
+
+    # Latency: the cold path retrieve_context takes on a cache miss, then a cache hit
+    for q in queries:
+        rag_service.retrieve_context(q["query"], k=args.context_k)
+    cold, cached = [], []
+    for _ in range(args.repeat):
+        for q in queries:
+            rag_service.embedding_cache.clear()
+            rag_service.result_cache.clear()
+            started = time.perf_counter()
+            rag_service.retrieve_context(q["query"], k=args.context_k)
+            cold.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            rag_service.retrieve_context(q["query"], k=args.context_k)
+            cached.append(time.perf_counter() - started)
+
+    return {
+        "settings": {
+            "backend": rag_module.RAG_BACKEND,
+            "hybrid": rag_module.RAG_HYBRID,
+            "embedding_model": rag_module.EMBEDDING_MODEL,
+            "chunk_size": rag_module.RAG_CHUNK_SIZE,
+            "chunk_overlap": rag_module.RAG_CHUNK_OVERLAP,
+            "candidates": rag_module.RAG_CANDIDATES,
+            "rerank_model": rag_module.RAG_RERANK_MODEL if rag_service.reranker else None,
+            "dedup": rag_module.RAG_DEDUP,
+        },
+        "load_ms": rag_service.load_time_ms,
+        "build": {
+            "seconds": round(build_seconds, 3),
+            "chunks": len(chunks),
+            "stored_chunks": stored,
+            "chunks_per_second": round(len(chunks) / max(build_seconds, 1e-9), 1),
+        },
+        "index_bytes": directory_bytes(rag_module.VECTOR_DB_PATH),
+        "quality": {
+            **{f"recall@{k}": round(recall_sums[k] / len(queries), 4) for k in ks},
+            "mrr": round(sum(reciprocal_ranks) / len(queries), 4),
+            "misses": misses,
+        },
+        "latency_ms": latency_summary(cold),
+        "cached_latency_ms": latency_summary(cached),
+    }
+
+
+def benchmark(config: str, args) -> dict:
+    """Run one backend:mode configuration in a child process against a fresh store"""
+    backend, _, mode = config.partition(":")
+    with tempfile.TemporaryDirectory(prefix="rag-bench-") as tmp:
+        store = os.path.join(tmp, "store")
+        os.makedirs(store)
+        result_path = os.path.join(tmp, "result.json")
+        env = {k: v for k, v in os.environ.items() if k not in STORE_OVERRIDES}
+        env.update({
+            "ENABLE_RAG": "true",
+            "VECTOR_DB_PATH": store,
+            "RAG_BACKEND": backend,
+            "RAG_HYBRID": "false" if mode == "vector" else "true",
+        })
+        command = [
+            sys.executable, os.path.abspath(__file__), "--worker", "--result", result_path,
+            "--k", args.k, "--repeat", str(args.repeat), "--context-k", str(args.context_k),
+            "--corpus", args.corpus, "--queries", args.queries,
+        ]
+        proc = subprocess.run(command, env=env, cwd=REPO_ROOT, capture_output=True, text=True)
+        if proc.returncode != 0 or not os.path.exists(result_path):
+            output = (proc.stderr or proc.stdout).strip().splitlines()
+            return {"error": output[-1] if output else f"exit code {proc.returncode}"}
+        with open(result_path, encoding="utf-8") as f:
+            return json.load(f)
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_ROOT,
+                                    capture_output=True, text=True).stdout.strip())
+        return commit, dirty
+    except Exception:
+        return None, None
+
+
+def print_results(report: dict, out=sys.stdout):
+    ks = report["k"]
+    header = f"{'config':<16}" + "".join(f"{'R@' + str(k):>7}" for k in ks) + \
+        f"{'MRR':>7}{'p50 ms':>9}{'p99 ms':>9}{'build s':>9}{'size KiB':>10}"
+    print(header, file=out)
+    for config, result in report["results"].items():
+        if "error" in result:
+            print(f"{config:<16}❌ {result['error']}", file=out)
+            continue
+        quality = result["quality"]
+        print(
+            f"{config:<16}" + "".join(f"{quality[f'recall@{k}']:>7.3f}" for k in ks) +
+            f"{quality['mrr']:>7.3f}{result['latency_ms']['p50']:>9.2f}{result['latency_ms']['p99']:>9.2f}"
+            f"{result['build']['seconds']:>9.2f}{result['index_bytes'] / 1024:>10.0f}",
+            file=out,
+        )
+
+
+def print_comparison(report: dict, previous: dict, out=sys.stdout):
+    """Per-configuration deltas against an earlier report"""
+    print(f"\nChange vs {previous.get('commit') or 'previous run'}:", file=out)
+    metrics = [(f"recall@{k}", "quality") for k in report["k"]] + [("mrr", "quality")]
+    for config, result in report["results"].items():
+        before = previous.get("results", {}).get(config)
+        if "error" in result or not before or "error" in before:
+            continue
+        changes = [
+            f"{name} {result[section][name] - before[section][name]:+.3f}"
+            for name, section in metrics if name in before.get(section, {})
+        ]
+        for label, now, then in (
+            ("p50", result["latency_ms"]["p50"], before["latency_ms"]["p50"]),
+            ("p99", result["latency_ms"]["p99"], before["latency_ms"]["p99"]),
+            ("build", result["build"]["seconds"], before["build"]["seconds"]),
+            ("size", result["index_bytes"], before["index_bytes"]),
+        ):
+            changes.append(f"{label} {(now - then) / then:+.0%}" if then else f"{label} n/a")
+        print(f"  {config:<16}" + ", ".join(changes), file=out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark RAG retrieval quality and latency")
+    parser.add_argument("--configs", default=DEFAULT_CONFIGS,
+                        help="Comma-separated backend:mode pairs (backend chroma|flat, mode hybrid|vector)")
+    parser.add_argument("--k", default="1,3,5,10", help="Cutoffs for recall@k")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed passes over the query set")
+    parser.add_argument("--context-k", type=int, default=3, help="k passed to retrieve_context when timing")
+    parser.add_argument("--corpus", default=os.path.join(BENCHMARK_DIR, "corpus"), help="Directory of .txt documents")
+    parser.add_argument("--queries", default=os.path.join(BENCHMARK_DIR, "queries.json"), help="Labelled query set")
+    parser.add_argument("--output", default="rag_benchmark.json", help="Where to write the JSON report ('-' for stdout)")
+    parser.add_argument("--compare", help="Earlier JSON report to print deltas against")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        result = run_config(args)
+        with open(args.result, "w", encoding="utf-8") as f:
+            json.dump(result, f)
+        return
+
+    corpus = load_corpus(args.corpus)
+    queries = load_queries(args.queries)
+    commit, dirty = git_commit()
+    configs = [c.strip() for c in args.configs.split(",") if c.strip()]
+    for config in configs:
+        backend, _, mode = config.partition(":")
+        if backend not in ("chroma", "flat") or mode not in ("", "hybrid", "vector"):
+            parser.error(f"unknown configuration {config!r} (expected chroma|flat[:hybrid|vector])")
+
+    # With --output - the report is the only thing on stdout
+    out = sys.stderr if args.output == "-" else sys.stdout
+    print("=" * 60, file=out)
+    print("🔬 RAG retrieval benchmark", file=out)
+    print("=" * 60, file=out)
+    print(f"Corpus: {len(corpus)} documents, {sum(len(t) for t in corpus.values()) / 1024:.0f} KiB; "
+          f"{len(queries)} queries; commit {commit or 'unknown'}{' (dirty)' if dirty else ''}", file=out)
+
+    results = {}
+    for config in configs:
+        print(f"  ⏳ {config}...", file=out)
+        results[config] = benchmark(config, args)
+
+    report = {
+        "benchmark": "rag_retrieval",
+        "commit": commit,
+        "dirty": dirty,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "corpus": {"documents": len(corpus), "bytes": sum(len(t.encode("utf-8")) for t in corpus.values())},
+        "queries": len(queries),
+        "k": sorted(int(k) for k in args.k.split(",")),
+        "repeat": args.repeat,
+        "context_k": args.context_k,
+        "results": results,
+    }
+
+    print(file=out)
+    print_results(report, out)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print_comparison(report, json.load(f), out)
+
+    if args.output == "-":
+        print(json.dumps(report, indent=2))
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n✓ Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
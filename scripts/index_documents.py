@@ -1,51 +1,173 @@
 """
 Script to index toxicology documents for RAG (Retrieval-Augmented Generation)
 
+Indexing is incremental: a manifest (RAG_MANIFEST_PATH) records each file's
+content hash and chunk IDs, so a re-run only embeds new or changed files and
+deletes the chunks of changed or removed ones.
+
+Chunks that are near-duplicates (MinHash/LSH) of already indexed text, such
+as repeated boilerplate or the same paper under two names, are dropped before
+embedding.
+
+Files are parsed and chunked in a process pool while the main process embeds
+finished chunks in fixed-size batches; at most a few files per worker are in
+flight, so memory stays bounded on large corpora.
+
 Usage:
-    python index_documents.py [--directory PATH] [--extensions .txt,.pdf,.md]
+    python index_documents.py [--directory PATH] [--extensions .txt,.pdf,.md] [--full]
+                              [--workers N] [--batch-size 64]
 """
 
 import os
 import sys
+import time
 import argparse
-from pathlib import Path
-
-# Add backend to path
-sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
-
-from langchain.document_loaders import DirectoryLoader, TextLoader, PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from services.rag_service import rag_service
-
-
-def load_documents(directory: str, extensions: list):
-    """Load documents from directory"""
-    documents = []
-    
-    for ext in extensions:
-        if ext == '.txt' or ext == '.md':
-            loader = DirectoryLoader(
-                directory,
-                glob=f"**/*{ext}",
-                loader_cls=TextLoader
-            )
-        elif ext == '.pdf':
-            loader = DirectoryLoader(
-                directory,
-                glob=f"**/*{ext}",
-                loader_cls=PyPDFLoader
-            )
-        else:
-            continue
-        
-        try:
-            docs = loader.load()
-            documents.extend(docs)
-            print(f"✓ Loaded {len(docs)} {ext} files")
-        except Exception as e:
-            print(f"⚠ Error loading {ext} files: {e}")
-    
-    return documents
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+# Add repo root to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from backend.services.rag_service import rag_service, chunk_id, RAG_MANIFEST_PATH, RAG_EMBED_BATCH_SIZE
+from backend.services.index_manifest import IndexManifest
+
+
+def find_files(directory: str, extensions: list) -> dict:
+    """{path relative to directory: absolute path} for every file with an indexed extension"""
+    files = {}
+    for root, _, names in os.walk(directory):
+        for name in sorted(names):
+            if os.path.splitext(name)[1].lower() in extensions:
+                path = os.path.join(root, name)
+                files[os.path.relpath(path, directory)] = path
+    return files
+
+
+def load_file(path: str):
+    """LangChain documents for one file (one per page for PDFs)"""
+    from langchain_community.document_loaders import TextLoader, PyPDFLoader
+
+    if path.lower().endswith('.pdf'):
+        return PyPDFLoader(path).load()
+    return TextLoader(path, autodetect_encoding=True).load()
+
+
+def load_and_split(rel: str, path: str):
+    """Worker: (rel, pages loaded, chunks) for one file"""
+    documents = load_file(path)
+    texts = [doc.page_content for doc in documents]
+    metadatas = [
+        {"source": rel, "page": doc.metadata.get("page", 0)}
+        for doc in documents
+    ]
+    return rel, len(documents), rag_service.split_documents(texts, metadatas)
+
+
+class IndexStats:
+    """Throughput counters for the load -> chunk -> embed pipeline"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.files = 0
+        self.documents = 0
+        self.chunks = 0
+        self.embedded = 0
+        self.duplicates = 0
+        self.batches = 0
+        self.embed_seconds = 0.0
+
+    def report(self):
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        print(f"⏱  {elapsed:.1f}s wall: {self.files} files, {self.documents} docs ({self.documents / elapsed:.1f} docs/s), "
+              f"{self.chunks} chunks ({self.chunks / elapsed:.1f} chunks/s)")
+        print(f"   {self.embedded} embeddings in {self.batches} batches "
+              f"({self.embedded / max(self.embed_seconds, 1e-9):.1f} embeddings/s while embedding, "
+              f"{self.embed_seconds / elapsed:.0%} of wall time)")
+        if self.duplicates:
+            print(f"   {self.duplicates} duplicate chunks skipped before embedding")
+
+
+def index_pending(pending: dict, files: dict, manifest: IndexManifest, workers: int, batch_size: int, stats: IndexStats):
+    """
+    Parse/chunk pending files in a process pool and embed their chunks in batches
+
+    A file is recorded in the manifest once every one of its chunks is stored or
+    dropped as a near-duplicate; files with a failed load or batch are left out so
+    the next run retries them. Returns (indexed, failed) file counts.
+    """
+    remaining = {}     # rel -> chunks not yet through a batch
+    file_ids = {}      # rel -> stored chunk IDs (ordered, as dict keys)
+    file_dups = {}     # rel -> {dropped chunk ID: ID of the chunk kept instead}
+    failed = set()
+    buffer = deque()   # (rel, chunk) waiting for a batch
+    indexed = 0
+
+    def flush(final: bool = False):
+        nonlocal indexed
+        while len(buffer) >= batch_size or (final and buffer):
+            batch = [buffer.popleft() for _ in range(min(batch_size, len(buffer)))]
+            embed_started = time.perf_counter()
+            duplicates = {}
+            stored = rag_service.add_chunks([chunk for _, chunk in batch], persist=False, duplicates=duplicates)
+            stats.embed_seconds += time.perf_counter() - embed_started
+            stats.batches += 1
+            for rel, chunk in batch:
+                if stored is None:
+                    failed.add(rel)
+                else:
+                    # Only stored IDs go in the manifest; a dropped chunk's content lives in the kept one
+                    cid = chunk_id(chunk)
+                    if cid in duplicates:
+                        file_dups[rel][cid] = duplicates[cid]
+                    else:
+                        file_ids[rel][cid] = None
+                remaining[rel] -= 1
+                if remaining[rel] == 0 and rel not in failed:
+                    manifest.record(rel, files[rel], pending[rel], list(file_ids[rel]), file_dups[rel])
+                    indexed += 1
+                    skipped = f", {len(file_dups[rel])} near-duplicates skipped" if file_dups[rel] else ""
+                    print(f"  ✓ {rel}: {len(file_ids[rel])} chunks{skipped}")
+            if stored is not None:
+                stats.embedded += len(stored)
+                stats.duplicates += len(batch) - len(stored)
+
+    queue = deque(pending)
+    # spawn: never fork a process that already holds the embedding model's threads
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        in_flight = set()
+        while queue or in_flight:
+            # Bounded pipeline: a couple of files per worker ahead of the embedder
+            while queue and len(in_flight) < workers * 2:
+                rel = queue.popleft()
+                in_flight.add(pool.submit(load_and_split, rel, files[rel]))
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    rel, pages, chunks = future.result()
+                except Exception as e:
+                    print(f"⚠ Error loading document: {e}")
+                    continue
+                stats.files += 1
+                stats.documents += pages
+                stats.chunks += len(chunks)
+                file_ids[rel], file_dups[rel] = {}, {}
+                if not chunks:
+                    manifest.record(rel, files[rel], pending[rel], [])
+                    indexed += 1
+                    continue
+                remaining[rel] = len(chunks)
+                buffer.extend((rel, chunk) for chunk in chunks)
+            flush()
+        flush(final=True)
+    rag_service.persist()
+
+    for rel in failed:
+        print(f"❌ Failed to index {rel}")
+        # Its old chunks are already gone - make the next run retry it
+        manifest.forget(rel)
+    loaded = set(file_ids)
+    return indexed, len(failed) + sum(1 for rel in pending if rel not in loaded)
 
 
 def main():
@@ -62,19 +184,41 @@ def main():
         default='.txt,.md,.pdf',
         help='Comma-separated file extensions to index'
     )
-    
+    parser.add_argument(
+        '--full',
+        action='store_true',
+        help='Ignore the manifest and re-embed every file'
+    )
+    parser.add_argument(
+        '--manifest',
+        default=RAG_MANIFEST_PATH,
+        help='Manifest of indexed files (content hashes and chunk IDs)'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=os.cpu_count() or 2,
+        help='Processes used to parse and chunk files'
+    )
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=RAG_EMBED_BATCH_SIZE,
+        help='Chunks per embedding call'
+    )
+
     args = parser.parse_args()
-    
+
     directory = args.directory
-    extensions = args.extensions.split(',')
-    
+    extensions = [ext.strip().lower() for ext in args.extensions.split(',')]
+
     print("=" * 60)
     print("🔬 ToxicoGPT Document Indexing")
     print("=" * 60)
     print(f"Directory: {directory}")
     print(f"Extensions: {', '.join(extensions)}")
     print()
-    
+
     # Check if directory exists
     if not os.path.exists(directory):
         print(f"❌ Directory not found: {directory}")
@@ -84,44 +228,71 @@ def main():
         print()
         print("   Add your toxicology documents to this folder and run again.")
         return
-    
-    # Load documents
-    print("📂 Loading documents...")
-    documents = load_documents(directory, extensions)
-    
-    if not documents:
-        print("⚠ No documents found!")
-        print(f"  Add documents to {directory} and run again.")
+
+    started = time.perf_counter()
+    manifest = IndexManifest(args.manifest)
+    files = find_files(directory, extensions)
+
+    # Vector store and BM25 index must hold the same chunks; rebuild both if the lexical one is missing
+    if not args.full and manifest.total_chunks and rag_service.wait_until_loaded() \
+            and rag_service.bm25 is not None and rag_service.bm25.size == 0:
+        print("⚠ BM25 index is missing - rebuilding both indexes")
+        args.full = True
+
+    if args.full:
+        # Treat everything as changed so old chunks are replaced
+        stale = {rel: manifest.chunk_ids(rel) for rel in manifest.files}
+        manifest.files = {}
+        if rag_service.wait_until_loaded() and rag_service.dedup is not None:
+            # Signatures of chunks outside the manifest would mark everything a duplicate
+            rag_service.dedup.clear()
+
+    new, changed, unchanged, removed = manifest.plan(files)
+    print(f"📋 {len(new)} new, {len(changed)} changed, {len(unchanged)} unchanged, {len(removed)} removed")
+
+    # Drop chunks of files that changed or disappeared
+    to_delete = [cid for rel in list(changed) + removed for cid in manifest.chunk_ids(rel)]
+    if args.full:
+        to_delete += [cid for ids in stale.values() for cid in ids]
+    if to_delete:
+        print(f"🗑  Deleting {len(to_delete)} stale chunks...")
+        if not rag_service.delete_chunks(to_delete):
+            print("❌ Failed to delete stale chunks - manifest left unchanged")
+            return
+    for rel in removed:
+        manifest.forget(rel)
+
+    pending = {**new, **changed}
+    if not pending:
+        manifest.save()
+        print("✅ Index is up to date")
+        print(f"   {len(manifest.files)} files, {manifest.total_chunks} chunks ({time.perf_counter() - started:.1f}s)")
+        print()
+        print("=" * 60)
         return
-    
-    print(f"✓ Loaded {len(documents)} total documents")
+
+    # Load, chunk and embed only what changed
+    print(f"📂 Loading {len(pending)} documents ({args.workers} workers, batches of {args.batch_size})...")
+    if not rag_service.wait_until_loaded() or rag_service.embeddings is None:
+        print("❌ RAG is not available - set ENABLE_RAG=true and check the errors above")
+        return
+    stats = IndexStats()
+    indexed, failed = index_pending(pending, files, manifest, args.workers, args.batch_size, stats)
+
+    manifest.save()
+
     print()
-    
-    # Extract text and metadata
-    print("📝 Processing documents...")
-    texts = []
-    metadatas = []
-    
-    for doc in documents:
-        texts.append(doc.page_content)
-        metadatas.append({
-            "source": doc.metadata.get("source", "unknown"),
-            "page": doc.metadata.get("page", 0)
-        })
-    
-    # Index documents
-    print("🔍 Indexing documents...")
-    success = rag_service.add_documents(texts, metadatas)
-    
-    if success:
-        print("✅ Documents indexed successfully!")
+    stats.report()
+    if indexed:
+        print(f"✅ Indexed {indexed} documents ({failed} failed) in {time.perf_counter() - started:.1f}s")
+        print(f"   {len(manifest.files)} files, {manifest.total_chunks} chunks in the index")
         print()
         print("RAG is now enabled. Your chatbot will use these documents")
         print("to provide more accurate toxicology information.")
     else:
         print("❌ Failed to index documents")
         print("   Check the error messages above")
-    
+
     print()
     print("=" * 60)
 
@@ -0,0 +1,190 @@
+"""
+Replay recorded LLM calls as an OpenAI-compatible server for offline load tests
+
+Serves /chat/completions (plain and SSE streaming) and /models from an
+LLM_RECORD_PATH recording. A request whose prompt hash was recorded gets that
+answer back; any other request gets a random recording of the same model. Either
+way the response is delayed by a recorded latency, so the pipeline sees the real
+latency distribution without spending tokens.
+
+Usage:
+    python scripts/llm_replay_server.py --recordings llm_calls.jsonl [--port 8900] [--speed 1.0]
+
+Point the app at it:
+    GROQ_BASE_URL=http://127.0.0.1:8900 DEEPSEEK_BASE_URL=http://127.0.0.1:8900 GROQ_API_KEY=x DEEPSEEK_API_KEY=x
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Add repo root to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from backend.services.llm_recorder import load_recordings, prompt_hash
+
+STREAM_CHUNK_CHARS = 24
+
+
+class RecordingIndex:
+    """Recordings by prompt hash, plus per-model pools for sampling"""
+
+    def __init__(self, path: str):
+        self.by_hash = defaultdict(list)
+        self.by_model = defaultdict(list)
+        self.all = []
+        for entry in load_recordings(path):
+            if entry.get("output") is None:
+                continue
+            self.by_hash[entry["prompt_hash"]].append(entry)
+            self.by_model[entry.get("model")].append(entry)
+            self.all.append(entry)
+        self.counts = {"exact": 0, "sampled": 0}
+        self._lock = threading.Lock()
+
+    def pick(self, model: str, messages: list):
+        """(recording, match kind) for a request"""
+        exact = self.by_hash.get(prompt_hash(model, messages))
+        kind = "exact" if exact else "sampled"
+        entry = random.choice(exact or self.by_model.get(model) or self.all)
+        with self._lock:
+            self.counts[kind] += 1
+        return entry, kind
+
+
+def latency_percentiles(entries):
+    latencies = sorted(e["latency_ms"] for e in entries if e.get("latency_ms") is not None)
+    if not latencies:
+        return {}
+    pick = lambda q: latencies[min(len(latencies) - 1, int(q / 100 * len(latencies)))]
+    return {"p50_ms": pick(50), "p90_ms": pick(90), "p99_ms": pick(99), "max_ms": latencies[-1]}
+
+
+def make_handler(index: RecordingIndex, speed: float):
+    class ReplayHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send_json(self, status: int, body: dict, headers: dict = None):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _write_chunk(self, data: bytes):
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+
+        def do_GET(self):
+            if self.path.rstrip("/").endswith("/models"):
+                models = sorted(m for m in index.by_model if m)
+                self._send_json(200, {"object": "list", "data": [{"id": m, "object": "model"} for m in models]})
+            elif self.path.rstrip("/").endswith("/stats"):
+                self._send_json(200, {"recordings": len(index.all), "served": index.counts,
+                                      "latency": latency_percentiles(index.all)})
+            else:
+                self._send_json(404, {"error": {"message": "not found"}})
+
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send_json(404, {"error": {"message": "not found"}})
+                return
+            started = time.monotonic()
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            model = body.get("model", "")
+            entry, kind = index.pick(model, body.get("messages", []))
+            latency = entry["latency_ms"] / 1000.0 / speed
+            output = entry["output"] or ""
+            usage = entry.get("usage") or {}
+            completion_id = f"replay-{int(time.time() * 1000)}"
+
+            if not body.get("stream"):
+                time.sleep(max(0.0, latency - (time.monotonic() - started)))
+                self._send_json(200, {
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": output},
+                        "finish_reason": entry.get("finish_reason") or "stop"
+                    }],
+                    "usage": usage,
+                }, {"X-Replay-Match": kind})
+                return
+
+            # Stream: first token after the recorded TTFB, the rest spread over the remaining latency
+            ttft = (entry.get("ttft_ms") or entry["latency_ms"] * 0.2) / 1000.0 / speed
+            chunks = [output[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(output), STREAM_CHUNK_CHARS)] or [""]
+            gap = max(0.0, latency - ttft) / len(chunks)
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.send_header("X-Replay-Match", kind)
+            self.end_headers()
+            time.sleep(max(0.0, ttft - (time.monotonic() - started)))
+            try:
+                for text in chunks:
+                    event = {"id": completion_id, "object": "chat.completion.chunk", "model": model,
+                             "choices": [{"index": 0, "delta": {"content": text}, "finish_reason": None}]}
+                    self._write_chunk(f"data: {json.dumps(event)}\n\n".encode())
+                    time.sleep(gap)
+                final = {"id": completion_id, "object": "chat.completion.chunk", "model": model,
+                         "choices": [{"index": 0, "delta": {}, "finish_reason": entry.get("finish_reason") or "stop"}]}
+                self._write_chunk(f"data: {json.dumps(final)}\n\n".encode())
+                if (body.get("stream_options") or {}).get("include_usage"):
+                    self._write_chunk(f"data: {json.dumps({'id': completion_id, 'choices': [], 'usage': usage})}\n\n".encode())
+                self._write_chunk(b"data: [DONE]\n\n")
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        def log_message(self, format, *args):
+            pass
+
+    return ReplayHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded LLM calls with their original timing")
+    parser.add_argument("--recordings", default=os.getenv("LLM_RECORD_PATH", "llm_calls.jsonl"),
+                        help="JSONL written by the LLM recorder")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--speed", type=float, default=1.0, help="Latency divisor (2.0 = twice as fast)")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for sampled responses")
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    index = RecordingIndex(args.recordings)
+    if not index.all:
+        print(f"❌ No usable recordings in {args.recordings}")
+        sys.exit(1)
+
+    print(f"📼 Loaded {len(index.all)} recordings ({len(index.by_hash)} distinct prompts) from {args.recordings}")
+    print(f"⏱️  Recorded latency: {latency_percentiles(index.all)} (speed x{args.speed})")
+    print(f"🚀 Replaying on http://{args.host}:{args.port}")
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(index, args.speed))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n✅ Stopped")
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
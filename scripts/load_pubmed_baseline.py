@@ -0,0 +1,93 @@
+"""
+Bulk-load PubMed baseline / update files into the local PMID store
+
+Usage:
+    python scripts/load_pubmed_baseline.py pubmed25n0001.xml.gz [more files or directories ...] [--batch 5000]
+
+Files come from https://ftp.ncbi.nlm.nih.gov/pubmed/baseline/ (and /updatefiles/);
+plain .xml and gzipped .xml.gz are both accepted. Files are streamed with the
+same iterparse parser efetch responses use, so memory stays flat. Citations an
+update file retracts (<DeleteCitation>) are removed from the store.
+"""
+
+import os
+import sys
+import gzip
+import time
+import argparse
+from xml.etree import ElementTree as ET
+
+# Add repo root to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from backend.services.pubmed_service import parse_pubmed_article
+from backend.services.pmid_store import PMIDStore, PMID_STORE_PATH
+
+
+def iter_files(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.endswith((".xml", ".xml.gz")):
+                    yield os.path.join(path, name)
+        else:
+            yield path
+
+
+def load_file(store: PMIDStore, path: str, batch_size: int):
+    """(articles upserted, citations deleted) for one baseline file"""
+    opener = gzip.open if path.endswith(".gz") else open
+    loaded = deleted = 0
+    batch = []
+    with opener(path, "rb") as f:
+        root = None
+        for event, elem in ET.iterparse(f, events=("start", "end")):
+            if root is None and event == "start":
+                root = elem
+            elif event == "end" and elem.tag == "PubmedArticle":
+                article = parse_pubmed_article(elem)
+                elem.clear()
+                root.clear()
+                if article:
+                    batch.append(article)
+                if len(batch) >= batch_size:
+                    loaded += store.upsert_articles(batch)
+                    batch = []
+            elif event == "end" and elem.tag == "DeleteCitation":
+                deleted += store.delete(p.text for p in elem.findall("PMID") if p.text)
+                elem.clear()
+    loaded += store.upsert_articles(batch)
+    return loaded, deleted
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load PubMed baseline XML into the local PMID store")
+    parser.add_argument("paths", nargs="+", help="Baseline .xml/.xml.gz files or directories of them")
+    parser.add_argument("--store", default=PMID_STORE_PATH, help="SQLite path (default: PMID_STORE_PATH)")
+    parser.add_argument("--batch", type=int, default=5000, help="Articles per insert transaction")
+    args = parser.parse_args()
+
+    store = PMIDStore(path=args.store, enabled=True)
+    print(f"📚 Loading PubMed baseline into {args.store}")
+
+    started = time.perf_counter()
+    total_loaded = total_deleted = 0
+    for path in iter_files(args.paths):
+        file_started = time.perf_counter()
+        try:
+            loaded, deleted = load_file(store, path, args.batch)
+        except Exception as e:
+            print(f"  ❌ {os.path.basename(path)}: {e}")
+            continue
+        elapsed = time.perf_counter() - file_started
+        total_loaded += loaded
+        total_deleted += deleted
+        print(f"  ✓ {os.path.basename(path)}: {loaded} articles, {deleted} deleted ({loaded / max(elapsed, 1e-9):.0f}/s)")
+
+    elapsed = time.perf_counter() - started
+    print(f"\n✅ {total_loaded} articles loaded, {total_deleted} deleted in {elapsed:.1f}s")
+    print(f"   Store: {store.stats()}")
+
+
+if __name__ == "__main__":
+    main()